@@ -0,0 +1,676 @@
+# Simulated Pulsar cluster behind the fake kubectl, docker and pulsar-admin executables of the benchmark.
+# Everything is driven by the scenario file in $BENCH_SCENARIO and kept under $BENCH_ROOT: every launch appends a
+# line to launches.log and the /pulsar directory of each pod is generated once under pods/<pod>.
+
+import gzip
+import json
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from datetime import datetime, timedelta, timezone
+
+FAKEBIN = os.path.dirname(os.path.realpath(__file__))
+ROOT = os.environ.get("BENCH_ROOT", "/tmp/pulsar-diag-bench")
+# /pulsar as a path of its own, not inside names such as /tmp/pulsar-diag
+POD_PATH = re.compile(r"(?<![\w/.-])/pulsar(?![\w.-])")
+LOG_LINE = "{time} [pulsar-io-4-1] INFO  org.apache.pulsar.broker.service.ServerCnx - [/10.0.{ip}:4{n:04d}] Subscribing on topic persistent://public/default/topic-{n}\n"
+# every ERROR_EVERY-th line is an error with a stack trace, every WARN_EVERY-th a warning
+ERROR_LINE = ("{time} [BookKeeperClientWorker-OrderedExecutor-0-0] ERROR org.apache.bookkeeper.client.PendingAddOp - Write of ledger entry to quorum failed: L{n} E{n}\n"
+    "org.apache.bookkeeper.client.BKException$BKNotEnoughBookiesException: Not enough non-faulty bookies available\n"
+    "\tat org.apache.bookkeeper.client.PendingAddOp.submitCallback(PendingAddOp.java:401)\n"
+    "\tat org.apache.bookkeeper.common.util.OrderedExecutor$TimedRunnable.run(OrderedExecutor.java:203)\n")
+WARN_LINE = "{time} [pulsar-web-41-3] WARN  org.apache.pulsar.broker.service.ServerCnx - [/10.0.{ip}:4{n:04d}] Got exception TooLongFrameException on topic persistent://public/default/topic-{n}\n"
+STARTUP_LINES = "[conf/pulsar_env.sh] Applying config PULSAR_MEM = -Xms2g -Xmx2g\nJAVA_HOME=/usr/lib/jvm/java-17-openjdk-amd64\n"
+ERROR_EVERY = 997
+# metrics port of the docker-compose services
+CONTAINER_METRICS_PORTS = {"broker": 8080, "proxy": 8080, "standalone": 8080, "bookie": 8000, "zookeeper": 8000}
+LOG_LINES_PER_SECOND = 20
+WARN_EVERY = 101
+
+#Below defaults are overridden by the scenario file
+DEFAULTS = {
+    "pods": {"broker": 1, "proxy": 1, "bookkeeper": 1, "zookeeper": 1, "bastion": 1},
+    "nodes": 3,
+    "containers": ["pulsar-standalone"],
+    "tenants": 1,
+    "namespaces": 2,
+    "topics": 50,
+    "partitioned": 0,
+    "partitions": 4,
+    "ledgers": 250,
+    "readonly_bookies": [],
+    "kubectl_latency": 0.05,
+    "admin_latency": 0.1,
+    "log_bytes": 256 * 1024,
+    "log_files": 2,
+    "failure_rate": 0.0,
+    "config_drift": [],
+    "seed": 1,
+}
+
+
+def scenario():
+    config = dict(DEFAULTS)
+    path = os.environ.get("BENCH_SCENARIO")
+    if path:
+        with open(path) as f:
+            config.update(json.load(f))
+    # kubectl --context selects the overrides of that cluster, the commands it runs in the pods inherit it
+    context = os.environ.get("BENCH_CONTEXT")
+    if context:
+        config.update(config.get("contexts", {}).get(context, {}))
+        config["context"] = context
+    return config
+
+
+def record_launch(name):
+    # one write with O_APPEND, so concurrent launches never interleave
+    fd = os.open(os.path.join(ROOT, "launches.log"), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, f"{name}\n".encode())
+    finally:
+        os.close(fd)
+
+
+#Below function decides, the same way on every run, whether a call fails
+def fails(config, *key):
+    rate = config["failure_rate"]
+    return rate > 0 and random.Random(f"{config['seed']}:{':'.join(key)}").random() < rate
+
+
+def pod_names(config):
+    return [f"pulsar-{component}-{i}" for component, count in config["pods"].items() for i in range(count)]
+
+
+def log_text(size, start=None):
+    start = start or datetime.now(timezone.utc) - timedelta(hours=2)
+    lines = []
+    total = 0
+    n = 0
+    while total < size:
+        stamp = (start + timedelta(seconds=n)).strftime("%Y-%m-%dT%H:%M:%S,%f")[:-3] + "+0000"
+        template = ERROR_LINE if n % ERROR_EVERY == ERROR_EVERY - 1 else WARN_LINE if n % WARN_EVERY == WARN_EVERY - 1 else LOG_LINE
+        line = template.format(time=stamp, n=n % 10000, ip=f"{n % 250 // 10}.{n % 250}")
+        lines.append(line)
+        total += len(line)
+        n += 1
+    return "".join(lines)[:size]
+
+
+#Below function returns the /pulsar directory of a pod, generating it on first use
+def pod_root(config, pod):
+    root = os.path.join(ROOT, "pods", pod)
+    if os.path.isdir(root):
+        return os.path.join(root, "pulsar")
+    # the fake docker SDK generates pods from threads of one process
+    staging = f"{root}.{os.getpid()}.{threading.get_ident()}"
+    os.makedirs(os.path.join(staging, "pulsar", "logs"))
+    os.makedirs(os.path.join(staging, "pulsar", "conf"))
+    now = datetime.now(timezone.utc)
+    for i in range(config["log_files"]):
+        name = os.path.join(staging, "pulsar", "logs", f"pulsar-{i}.log" if i == 0 else f"pulsar-{i}.log.gz")
+        text = log_text(config["log_bytes"], now - timedelta(hours=2 * (i + 1)))
+        if i == 0:
+            with open(name, "w") as f:
+                f.write(text)
+        else:
+            with gzip.open(name, "wt") as f:
+                f.write(text)
+            stamp = (now - timedelta(hours=2 * i)).timestamp()
+            os.utime(name, (stamp, stamp))
+    for conf in ("broker.conf", "proxy.conf", "bookkeeper.conf", "zookeeper.conf", "client.conf"):
+        with open(os.path.join(staging, "pulsar", "conf", conf), "w") as f:
+            f.write("".join(f"setting{i}=value{i}\n" for i in range(200)))
+            # the pods listed in config_drift run with a changed setting
+            if pod in config["config_drift"]:
+                f.write("setting7=changed\n")
+            if conf == "bookkeeper.conf":
+                f.write("journalDirectory=data/bookkeeper/journal\nledgerDirectories=data/bookkeeper/ledgers\n")
+    if "-bookkeeper-" in pod or "-bookie" in pod:
+        for directory, files in (("journal", 2), ("ledgers", 20)):
+            os.makedirs(os.path.join(staging, "pulsar", "data", "bookkeeper", directory, "current"))
+            for i in range(files):
+                with open(os.path.join(staging, "pulsar", "data", "bookkeeper", directory, "current", f"{i:x}.{'txn' if directory == 'journal' else 'log'}"), "wb") as f:
+                    f.write(b"\0" * 4096)
+    try:
+        os.rename(staging, root)
+    except OSError:
+        # another launch generated it first
+        shutil.rmtree(staging, ignore_errors=True)
+    return os.path.join(root, "pulsar")
+
+
+def pod_json(config, pod, index):
+    component = pod.split("-")[1]
+    return {"kind": "Pod", "metadata": {"name": pod, "namespace": "pulsar", "labels": {"app": "pulsar", "component": component},
+            "ownerReferences": [{"kind": "StatefulSet", "name": pod.rsplit("-", 1)[0]}]},
+        "spec": {"nodeName": f"node-{index % max(1, config['nodes'])}", "containers": [{"name": component, "image": "datastax/lunastreaming:3.1",
+            "ports": [{"containerPort": 8080}], "resources": {"requests": {"cpu": "1", "memory": "2Gi"}}}],
+            "volumes": [{"name": "data", "persistentVolumeClaim": {"claimName": f"data-{pod}"}}]},
+        "status": {"phase": "Running", "hostIP": "10.0.0.1", "podIP": f"10.1.{index // 250}.{index % 250}", "startTime": "2026-01-01T00:00:00Z",
+            "conditions": [{"type": "Ready", "status": "True"}],
+            "containerStatuses": [{"name": component, "ready": True, "restartCount": 0, "state": {"running": {"startedAt": "2026-01-01T00:00:05Z"}}}]}}
+
+
+def inventory(config):
+    items = []
+    for index, pod in enumerate(pod_names(config)):
+        items.append(pod_json(config, pod, index))
+        items.append({"kind": "PersistentVolumeClaim", "metadata": {"name": f"data-{pod}"}, "spec": {"storageClassName": "ssd"},
+            "status": {"phase": "Bound", "capacity": {"storage": "10Gi"}}})
+    for component in config["pods"]:
+        items.append({"kind": "Service", "metadata": {"name": f"pulsar-{component}"}})
+        items.append({"kind": "StatefulSet", "metadata": {"name": f"pulsar-{component}"}})
+    return {"apiVersion": "v1", "kind": "List", "items": items}
+
+
+def topic_stats(topic, config=None):
+    rate = (sum(map(ord, topic)) % 1000) / 10
+    replication = {}
+    for remote in (config or {}).get("replication_clusters", []):
+        if remote != config.get("context"):
+            replication[remote] = {"msgRateIn": 0.0, "msgRateOut": rate, "replicationBacklog": int(rate) % 7 * 100, "replicationDelayInSeconds": int(rate) % 5,
+                "connected": remote not in config.get("disconnected_clusters", [])}
+    return {"replication": replication, "msgRateIn": rate, "msgThroughputIn": rate * 1024, "msgRateOut": rate * 2, "msgThroughputOut": rate * 2048,
+        "averageMsgSize": 1024.0, "storageSize": int(rate * 1e6), "backlogSize": int(rate * 1e3),
+        "publishers": [{"msgRateIn": rate, "producerName": "producer-0"}],
+        "subscriptions": {"sub-0": {"msgRateOut": rate * 2, "msgBacklog": int(rate), "consumers": []}}}
+
+
+def all_topics(config):
+    for t in range(config["tenants"]):
+        for n in range(config["namespaces"]):
+            for topic in range(config["topics"]):
+                yield f"tenant-{t}/ns-{n}", f"persistent://tenant-{t}/ns-{n}/topic-{topic}"
+
+
+#Below function is broker-stats topics of one broker, topics are spread over the brokers by name
+def broker_topics(config, pod):
+    brokers = config["pods"].get("broker", 0)
+    index = int(pod.rsplit("-", 1)[1]) if pod and pod.startswith("pulsar-broker-") else None
+    stats = {}
+    for namespace, topic in all_topics(config):
+        if index is None or zlib.crc32(topic.encode()) % max(1, brokers) == index:
+            stats.setdefault(namespace, {}).setdefault("0x00000000_0xffffffff", {}).setdefault("persistent", {})[topic] = topic_stats(topic, config)
+    return stats
+
+
+def partitioned_topics(config, namespace):
+    return [f"persistent://{namespace}/partitioned-{t}" for t in range(config["partitioned"])]
+
+
+#Below function returns the policies of a namespace the way pulsar-admin namespaces policies prints them, with
+#most fields unset
+def namespace_policies(config, namespace):
+    unset = ["deduplicationEnabled", "autoTopicCreationOverride", "autoSubscriptionCreationOverride", "max_producers_per_topic",
+        "max_consumers_per_topic", "max_consumers_per_subscription", "max_unacked_messages_per_consumer", "compaction_threshold",
+        "offload_threshold", "offload_deletion_lag_ms", "schema_auto_update_compatibility_strategy", "inactive_topic_policies",
+        "subscription_expiration_time_minutes", "delayed_delivery_policies", "offload_policies", "max_topics_per_namespace"]
+    policies = {name: None for name in unset}
+    policies.update({
+        "auth_policies": {"namespace_auth": {}, "destination_auth": {}, "subscription_auth_roles": {}},
+        "replication_clusters": config.get("replication_clusters", ["standalone"]),
+        "bundles": {"boundaries": ["0x00000000", "0x40000000", "0x80000000", "0xc0000000", "0xffffffff"], "numBundles": 4},
+        "backlog_quota_map": {"destination_storage": {"limitSize": 10737418240, "limitTime": -1, "policy": "producer_request_hold"}},
+        "clusterDispatchRate": {}, "topicDispatchRate": {}, "subscriptionDispatchRate": {}, "publishMaxMessageRate": {},
+        "latency_stats_sample_rate": {}, "persistence": {"bookkeeperEnsemble": 2, "bookkeeperWriteQuorum": 2, "bookkeeperAckQuorum": 2,
+            "managedLedgerMaxMarkDeleteRate": 0.0},
+        "message_ttl_in_seconds": 3600 if namespace.endswith("-0") else None,
+        "retention_policies": {"retentionTimeInMinutes": 60, "retentionSizeInMB": 1024},
+        "deleted": False, "encryption_required": False, "subscription_auth_mode": "None", "is_allow_auto_update_schema": True,
+        "schema_validation_enforced": False, "properties": {}, "subscription_types_enabled": [],
+    })
+    return policies
+
+
+def admin_main(argv, pod=None):
+    config = scenario()
+    record_launch("pulsar-admin")
+    time.sleep(config["admin_latency"])
+    if argv[:1] == ["--admin-url"]:
+        argv = argv[2:]
+    command = argv[:2]
+    if fails(config, *argv):
+        print(f"HTTP 500 Internal Server Error (simulated failure of {' '.join(argv)})", file=sys.stderr)
+        return 1
+    if command == ["tenants", "list"]:
+        print("\n".join(f"tenant-{t}" for t in range(config["tenants"])))
+    elif command == ["namespaces", "list"]:
+        print("\n".join(f"{argv[2]}/ns-{n}" for n in range(config["namespaces"])))
+    elif command == ["namespaces", "get-retention"]:
+        print(json.dumps({"retentionTimeInMinutes": 60, "retentionSizeInMB": 1024}, indent=2, separators=(",", " : ")))
+    elif command == ["namespaces", "policies"]:
+        print(json.dumps(namespace_policies(config, argv[2]), indent=2, separators=(",", " : ")))
+    elif command == ["topics", "list"]:
+        topics = [f"persistent://{argv[2]}/topic-{t}" for t in range(config["topics"])]
+        topics += [f"{topic}-partition-{p}" for topic in partitioned_topics(config, argv[2]) for p in range(config["partitions"])]
+        print("\n".join(topics))
+    elif command == ["topics", "list-partitioned-topics"]:
+        print("\n".join(partitioned_topics(config, argv[2])))
+    elif command == ["topics", "get-partitioned-topic-metadata"]:
+        print(json.dumps({"partitions": config["partitions"]}, indent=2, separators=(",", " : ")))
+    elif command == ["topics", "stats"]:
+        print(json.dumps(topic_stats(argv[2], config), indent=2, separators=(",", " : ")))
+    elif command == ["topics", "stats-internal"]:
+        ledger = zlib.crc32(argv[2].encode()) % 100000 * 10
+        print(json.dumps({"entriesAddedCounter": 100, "numberOfEntries": 100, "currentLedgerEntries": 10, "state": "LedgerOpened",
+            "ledgers": [{"ledgerId": ledger, "entries": 90}, {"ledgerId": ledger + 1, "entries": 10}], "cursors": {}}, indent=2, separators=(",", " : ")))
+    elif command == ["broker-stats", "topics"]:
+        print(json.dumps(broker_topics(config, pod), indent=2, separators=(",", " : ")))
+    elif command == ["brokers", "get-runtime-config"]:
+        settings = {f"setting{i}": f"value{i}" for i in range(200)}
+        settings.update({"advertisedAddress": pod or "localhost", "managedLedgerDefaultEnsembleSize": "2"})
+        print(json.dumps(settings, indent=2))
+    elif command == ["brokers", "get-all-dynamic-config"]:
+        print(json.dumps({"loadBalancerEnabled": "true"}, indent=2))
+    elif command == ["brokers", "list"]:
+        print("\n".join(f"pulsar-broker-{b}:8080" for b in range(config["pods"].get("broker", 0))))
+    else:
+        print(f"unsupported pulsar-admin command {' '.join(argv)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+#Below function runs a command "inside" a pod: paths under /pulsar point at the pod's generated directory and
+#pulsar-admin is the fake one
+def exec_in_pod(config, pod, command):
+    if command[0] == "/pulsar/bin/pulsar-admin":
+        return admin_main(command[1:], pod)
+    admin = os.path.join(FAKEBIN, "pulsar-admin")
+    root = pod_root(config, pod)
+    # the fake curl serves the REST API of the pod it runs in
+    os.environ["BENCH_POD"] = pod
+    if command[:2] == ["sh", "-s"]:
+        script = sys.stdin.read().replace("/pulsar/bin/pulsar-admin", admin).replace("/pulsar/bin/bookkeeper", os.path.join(FAKEBIN, "bookkeeper"))
+        return subprocess.run(["sh", "-c", POD_PATH.sub(root, script)]).returncode
+    command = [POD_PATH.sub(root, argument).replace(os.path.join(root, "bin", "pulsar-admin"), admin) for argument in command]
+    return subprocess.run(command).returncode
+
+
+#Below function prints the container log stream: a few startup lines followed by what log4j also writes to the
+#current log file, as with the console and file appenders both enabled
+def log_stream_text(config, pod):
+    with open(os.path.join(pod_root(config, pod), "logs", "pulsar-0.log")) as f:
+        return STARTUP_LINES + f.read()
+
+
+LOG4J_STAMP = re.compile(r"^(\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d),(\d{3})")
+
+
+#Below function returns the lines of the container log stream with the time the runtime stamped them: the time of
+#the log4j line, and for unstamped lines the time of the line before them (the first stamped line for the startup lines)
+def log_stream_lines(config, pod):
+    lines = log_stream_text(config, pod).splitlines(keepends=True)
+    stamps = [LOG4J_STAMP.match(line) for line in lines]
+    current = next((stamp for stamp in stamps if stamp), None)
+    current = f"{current.group(1)}.{current.group(2)}000000Z" if current else datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000000000Z")
+    result = []
+    for line, stamp in zip(lines, stamps):
+        if stamp:
+            current = f"{stamp.group(1)}.{stamp.group(2)}000000Z"
+        result.append((current, line))
+    return result
+
+
+#Below function prints the log stream like kubectl logs: --since keeps the lines of the last seconds
+#(LOG_LINES_PER_SECOND lines per second), --since-time those stamped from that second on, --timestamps and --prefix
+#start each line with its time and source
+def logs_output(config, pod, options, container=None):
+    lines = log_stream_lines(config, pod)
+    if "--since" in options:
+        lines = lines[-int(options["--since"].rstrip("s")) * LOG_LINES_PER_SECOND:]
+    if "--since-time" in options:
+        lines = [(stamp, line) for stamp, line in lines if stamp[:19] >= options["--since-time"][:19]]
+    prefix = f"[pod/{pod}/{container or pod.split('-')[1]}] " if options.get("--prefix") == "true" else ""
+    timestamps = options.get("--timestamps") == "true"
+    text = "".join(prefix + (f"{stamp} " if timestamps else "") + line for stamp, line in lines)
+    if "--limit-bytes" in options:
+        text = text[:int(options["--limit-bytes"])]
+    sys.stdout.write(text)
+    return 0
+
+
+def copy_from_pod(config, pod, source, destination):
+    source = POD_PATH.sub(pod_root(config, pod), source, 1)
+    if os.path.isdir(source):
+        if source.endswith("/"):
+            shutil.copytree(source, destination, dirs_exist_ok=True)
+        else:
+            shutil.copytree(source, os.path.join(destination, os.path.basename(source)), dirs_exist_ok=True)
+    else:
+        shutil.copy(source, destination)
+    return 0
+
+
+#Below function renders the /metrics of a pod: counters that grow with time, a latency summary and a histogram
+def metrics_text(config, pod):
+    now = time.time()
+    seed = zlib.crc32(pod.encode()) % 100
+    lines = ["# TYPE pulsar_in_messages_total counter"]
+    for topic in range(min(config["topics"], 20)):
+        lines.append(f'pulsar_in_messages_total{{cluster="pulsar",topic="persistent://public/default/topic-{topic}"}} {int(now * (topic + seed + 1)) % 10 ** 9}')
+    lines.append("# TYPE pulsar_storage_write_latency summary")
+    for quantile, value in (("0.5", 2.0), ("0.99", 20.0 + seed)):
+        lines.append(f'pulsar_storage_write_latency{{cluster="pulsar",quantile="{quantile}"}} {value}')
+    lines.append("# TYPE pulsar_broker_publish_latency_seconds histogram")
+    count = int(now * 10) % 10 ** 9
+    for bound, share in (("0.001", 0.5), ("0.01", 0.9), ("0.1", 0.99), ("+Inf", 1.0)):
+        lines.append(f'pulsar_broker_publish_latency_seconds_bucket{{le="{bound}"}} {int(count * share)}')
+    lines.append(f"pulsar_broker_publish_latency_seconds_count {count}")
+    return "\n".join(lines) + "\n"
+
+
+#Below function stands in for kubectl port-forward: it serves the generated /metrics of the pod on a local port
+#Below function answers the admin REST API of the standalone broker the way the fake pulsar-admin does, or None
+def admin_rest(config, path):
+    parts = path.strip("/").split("/")[2:]
+    if parts == ["tenants"]:
+        return [f"tenant-{t}" for t in range(config["tenants"])]
+    if parts == ["clusters"]:
+        return ["standalone"]
+    if parts == ["brokers", "configuration", "runtime"]:
+        return {f"setting{i}": f"value{i}" for i in range(200)}
+    if parts == ["brokers", "configuration", "values"]:
+        return {"loadBalancerEnabled": "true"}
+    if parts[:1] == ["namespaces"] and len(parts) == 2:
+        return [f"{parts[1]}/ns-{n}" for n in range(config["namespaces"])]
+    if parts[:1] == ["namespaces"] and len(parts) == 3:
+        return namespace_policies(config, "/".join(parts[1:]))
+    if parts[:1] == ["namespaces"] and parts[3:] == ["retention"]:
+        return {"retentionTimeInMinutes": 60, "retentionSizeInMB": 1024}
+    if parts[:1] == ["non-persistent"]:
+        return []
+    if parts[:1] == ["persistent"] and len(parts) == 3:
+        return [f"persistent://{parts[1]}/{parts[2]}/topic-{t}" for t in range(config["topics"])]
+    if parts[:1] == ["persistent"] and parts[3:] == ["partitioned"]:
+        return partitioned_topics(config, "/".join(parts[1:3]))
+    if parts[:1] == ["persistent"] and len(parts) == 5:
+        topic = f"persistent://{'/'.join(parts[1:4])}"
+        if parts[4] == "stats":
+            return topic_stats(topic, config)
+        if parts[4] == "internalStats":
+            ledger = zlib.crc32(topic.encode()) % 100000 * 10
+            return {"entriesAddedCounter": 100, "numberOfEntries": 100, "ledgers": [{"ledgerId": ledger, "entries": 90}, {"ledgerId": ledger + 1, "entries": 10}], "cursors": {}}
+        if parts[4] == "partitions":
+            return {"partitions": config["partitions"]}
+    return None
+
+
+def port_forward(config, pod, remote_port, address="127.0.0.1", local_port=0):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *arguments):
+            pass
+
+        def do_GET(self):
+            status = 200
+            admin = admin_rest(config, urllib.parse.unquote(self.path.partition("?")[0])) if pod == "pulsar-standalone" or pod.startswith(("pulsar-broker-", "pulsar-proxy-")) else None
+            if self.path.startswith("/metrics"):
+                body = metrics_text(config, pod).encode()
+            elif self.path.startswith("/admin/v2/broker-stats/topics") and (pod.startswith("pulsar-broker-") or pod == "pulsar-standalone"):
+                body = json.dumps(broker_topics(config, pod)).encode()
+            elif admin is not None:
+                body = json.dumps(admin).encode()
+            else:
+                status, body = 404, b"not found"
+            self.send_response(status)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    pod_root(config, pod)
+    server = ThreadingHTTPServer((address, int(local_port)), Handler)
+    print(f"Forwarding from {address}:{server.server_address[1]} -> {remote_port}", flush=True)
+    server.serve_forever()
+    return 0
+
+
+JVM_STACKS = [
+    ("pulsar-io", "RUNNABLE", ["sun.nio.ch.EPoll.wait", "sun.nio.ch.EPollSelectorImpl.doSelect", "io.netty.channel.nio.NioEventLoop.run"]),
+    ("pulsar-io", "RUNNABLE", ["org.apache.pulsar.broker.service.ServerCnx.handleSend", "io.netty.channel.AbstractChannelHandlerContext.invokeChannelRead",
+        "io.netty.channel.nio.NioEventLoop.run"]),
+    ("BookieWriteThreadPool-OrderedExecutor", "RUNNABLE", ["org.apache.bookkeeper.bookie.Journal.logAddEntry", "org.apache.bookkeeper.bookie.Bookie.addEntry",
+        "org.apache.bookkeeper.common.util.OrderedExecutor$TimedRunnable.run"]),
+    ("ForkJoinPool.commonPool-worker", "WAITING", ["jdk.internal.misc.Unsafe.park", "java.util.concurrent.ForkJoinPool.awaitWork", "java.util.concurrent.ForkJoinWorkerThread.run"]),
+]
+
+
+#Below function stands in for jcmd inside a pod: -l lists one JVM, Thread.print prints a dump with a few thread
+#pools and one thread BLOCKED on a lock held by another, GC.class_histogram prints a short histogram
+def jcmd_main(argv):
+    record_launch("jcmd")
+    if argv[:1] == ["-l"]:
+        print("1 org.apache.pulsar.PulsarBrokerStarter --broker-conf /pulsar/conf/broker.conf")
+        print(f"{os.getpid()} jdk.jcmd/sun.tools.jcmd.JCmd -l")
+        return 0
+    if argv[1:2] == ["Thread.print"]:
+        rng = random.Random()
+        print("1:\nFull thread dump OpenJDK 64-Bit Server VM (17.0.8+7 mixed mode, sharing):\n")
+        for i in range(40):
+            pool, state, frames = rng.choice(JVM_STACKS)
+            print(f'"{pool}-{i % 4}-{i}" #{i + 10} prio=5 os_prio=0 cpu=12.5ms elapsed=100.0s tid=0x00007f{i:08x} nid=0x{i:x} runnable\n'
+                f"   java.lang.Thread.State: {state}")
+            for frame in frames:
+                print(f"\tat {frame}(Unknown Source)")
+            print()
+        print('"metadata-store-1" #90 prio=5 os_prio=0 tid=0x00007f0000000090 nid=0x90 waiting for monitor entry\n'
+            "   java.lang.Thread.State: BLOCKED (on object monitor)\n\tat org.apache.pulsar.metadata.impl.ZKMetadataStore.get(ZKMetadataStore.java:120)\n"
+            "\t- waiting to lock <0x00000000c0a1b2c3> (a java.lang.Object)\n\tat java.lang.Thread.run(Thread.java:833)\n")
+        print('"zk-session-watcher-2" #91 prio=5 os_prio=0 tid=0x00007f0000000091 nid=0x91 runnable\n'
+            "   java.lang.Thread.State: RUNNABLE\n\tat org.apache.zookeeper.ClientCnxn.submitRequest(ClientCnxn.java:1500)\n"
+            "\t- locked <0x00000000c0a1b2c3> (a java.lang.Object)\n\tat java.lang.Thread.run(Thread.java:833)\n")
+        print('JNI global refs: 25, weak refs: 0')
+        return 0
+    if argv[1:2] == ["GC.class_histogram"]:
+        print("1:\n num     #instances         #bytes  class name (module)\n-------------------------------------------------------")
+        print("   1:        120000       98304000  [B (java.base@17.0.8)\n   2:         40000        1280000  java.lang.String (java.base@17.0.8)")
+        return 0
+    print(f"unsupported jcmd command {' '.join(argv)}", file=sys.stderr)
+    return 1
+
+
+def bookie_id(pod):
+    return f"{pod}.pulsar-bookkeeper.pulsar.svc.cluster.local:3181"
+
+
+def ledger_metadata(config, ledger_id):
+    bookies = [pod for pod in pod_names(config) if "-bookkeeper-" in pod] or ["pulsar-standalone"]
+    ensemble = [bookie_id(bookies[(ledger_id + i) % len(bookies)]) for i in range(min(2, len(bookies)))]
+    ensembles = {"0": ensemble}
+    # every 7th ledger had a bookie replaced while it was written
+    if ledger_id % 7 == 0 and len(bookies) > 2:
+        ensembles["5000"] = [ensemble[0], bookie_id(bookies[(ledger_id + 2) % len(bookies)])]
+    return {"metadataFormatVersion": 3, "ensembleSize": len(ensemble), "writeQuorumSize": len(ensemble), "ackQuorumSize": len(ensemble),
+        "lastEntryId": 9999 if ledger_id % 10 else -1, "length": 1048576, "digestType": "CRC32C", "state": "CLOSED" if ledger_id % 10 else "OPEN",
+        "ctime": 1700000000000 + ledger_id, "allEnsembles": ensembles}
+
+
+#Below function stands in for curl (and wget) against the REST API of a bookie, for the pod in BENCH_POD
+def curl_main(argv):
+    config = scenario()
+    record_launch("curl")
+    time.sleep(config["kubectl_latency"])
+    url = next((argument for argument in argv if "://" in argument), "")
+    path, _, query = url.split("/", 3)[-1].partition("?")
+    options = dict(option.split("=", 1) for option in query.split("&") if "=" in option)
+    pod = os.environ.get("BENCH_POD", "")
+    path = "/" + path.rstrip("/")
+    if path == "/api/v1/bookie/state":
+        body = {"running": True, "readOnly": pod in config["readonly_bookies"], "shuttingDown": False, "availableForHighPriorityWrites": True}
+    elif path == "/api/v1/bookie/info":
+        body = {"freeSpace": 40 * 1024 ** 3, "totalSpace": 100 * 1024 ** 3}
+    elif path == "/api/v1/autorecovery/status":
+        body = {"enabled": True}
+    elif path == "/api/v1/ledger/metadata":
+        body = {options["ledger_id"]: ledger_metadata(config, int(options["ledger_id"]))}
+    elif path == "/api/v1/ledger/list":
+        start = (int(options.get("page", "1")) - 1) * 100
+        body = {str(ledger_id): ledger_metadata(config, ledger_id) for ledger_id in range(start, min(start + 100, config["ledgers"]))}
+    else:
+        print(f"curl: (22) The requested URL returned error: 404", file=sys.stderr)
+        return 22
+    print(json.dumps(body))
+    return 0
+
+
+#Below function stands in for bin/bookkeeper shell: listbookies, bookieinfo and whoisauditor
+def bookkeeper_main(argv):
+    config = scenario()
+    record_launch("bookkeeper")
+    time.sleep(config["admin_latency"])
+    bookies = [pod for pod in pod_names(config) if "-bookkeeper-" in pod]
+    command = argv[1:2] if argv[:1] == ["shell"] else []
+    print("12:00:00.000 [main] INFO  org.apache.bookkeeper.tools.cli.commands.bookies.ListBookiesCommand - starting")
+    if command == ["listbookies"]:
+        readonly = "-ro" in argv
+        print("ReadOnly Bookies :" if readonly else "ReadWrite Bookies :")
+        for pod in bookies:
+            if (pod in config["readonly_bookies"]) == readonly:
+                print(f"BookieID:{bookie_id(pod)}, IP:10.0.0.{bookies.index(pod) + 10}, Port:3181, Hostname:{pod}")
+    elif command == ["bookieinfo"]:
+        for pod in bookies:
+            print(f"{bookie_id(pod)}:\tFree: 42949672960(40.0GB)\tTotal: 107374182400(100.0GB)")
+        print("Total free: 40.0GB\nTotal capacity: 100.0GB")
+    elif command == ["whoisauditor"]:
+        print(f"Auditor: {bookie_id(bookies[0]) if bookies else '-'}")
+    else:
+        print(f"unsupported bookkeeper command {' '.join(argv)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+#Below function stands in for kubectl get --raw of the pods: the list carries a resource version and a watch from it
+#reports every pod of the scenario's watch_restarts as restarted (MODIFIED) and its watch_deleted pods as DELETED,
+#then stays open until timeoutSeconds like the API server
+def raw_get(config, path):
+    path, _, query = path.partition("?")
+    options = dict(option.split("=", 1) for option in query.split("&") if "=" in option)
+    pods = pod_names(config)
+    if options.get("watch") != "true":
+        print(json.dumps({"kind": "PodList", "apiVersion": "v1", "metadata": {"resourceVersion": "1000"},
+            "items": [pod_json(config, pod, index) for index, pod in enumerate(pods)]}))
+        return 0
+    version = int(options.get("resourceVersion") or 1000)
+    if version == 1000:
+        for name in config.get("watch_restarts", []) + config.get("watch_deleted", []):
+            version += 1
+            pod = pod_json(config, name, pods.index(name))
+            pod["metadata"]["resourceVersion"] = str(version)
+            if name in config.get("watch_restarts", []):
+                pod["status"]["containerStatuses"][0]["restartCount"] = 1
+            print(json.dumps({"type": "DELETED" if name in config.get("watch_deleted", []) else "MODIFIED", "object": pod}), flush=True)
+    time.sleep(int(options.get("timeoutSeconds") or 300))
+    return 0
+
+
+def kubectl_main(argv):
+    arguments = list(argv)
+    if "--context" in arguments:
+        index = arguments.index("--context")
+        os.environ["BENCH_CONTEXT"] = arguments[index + 1]
+        del arguments[index:index + 2]
+    config = scenario()
+    record_launch("kubectl")
+    time.sleep(config["kubectl_latency"])
+    if "-n" in arguments:
+        index = arguments.index("-n")
+        del arguments[index:index + 2]
+    verb = arguments[0]
+    if verb == "get" and arguments[1:2] == ["--raw"]:
+        return raw_get(config, arguments[2])
+    if verb == "get":
+        if "json" in arguments:
+            print(json.dumps(inventory(config)))
+        else:
+            for pod in pod_names(config):
+                print(pod, "Running")
+        return 0
+    if verb == "logs":
+        options = dict(option.split("=", 1) for option in arguments[2:] if "=" in option)
+        if fails(config, "logs", arguments[1]):
+            print(f"error: simulated failure reading the logs of {arguments[1]}", file=sys.stderr)
+            return 1
+        return logs_output(config, arguments[1], options)
+    if verb == "exec":
+        split = arguments.index("--")
+        pod = next(option for option in arguments[1:split] if not option.startswith("-"))
+        if not {"-i", "-it", "--stdin"} & set(arguments[1:split]):
+            # stdin only reaches the pod with -i
+            sys.stdin = open(os.devnull)
+        return exec_in_pod(config, pod, arguments[split + 1:])
+    if verb == "cp":
+        pod, source = arguments[1].split(":", 1)
+        return copy_from_pod(config, pod, source, arguments[2])
+    if verb == "port-forward":
+        address = "127.0.0.1"
+        if "--address" in arguments:
+            index = arguments.index("--address")
+            address = arguments[index + 1]
+            del arguments[index:index + 2]
+        local_port, _, remote_port = arguments[2].rpartition(":")
+        return port_forward(config, arguments[1].split("/", 1)[-1], remote_port, address, local_port or 0)
+    if verb == "describe":
+        pods = pod_names(config)
+        print(json.dumps(pod_json(config, arguments[2], pods.index(arguments[2]) if arguments[2] in pods else 0), indent=2))
+        return 0
+    print(f"error: unsupported kubectl command {' '.join(argv)}", file=sys.stderr)
+    return 1
+
+
+#Below function returns the address of a docker container, a loopback address of its own so that every container
+#can serve /metrics on the port of its component
+def container_address(config, container):
+    return f"127.0.1.{config['containers'].index(container) + 1}"
+
+
+#Below function returns the (container, address, metrics port) of every container of a docker-compose scenario
+def container_metrics_endpoints(config):
+    endpoints = []
+    for container in config["containers"]:
+        service = container.split("-")[1] if container.count("-") >= 2 else container
+        port = CONTAINER_METRICS_PORTS.get(service)
+        if port:
+            endpoints.append((container, container_address(config, container), port))
+    return endpoints
+
+
+def docker_main(argv):
+    config = scenario()
+    record_launch("docker")
+    time.sleep(config["kubectl_latency"])
+    verb = argv[0]
+    if verb == "exec":
+        arguments = [argument for argument in argv[1:] if argument not in ("-i", "-it")]
+        if not {"-i", "-it"} & set(argv[1:]):
+            sys.stdin = open(os.devnull)
+        return exec_in_pod(config, arguments[0], arguments[1:])
+    if verb == "logs":
+        options = {"--timestamps": "true"} if "--timestamps" in argv else {}
+        if "--since" in argv:
+            options["--since-time"] = argv[argv.index("--since") + 1]
+        return logs_output(config, argv[-1], options, argv[-1])
+    if verb == "cp":
+        container, source = argv[1].split(":", 1)
+        return copy_from_pod(config, container, source, argv[2])
+    if verb == "inspect":
+        # only the addresses of the containers, whatever the -f format asks for
+        containers = [argument for index, argument in enumerate(argv[1:], 1) if not argument.startswith("-") and argv[index - 1] != "-f"]
+        unknown = [container for container in containers if container not in config["containers"]]
+        if unknown:
+            print(f"Error: No such object: {unknown[0]}", file=sys.stderr)
+            return 1
+        for container in containers:
+            print(container_address(config, container))
+        return 0
+    print(f"unsupported docker command {' '.join(argv)}", file=sys.stderr)
+    return 1
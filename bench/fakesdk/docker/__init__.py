@@ -0,0 +1,142 @@
+# Stand-in for the docker SDK used by the benchmark, so the docker collection path runs against the simulated
+# cluster. It lists the containers of the scenario in $BENCH_SCENARIO and serves logs, execs and archives the way
+# the daemon would: no docker process is started, execs run the command "inside" the container directly.
+
+import io
+import json
+import os
+import subprocess
+import sys
+import tarfile
+import threading
+import uuid
+from datetime import datetime, timezone
+
+from . import utils
+
+FAKEBIN = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__)))), "fakebin")
+sys.path.insert(0, FAKEBIN)
+import fakecluster  # noqa: E402
+
+# runs a command "inside" a container, as the daemon does for an exec
+EXEC_CODE = ("import json, sys; sys.path.insert(0, sys.argv[1]); import fakecluster; "
+    "sys.exit(fakecluster.exec_in_pod(fakecluster.scenario(), sys.argv[2], json.loads(sys.argv[3])))")
+
+
+class errors:
+    class NotFound(Exception):
+        pass
+
+    class APIError(Exception):
+        pass
+
+
+class Container:
+    def __init__(self, name):
+        self.name = name
+        self.id = name
+        service = name.split("-")[1] if name.count("-") >= 2 else name
+        self.attrs = {"Config": {"Image": "apachepulsar/pulsar:3.1.0", "Labels": {"com.docker.compose.service": service}}, "State": {"Status": "running"}}
+
+    @property
+    def labels(self):
+        return self.attrs["Config"]["Labels"]
+
+    @property
+    def status(self):
+        return self.attrs["State"]["Status"]
+
+    def __repr__(self):
+        return f"<Container: {self.name}>"
+
+
+class ContainerCollection:
+    def names(self):
+        return fakecluster.scenario()["containers"]
+
+    def list(self, all=False):
+        return [Container(name) for name in self.names()]
+
+    def get(self, name):
+        if name not in self.names():
+            raise errors.NotFound(f"No such container: {name}")
+        return Container(name)
+
+
+#Below class is the hijacked connection of an exec: stdin goes to the command, its output comes back as frames
+class ExecSocket:
+    def __init__(self, container, command, stdin):
+        self.process = subprocess.Popen([sys.executable, "-S", "-c", EXEC_CODE, FAKEBIN, container, json.dumps(command)],
+            stdin=subprocess.PIPE if stdin else subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        self._sock = self
+        self.stderr = []
+        self.drain = threading.Thread(target=lambda: self.stderr.append(self.process.stderr.read()), daemon=True)
+        self.drain.start()
+
+    def sendall(self, data):
+        self.process.stdin.write(data)
+
+    def shutdown(self, how):
+        self.process.stdin.close()
+
+    def close(self):
+        pass
+
+    def frames(self):
+        for chunk in iter(lambda: self.process.stdout.read1(65536), b""):
+            yield 1, chunk
+        self.drain.join()
+        if self.stderr and self.stderr[0]:
+            yield 2, self.stderr[0]
+        self.process.wait()
+
+
+class APIClient:
+    def __init__(self):
+        self.execs = {}
+        self.lock = threading.Lock()
+
+    def logs(self, container, stdout=True, stderr=True, stream=False, follow=False, since=None, timestamps=False):
+        lines = fakecluster.log_stream_lines(fakecluster.scenario(), container)
+        if since:
+            since = datetime.fromtimestamp(since, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S")
+            lines = [(stamp, line) for stamp, line in lines if stamp[:19] >= since]
+        data = "".join((f"{stamp} " if timestamps else "") + line for stamp, line in lines).encode()
+        for offset in range(0, len(data), 65536):
+            yield data[offset:offset + 65536]
+
+    def exec_create(self, container, cmd, stdin=False, stdout=True, stderr=True, tty=False):
+        exec_id = uuid.uuid4().hex
+        with self.lock:
+            self.execs[exec_id] = {"container": container, "cmd": cmd, "stdin": stdin}
+        return {"Id": exec_id}
+
+    def exec_start(self, exec_id, socket=False):
+        entry = self.execs[exec_id]
+        entry["socket"] = ExecSocket(entry["container"], entry["cmd"], entry["stdin"])
+        return entry["socket"]
+
+    def exec_inspect(self, exec_id):
+        process = self.execs[exec_id]["socket"].process
+        return {"Running": process.poll() is None, "ExitCode": process.returncode}
+
+    def get_archive(self, container, path, chunk_size=2097152):
+        config = fakecluster.scenario()
+        source = fakecluster.POD_PATH.sub(fakecluster.pod_root(config, container), path, 1)
+        if not os.path.exists(source):
+            raise errors.NotFound(f"Could not find the file {path} in container {container}")
+        buffer = io.BytesIO()
+        with tarfile.open(fileobj=buffer, mode="w") as tar:
+            tar.add(source, arcname=os.path.basename(path.rstrip("/")))
+        data = buffer.getvalue()
+        return (data[offset:offset + chunk_size] for offset in range(0, len(data), chunk_size)), {"name": os.path.basename(path)}
+
+
+class DockerClient:
+    def __init__(self):
+        self.containers = ContainerCollection()
+        self.api = APIClient()
+
+
+def from_env(**kwargs):
+    return DockerClient()
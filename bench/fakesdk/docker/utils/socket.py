@@ -0,0 +1,5 @@
+# frames_iter of the SDK over the fake exec socket
+
+
+def frames_iter(socket, tty):
+    return socket.frames()
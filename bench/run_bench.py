@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+
+# Benchmark of collect_diag.py against a simulated cluster. Each scenario runs the collector with the fake kubectl,
+# docker and pulsar-admin of bench/fakebin first on the PATH and reports the runtime, the process launches, the peak
+# RSS of the collector and the call totals of its run_report.json. Results can be saved and compared against a
+# saved baseline.
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.realpath(__file__))
+COLLECTOR = os.path.join(os.path.dirname(BENCH_DIR), "collect_diag.py")
+sys.path.insert(0, os.path.join(BENCH_DIR, "fakebin"))
+import fakecluster  # noqa: E402
+
+#Below scenarios describe the simulated cluster (see DEFAULTS in fakebin/fakecluster.py) and the collector arguments
+SCENARIOS = {
+    "small": {
+        "description": "5 pods, 100 topics, one pulsar-admin exec per lookup",
+        "cluster": {"pods": {"broker": 1, "proxy": 1, "bookkeeper": 1, "zookeeper": 1, "bastion": 1}, "tenants": 1, "namespaces": 2, "topics": 50},
+        "args": ["-t", "kube"],
+    },
+    "small-bulk": {
+        "description": "5 pods, 100 topics, bulk admin session",
+        "cluster": {"pods": {"broker": 1, "proxy": 1, "bookkeeper": 1, "zookeeper": 1, "bastion": 1}, "tenants": 1, "namespaces": 2, "topics": 50},
+        "args": ["-t", "kube", "--bulk-admin"],
+    },
+    "small-failures": {
+        "description": "5 pods, 100 topics, 10% of the calls fail",
+        "cluster": {"pods": {"broker": 1, "proxy": 1, "bookkeeper": 1, "zookeeper": 1, "bastion": 1}, "tenants": 1, "namespaces": 2, "topics": 50,
+            "failure_rate": 0.1},
+        "args": ["-t", "kube", "--bulk-admin"],
+    },
+    "medium": {
+        "description": "20 pods, 5k topics, 4MB of logs per pod, bulk admin session",
+        "cluster": {"pods": {"broker": 6, "proxy": 3, "bookkeeper": 6, "zookeeper": 3, "bastion": 2}, "tenants": 5, "namespaces": 10, "topics": 100,
+            "admin_latency": 0.02, "log_bytes": 2 * 1024 * 1024},
+        "args": ["-t", "kube", "--bulk-admin", "--bulk-admin-workers", "8"],
+    },
+    "large": {
+        "description": "100 pods, 50k topics, bulk admin session",
+        "cluster": {"pods": {"broker": 30, "proxy": 10, "bookkeeper": 40, "zookeeper": 5, "bastion": 15}, "nodes": 20, "tenants": 10, "namespaces": 50,
+            "topics": 100, "kubectl_latency": 0.02, "admin_latency": 0.0, "log_bytes": 1024 * 1024},
+        "args": ["-t", "kube", "--bulk-admin", "--bulk-admin-workers", "16", "-p", "16"],
+    },
+    "hot-topics": {
+        "description": "3 brokers, 5k topics, stats of the top 10 topics per ranking only",
+        "cluster": {"pods": {"broker": 3, "proxy": 1, "bookkeeper": 1, "zookeeper": 1, "bastion": 1}, "tenants": 5, "namespaces": 10, "topics": 100},
+        "args": ["-t", "kube", "--top-topics", "10"],
+    },
+    "metrics": {
+        "description": "5 pods, metrics of 4 pods sampled every 2s for 10s next to the other collectors",
+        "cluster": {"pods": {"broker": 1, "proxy": 1, "bookkeeper": 1, "zookeeper": 1, "bastion": 1}, "tenants": 1, "namespaces": 2, "topics": 50},
+        "args": ["-t", "kube", "--bulk-admin", "--metrics-duration", "10s", "--metrics-interval", "2s"],
+    },
+    "jvm": {
+        "description": "5 pods, 5 thread dumps 1s apart of the broker and bookie JVMs next to the other collectors",
+        "cluster": {"pods": {"broker": 1, "proxy": 1, "bookkeeper": 1, "zookeeper": 1, "bastion": 1}, "tenants": 1, "namespaces": 2, "topics": 50},
+        "args": ["-t", "kube", "--bulk-admin", "--jvm-profile", "--jvm-samples", "5", "--jvm-interval", "1s", "--jvm-gc"],
+    },
+    "dedup": {
+        "description": "5 pods, 2MB of logs per pod also in the kubectl logs stream, copied once with --dedup-logs",
+        "cluster": {"pods": {"broker": 1, "proxy": 1, "bookkeeper": 1, "zookeeper": 1, "bastion": 1}, "tenants": 1, "namespaces": 2, "topics": 50,
+            "log_bytes": 2 * 1024 * 1024},
+        "args": ["-t", "kube", "--bulk-admin", "--dedup-logs"],
+    },
+    "configs": {
+        "description": "25 pods, the config of every pod, one broker and one bookie drifted",
+        "cluster": {"pods": {"broker": 6, "proxy": 3, "bookkeeper": 12, "zookeeper": 3, "bastion": 1}, "tenants": 1, "namespaces": 2, "topics": 50,
+            "config_drift": ["pulsar-broker-2", "pulsar-bookkeeper-5"]},
+        "args": ["-t", "kube", "--bulk-admin", "--config-all-pods"],
+    },
+    "bookies": {
+        "description": "4 bookies (one read-only) probed in parallel, metadata of the ledgers of the top 5 hot topics per ranking",
+        "cluster": {"pods": {"broker": 2, "proxy": 1, "bookkeeper": 4, "zookeeper": 1, "bastion": 1}, "tenants": 1, "namespaces": 2, "topics": 50,
+            "readonly_bookies": ["pulsar-bookkeeper-3"]},
+        "args": ["-t", "kube", "--top-topics", "5", "--bookie-diag", "--bookie-ledger-qps", "50"],
+    },
+    "watch": {
+        "description": "7 pods watched for 20s, a snapshot every 3s, a broker restarted and a bastion deleted, one triggered dump",
+        "cluster": {"pods": {"broker": 2, "proxy": 1, "bookkeeper": 2, "zookeeper": 1, "bastion": 1}, "tenants": 1, "namespaces": 2, "topics": 50,
+            "admin_latency": 0.01, "watch_restarts": ["pulsar-broker-1"], "watch_deleted": ["pulsar-bastion-0"]},
+        "args": ["-t", "kube", "--bulk-admin", "--watch", "3s", "--watch-for", "20s", "--watch-max-bytes", "100K",
+            "--watch-trigger", "pulsar_storage_write_latency>25"],
+    },
+    "multi-cluster": {
+        "description": "2 geo-replicated clusters x 2 namespaces collected by 4 worker processes into one bundle with a cross-cluster index",
+        "cluster": {"pods": {"broker": 2, "proxy": 1, "bookkeeper": 2, "zookeeper": 1, "bastion": 1}, "tenants": 2, "namespaces": 2, "topics": 10,
+            "admin_latency": 0.0, "replication_clusters": ["east", "west"], "contexts": {"east": {"disconnected_clusters": ["west"]}, "west": {"admin_latency": 0.05}}},
+        "args": ["-t", "kube", "--bulk-admin", "--context", "east,west", "-n", "pulsar,pulsar-geo", "--bundle"],
+    },
+    "topology": {
+        "description": "4 namespaces with 500 topics and 40 partitioned topics, topology snapshot through one exec session reused by the bulk walk",
+        "cluster": {"pods": {"broker": 1, "proxy": 1, "bookkeeper": 1, "zookeeper": 1, "bastion": 1}, "tenants": 2, "namespaces": 2, "topics": 100,
+            "partitioned": 10, "partitions": 4, "admin_latency": 0.02},
+        "args": ["-t", "kube", "--bulk-admin", "--topology"],
+    },
+    "standalone": {
+        "description": "a standalone broker on this machine, 8MB of logs of which the rotated ones outside the last hour are skipped, admin API over REST",
+        "standalone": True,
+        "cluster": {"tenants": 1, "namespaces": 2, "topics": 50, "log_bytes": 4 * 1024 * 1024, "log_files": 3},
+        "args": ["-t", "standalone", "--pulsar-home", "{pulsar_home}", "--admin-url", "{admin_url}", "--since", "3h", "--topology"],
+    },
+    "docker": {
+        "description": "one standalone container, 100 topics",
+        "cluster": {"containers": ["pulsar-standalone"], "tenants": 1, "namespaces": 2, "topics": 50},
+        "args": ["-t", "docker"],
+    },
+    "docker-compose": {
+        "description": "6 containers of a docker-compose cluster collected in parallel through the SDK",
+        "cluster": {"containers": ["pulsar-zookeeper-1", "pulsar-bookie-1", "pulsar-bookie-2", "pulsar-broker-1", "pulsar-broker-2", "pulsar-proxy-1"],
+            "tenants": 1, "namespaces": 2, "topics": 50, "log_bytes": 1024 * 1024},
+        "args": ["-t", "docker"],
+    },
+    "docker-compose-metrics": {
+        "description": "6 containers of a docker-compose cluster, metrics of 6 containers at their addresses sampled every 2s for 6s",
+        "container_metrics": True,
+        "cluster": {"containers": ["pulsar-zookeeper-1", "pulsar-bookie-1", "pulsar-bookie-2", "pulsar-broker-1", "pulsar-broker-2", "pulsar-proxy-1"],
+            "tenants": 1, "namespaces": 2, "topics": 50},
+        "args": ["-t", "docker", "--metrics-duration", "6s", "--metrics-interval", "2s"],
+    },
+}
+DEFAULT_SCENARIOS = ["small", "small-bulk", "docker"]
+
+
+#Below function runs the collector once against a scenario and returns its measurements
+def run_scenario(name, scenario, extra_args, keep):
+    root = tempfile.mkdtemp(prefix=f"pulsar-diag-bench-{name}-")
+    scenario_path = os.path.join(root, "scenario.json")
+    with open(scenario_path, "w") as f:
+        json.dump(scenario["cluster"], f)
+    env = dict(os.environ)
+    env["PATH"] = os.path.join(BENCH_DIR, "fakebin") + os.pathsep + env.get("PATH", "")
+    env["PYTHONPATH"] = os.path.join(BENCH_DIR, "fakesdk") + os.pathsep + env.get("PYTHONPATH", "")
+    env["BENCH_ROOT"] = root
+    env["BENCH_SCENARIO"] = scenario_path
+    arguments = scenario["args"]
+    servers = []
+    if scenario.get("standalone"):
+        # a standalone broker on this machine: the pulsar directory of a fake pod and its admin API on a local port
+        server = subprocess.Popen([os.path.join(BENCH_DIR, "fakebin", "kubectl"), "port-forward", "pod/pulsar-standalone", ":8080"], env=env,
+            stdout=subprocess.PIPE, text=True)
+        servers.append(server)
+        port = server.stdout.readline().split(":")[1].split()[0]
+        arguments = [argument.format(admin_url=f"http://127.0.0.1:{port}", pulsar_home=os.path.join(root, "pods", "pulsar-standalone", "pulsar"))
+            for argument in arguments]
+    if scenario.get("container_metrics"):
+        # every container serves /metrics on the port of its component at the address docker inspect gives it
+        for container, address, port in fakecluster.container_metrics_endpoints(scenario["cluster"]):
+            servers.append(subprocess.Popen([os.path.join(BENCH_DIR, "fakebin", "kubectl"), "port-forward", "--address", address, f"pod/{container}",
+                f"{port}:{port}"], env=env, stdout=subprocess.PIPE, text=True))
+        for server in servers:
+            server.stdout.readline()
+    command = [sys.executable, COLLECTOR] + arguments + ["-o", os.path.join(root, "out")] + extra_args
+    start = time.monotonic()
+    with open(os.path.join(root, "collector.log"), "w") as log:
+        process = subprocess.Popen(command, env=env, stdout=log, stderr=subprocess.STDOUT)
+        _, status, usage = os.wait4(process.pid, 0)
+    seconds = time.monotonic() - start
+    for server in servers:
+        server.terminate()
+        server.wait()
+    launches = {}
+    if os.path.exists(os.path.join(root, "launches.log")):
+        with open(os.path.join(root, "launches.log")) as f:
+            for line in f:
+                launches[line.strip()] = launches.get(line.strip(), 0) + 1
+    report = {}
+    report_path = os.path.join(root, "out", "pulsar_diag", "run_report.json")
+    if os.path.exists(report_path):
+        with open(report_path) as f:
+            report = json.load(f)
+    with open(os.path.join(root, "collector.log")) as f:
+        errors = sum(1 for line in f if " - ERROR - " in line)
+    result = {
+        "scenario": name,
+        "exit_code": os.waitstatus_to_exitcode(status),
+        "seconds": round(seconds, 2),
+        "launches": sum(launches.values()),
+        "launches_by_tool": launches,
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_mb": round(usage.ru_maxrss / 1024, 1),
+        "calls": report.get("totals", {}).get("calls"),
+        "forks": report.get("totals", {}).get("forks"),
+        "bytes": report.get("totals", {}).get("bytes"),
+        "failed_calls": report.get("totals", {}).get("failed"),
+        "error_lines": errors,
+        "collectors": {name: collector.get("wall_seconds") for name, collector in report.get("collectors", {}).items() if "wall_seconds" in collector},
+    }
+    if keep:
+        result["directory"] = root
+    else:
+        shutil.rmtree(root, ignore_errors=True)
+    return result
+
+
+def print_results(results):
+    print(f"{'scenario':<16}{'seconds':>9}{'launches':>10}{'rss MB':>8}{'calls':>8}{'errors':>8}{'MB out':>8}  slowest collector")
+    for result in results:
+        slowest = max(result["collectors"].items(), key=lambda item: item[1], default=("-", 0))
+        mb = (result["bytes"] or 0) / 1e6
+        print(f"{result['scenario']:<16}{result['seconds']:>9.2f}{result['launches']:>10}{result['peak_rss_mb']:>8.1f}{result['calls'] or 0:>8}"
+            f"{result['error_lines']:>8}{mb:>8.1f}  {slowest[0]} {slowest[1]:.1f}s" + ("" if result["exit_code"] == 0 else f"  (exit code {result['exit_code']})"))
+
+
+#Below function compares results with a saved baseline and returns the regressions above the tolerance
+def compare(results, baseline, tolerance):
+    previous = {result["scenario"]: result for result in baseline}
+    regressions = []
+    for result in results:
+        before = previous.get(result["scenario"])
+        if not before:
+            continue
+        for metric in ("seconds", "launches", "peak_rss_mb"):
+            if before[metric] and result[metric] > before[metric] * (1 + tolerance):
+                regressions.append(f"{result['scenario']}: {metric} {before[metric]} -> {result[metric]} (+{(result[metric] / before[metric] - 1) * 100:.0f}%)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark collect_diag.py against a simulated cluster")
+    parser.add_argument("scenarios", nargs="*", help=f"Scenarios to run (default: {' '.join(DEFAULT_SCENARIOS)}), 'all' for every scenario")
+    parser.add_argument("--list", action="store_true", help="List the scenarios")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per scenario, the fastest is kept (default: 1)")
+    parser.add_argument("--save", help="Save the results to this JSON file")
+    parser.add_argument("--compare", help="Compare with results saved by --save and exit 1 on a regression")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed growth of a metric over the baseline (default: 0.2)")
+    parser.add_argument("--keep", action="store_true", help="Keep the scenario directories (collector output and log)")
+    parser.add_argument("--collector-args", default="", help="Extra arguments for the collector, e.g. --collector-args='--bundle --profile'")
+    args = parser.parse_args()
+
+    if args.list:
+        for name, scenario in SCENARIOS.items():
+            print(f"{name:<16}{scenario['description']}  [{' '.join(scenario['args'])}]")
+        return 0
+    names = list(SCENARIOS) if args.scenarios == ["all"] else args.scenarios or DEFAULT_SCENARIOS
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+    results = []
+    for name in names:
+        runs = [run_scenario(name, SCENARIOS[name], args.collector_args.split(), args.keep) for _ in range(max(1, args.repeat))]
+        results.append(min(runs, key=lambda result: result["seconds"]))
+    print_results(results)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+    return 0 if all(result["exit_code"] == 0 for result in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,24 +1,98 @@
 #!/usr/bin/env python3
 
 import argparse
+import array
+import contextlib
+import copy
+import errno
+import gzip
+import hashlib
+import heapq
+import http.client
+import io
+import json
 import os
+import queue
+import re
+import shlex
+import shutil
+import signal
+import socket
+import ssl
 import subprocess
 import sys
+import tarfile
+import tempfile
 import logging
-import docker
+import math
+import multiprocessing
+import threading
+import time
+import urllib.parse
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
 
 
 
 def usage():
     print("""
     Usage: diag.py -t <type> [options] [path]
+           diag.py analyze <pulsar_diag directory or bundle tar> [-w workers] [--top N] [--rebuild]
     ----- Required --------
       -t type - valid choices are "docker", "kube", "standalone"
     ----- Options --------
-      -n namespace of the pulsar cluster (default: pulsar)
+      -n namespace of the pulsar cluster, or a comma separated list of namespaces (default: pulsar)
+      --context - kube context to collect from, a comma separated list or repeated (default: the current context). Several contexts or namespaces are collected at once, each in a worker process of its own with the full -p, --max-execs and other limits, into clusters/<context>/<namespace>; cluster_index.txt, cluster_index.json and cluster_topics.jsonl.gz index the tenants and topics of all of them with their replication stats, and --bundle merges their bundles into one pulsar_diag_bundle.tar
       -o output_dir - where to put resulting file (default: current directory)
-      -c container - container name to collect logs from (applies only for docker type)
+      -c container - container name to collect logs from (applies only for docker type, default: the pulsar-standalone container, or every running Pulsar container of a multi-node setup)
+      --pulsar-home - Pulsar directory of the standalone type (default: $PULSAR_HOME or /pulsar). Its logs (and /var/log/pulsar) and conf go straight into pulsar_diag_bundle.tar, compressed rotated logs and conf files copied as is by the kernel (copy_file_range/sendfile), files outside the --since window skipped; the admin walk, --topology, --top-topics and --metrics-duration query the broker at --admin-url (default: http://localhost:8080) over pooled connections
       -l loglevel - log level (default: INFO) level can be DEBUG, INFO, WARNING, ERROR, CRITICAL
+      -p parallel - number of pods to collect from concurrently (default: 8)
+      --component-parallel - max concurrent pods per component, a number or e.g. broker=4,bookie=2 (default: 4)
+      --pod-timeout - seconds allowed per pod before its collection is abandoned, 0 to disable (default: 900)
+      --since - only collect logs newer than this duration, e.g. 30m or 1h (rotated files outside the window are skipped)
+      --since-time - only collect logs after this RFC3339 time, e.g. 2024-05-01T10:00:00Z
+      --max-bytes-per-pod - cap for each of the container log stream (its newest bytes, all containers of the pod together) and the copied log files (the newest first) of a pod, e.g. 50M
+      --incremental - only fetch log bytes and files that changed since the previous run into the same output directory (tracked in diag_manifest.json)
+      --resume - continue an interrupted run in the same output directory, skipping the units it finished (tracked in diag_journal.jsonl)
+      --report-format - tenants report as text, jsonl (tenants_namespaces_topics.jsonl, one record per topic with parsed stats) or both (default: text)
+      --parquet - also export the topic stats to topics.parquet (needs pyarrow)
+      --max-execs - max concurrent exec and cp commands across all collectors, which now run concurrently, 0 for no limit (default: 16)
+      --max-streams-per-node - max concurrent logs, exec and cp streams to the pods of one node, 0 for no limit (default: 6)
+      --kube-qps - max kube commands started per second, 0 for no limit (default: 20)
+      --bulk-admin - fetch tenants, namespaces and topic stats through one exec session instead of one exec per lookup
+      --bulk-admin-workers - concurrent pulsar-admin calls inside the admin pod in bulk mode (default: 4)
+      --top-topics - only fetch stats and internal stats of the top N topics of each ranking, ranked from one broker-stats call per broker in parallel (written to hot_topics.txt)
+      --top-topics-by - comma separated rankings of --top-topics: rate, throughput, backlog, subscriptions (default: all)
+      --topology - also snapshot the namespace policies (retention, TTL, backlog quotas, persistence, replication) and the topic and partition layout of every namespace to topology.json and topology.txt, through one exec session or concurrent admin REST calls; the tenants walk reuses its lookups
+      --admin-url - fetch tenants info from the admin REST API at this url (e.g. http://localhost:8080), or "port-forward" to forward to a broker pod
+      --admin-token - token for the admin REST API, inline or as file:/path
+      --admin-concurrency - concurrent admin REST requests (default: 16)
+      --kube-backend - "kubectl" (default) or "api" to run lists, logs and execs in-process through the Kubernetes API with pooled connections (needs 'pip install kubernetes')
+      --docker-backend - "sdk" (default) to stream logs, execs and copies of the containers in-process through the docker SDK over pooled connections, or "cli" to run the docker CLI per call
+      --kubeconfig - kubeconfig for the api backend (default: $KUBECONFIG, ~/.kube/config or the in-cluster service account)
+      --no-inventory - query kubectl per pod instead of fetching pods, events, services, statefulsets and PVCs in one list call (saved under inventory/)
+      --profile - also write run_trace.json, a trace of every command of the run for chrome://tracing or Perfetto (run_report.json with the time, bytes and exit status per collector, pod and command is always written)
+      --jvm-profile - take repeated thread dumps (jcmd Thread.print) of the JVMs in parallel across pods and aggregate them per component into collapsed stacks for flame graphs (jvm/<component>.collapsed), with thread states, hot frames and lock contention in jvm/summary.txt
+      --jvm-components - comma separated components to profile: broker, proxy, bookie, zookeeper (default: broker,bookie)
+      --jvm-samples - thread dumps per pod (default: 10)
+      --jvm-interval - interval between thread dumps (default: 2s)
+      --jvm-gc - also capture the class histogram (GC.class_histogram) and the GC log tail of the profiled JVMs
+      --bookie-diag - probe every bookie in parallel: journal and ledger directory usage and disk latency (from /proc/diskstats), bookie state, and from the first bookie listbookies, bookieinfo, the auditor and the autorecovery state (records per bookie in bookies/<pod>.json, table in bookies/summary.txt)
+      --bookie-ledgers - max ledgers whose metadata is fetched into bookies/ledgers.jsonl: the newest ledgers of the hot topics with --top-topics, else the first pages of the ledger list, 0 to skip (default: 100)
+      --bookie-ledger-qps - max ledger metadata requests per second to the bookie (default: 10)
+      --metrics-duration - sample the /metrics of every broker, bookie, proxy and zookeeper pod (or docker container) in parallel for this long, e.g. 5m (samples in metrics/samples.json.gz, rates and latency percentiles per pod in metrics/summary.txt)
+      --metrics-interval - interval between metric samples (default: 15s)
+      --metrics-url - scrape this metrics url instead of the pods, as name=url, can be repeated
+      --config-all-pods - collect the conf files of every pod (and the runtime and dynamic config of the brokers) in parallel instead of those of a single pod. Each distinct file is stored once under conf/distinct/<file>.<hash>, with the pod to hash map in conf/pod_config_map.json and the keys that differ between the pods of a component in conf/config_drift.txt
+      --dedup-logs - do not copy the regions of /pulsar/logs files that are already in the kubectl logs stream of a pod: they are found by hashing segments of the stream against the files inside the pod and replaced by a reference line (listed in dedup.json next to the pod logs). Ignored with --since, --since-time, --max-bytes-per-pod and --incremental
+      --watch - keep running and take a snapshot at this interval, e.g. 1m (kube only): the log tail of every pod since the previous snapshot, one metrics scrape of every broker, bookie, proxy and zookeeper pod and the hot topics ranked from the broker stats, under watch/snapshots/<time>. Pods are tracked through a watch of the API server and port-forwards stay open between snapshots. A full collection goes to watch/dumps/<time> (with the snapshots before it) when a --watch-trigger is crossed, at most every 15 minutes, or on SIGUSR1
+      --watch-retention - age after which snapshots are removed (default: 24h)
+      --watch-max-bytes - disk space of the snapshots, the oldest are removed beyond it (default: 1G)
+      --watch-trigger - full collection when a metric of a snapshot crosses this threshold, e.g. pulsar_storage_write_latency>100 (any series of the metric on any pod), can be repeated
+      --watch-for - stop watching after this long (default: until interrupted)
+      --bundle - stream logs and configs compressed into a single pulsar_diag_bundle.tar instead of copying directory trees
+      --bundle-compression - in-pod compression for bundle entries, gzip or zstd (zstd needs zstd in the pods) (default: gzip)
     """)
 
 def check_type(type_arg):
@@ -40,29 +114,35 @@ def check_output_dir(output_dir):
     return output_dir
 
 #Below function sets up the logging level and format
-def setup_logging(loglevel):
+def setup_logging(loglevel, target=None):
     # Set the logging level based on the loglevel argument
     level = logging.DEBUG if loglevel == "DEBUG" else logging.INFO
     
-    # Configure logging with the appropriate level and formatter
+    # Configure logging with the appropriate level and formatter, the lines of a target of a multi-target run
+    # carry its context and namespace
     logging.basicConfig(
         level=level,
-        format='%(asctime)s - %(levelname)s - %(name)s  - %(message)s'  
+        format='%(asctime)s - %(levelname)s - ' + (f'[{target}] ' if target else '') + '%(name)s  - %(message)s'  
     )
     logging.basicConfig(level=loglevel, format=format)
 
 #Below class is used to fetch the pods information from the kubernetes cluster
 class kubernetesPods:
-    def __init__(self, namespace):
+    def __init__(self, namespace, inventory=None):
         self.namespace = namespace
+        self.inventory = inventory
         self.pods = []
         self.pod_info = []
         self.pod_status = []
         self.pod_name = []
     
     def get_pods(self):
+        if self.inventory is not None:
+            self.pods = self.inventory.pod_rows()
+            return self.pods
         try:
-            pods_info = subprocess.getoutput(f"kubectl get pods -n {self.namespace} --no-headers -o custom-columns=NAME:.metadata.name,STATUS:.status.phase").splitlines()
+            pods_info = run_command(["kubectl", "get", "pods", "-n", self.namespace, "--no-headers", "-o", "custom-columns=NAME:.metadata.name,STATUS:.status.phase"],
+                stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True).stdout.splitlines()
             self.pods = [line.split() for line in pods_info]
             return self.pods
             logger.debug(f"Pods information: {self.pods}")
@@ -79,26 +159,1979 @@ class kubernetesPods:
         return[self.pod_status.append(pod[1]) for pod in self.pods]
         logger.debug(f"Pods information: {self.pod_status}")
 
-#Below function collects logs from the docker containers and kube pods
-def collect_logs(args, broker_pods=None, proxy_pods=None, bookie_pods=None, zookeeper_pods=None, bastion_pods=None, container_name=None, container_id=None):
+INVENTORY_KINDS = {"Pod": "pods", "Event": "events", "Service": "services", "StatefulSet": "statefulsets", "PersistentVolumeClaim": "pvcs"}
+
+#Below class is the namespace inventory: pods, events, services, statefulsets and PVCs fetched in one kubectl list
+#call and kept in memory, so collectors look pods up here instead of asking the API server again per pod
+class KubeInventory:
+    def __init__(self, namespace):
+        self.namespace = namespace
+        self.items = {kind: [] for kind in INVENTORY_KINDS.values()}
+
+    def fetch(self, backend=None):
+        logger = logging.getLogger("KubeInventory")
+        if backend is not None:
+            for kind in self.items:
+                self.items[kind] = backend.list_json(kind)
+        else:
+            result = run_command(["kubectl", "-n", self.namespace, "get", "pods,events,services,statefulsets,persistentvolumeclaims", "-o", "json"],
+                capture_output=True, text=True, check=True)
+            for item in json.loads(result.stdout).get("items", []):
+                kind = INVENTORY_KINDS.get(item.get("kind"))
+                if kind:
+                    self.items[kind].append(item)
+        logger.info(f"Fetched the inventory of namespace {self.namespace}: " + ", ".join(f"{len(items)} {kind}" for kind, items in self.items.items()))
+        return self
+
+    def pod_rows(self):
+        return [[pod["metadata"]["name"], pod.get("status", {}).get("phase", "Unknown")] for pod in self.items["pods"]]
+
+    def pod_nodes(self):
+        return {pod["metadata"]["name"]: pod.get("spec", {}).get("nodeName") for pod in self.items["pods"]}
+
+    def pod(self, name):
+        return next((pod for pod in self.items["pods"] if pod["metadata"]["name"] == name), None)
+
+    def pvc(self, name):
+        return next((pvc for pvc in self.items["pvcs"] if pvc["metadata"]["name"] == name), None)
+
+    def events_for(self, kind, name):
+        events = [event for event in self.items["events"]
+            if event.get("involvedObject", {}).get("kind") == kind and event.get("involvedObject", {}).get("name") == name]
+        return sorted(events, key=event_time)
+
+    def save(self, output_dir):
+        os.makedirs(output_dir, exist_ok=True)
+        for kind, items in self.items.items():
+            with open(os.path.join(output_dir, f"{kind}.json"), "w") as f:
+                json.dump({"apiVersion": "v1", "kind": "List", "items": items}, f, indent=2)
+
+# Values of the Helm chart's component label for each component, the Apache chart calls the bookies "bookie"
+COMPONENT_LABELS = {"broker": ("broker",), "proxy": ("proxy",), "bookkeeper": ("bookkeeper", "bookie"), "zookeeper": ("zookeeper",), "bastion": ("bastion",)}
+
+#Below function picks the running pods of a component by the Helm chart's component label, pods without the
+#label (or runs without an inventory) are matched by name as before
+def component_pods(args, pods, component):
+    labels = {}
+    if args.inventory is not None:
+        labels = {pod["metadata"]["name"]: (pod["metadata"].get("labels") or {}).get("component") for pod in args.inventory.items["pods"]}
+    matched = []
+    for pod in pods:
+        if "Running" not in pod[1]:
+            continue
+        label = labels.get(pod[0])
+        if (label in COMPONENT_LABELS[component]) if label else (component in pod[0].lower()):
+            matched.append(pod[0])
+    return matched
+
+PULSAR_IMAGES = ("pulsar", "lunastreaming")
+# component of a docker container, from its compose service or its name
+CONTAINER_COMPONENTS = [("bookkeeper", "bookie"), ("bookie", "bookie"), ("zookeeper", "zookeeper"), ("broker", "broker"), ("proxy", "proxy"),
+    ("bastion", "bastion"), ("standalone", "standalone")]
+
+#Below function tells whether a docker container runs Pulsar, from its name or image
+def is_pulsar_container(container):
+    image = container.attrs.get("Config", {}).get("Image") or container.attrs.get("Image") or ""
+    return "pulsar" in container.name or any(name in image for name in PULSAR_IMAGES)
+
+#Below function returns the component of a docker container
+def container_component(container):
+    service = (container.labels or {}).get("com.docker.compose.service") or container.name
+    return next((component for key, component in CONTAINER_COMPONENTS if key in service), "pulsar")
+
+#Below function returns the container the admin walk runs in: standalone first, then a broker, then a proxy
+def primary_container(containers):
+    for component in ("standalone", "broker", "proxy"):
+        for container in containers:
+            if container_component(container) == component:
+                return container
+    return containers[0]
+
+KUBE_API_LISTS = {"pods": ("core", "list_namespaced_pod", "Pod"), "events": ("core", "list_namespaced_event", "Event"),
+    "services": ("core", "list_namespaced_service", "Service"), "statefulsets": ("apps", "list_namespaced_stateful_set", "StatefulSet"),
+    "pvcs": ("core", "list_namespaced_persistent_volume_claim", "PersistentVolumeClaim")}
+KUBE_EXEC_V5_PROTOCOL = "v5.channel.k8s.io"
+
+# Set by main with --kube-backend api, kubectl exec and logs commands then run through it in-process
+kube_api_backend = None
+# Set by main (or the worker process of a target with --context), the kube context every kubectl command runs in
+kube_context = None
+
+#Below function returns a command as it is started, kubectl commands with the --context of the run
+def kube_command(command):
+    if kube_context and command[0] == "kubectl":
+        return [command[0], "--context", kube_context] + list(command[1:])
+    return command
+
+#Below class is the in-process Kubernetes API backend (--kube-backend api). The kubeconfig is loaded once and
+#requests share one pooled API client, so lists, logs and execs do not start a kubectl process each. The rest of
+#the script keeps building kubectl commands, popen() runs the exec and logs ones through the API instead
+class KubeApiBackend:
+    def __init__(self, namespace, pool_size=16, kubeconfig=None, context=None):
+        import kubernetes
+        self.kubernetes = kubernetes
+        self.namespace = namespace
+        configuration = kubernetes.client.Configuration()
+        try:
+            kubernetes.config.load_kube_config(config_file=kubeconfig, context=context, client_configuration=configuration)
+        except kubernetes.config.ConfigException:
+            kubernetes.config.load_incluster_config(client_configuration=configuration)
+        configuration.connection_pool_maxsize = pool_size
+        self.core = kubernetes.client.CoreV1Api(kubernetes.client.ApiClient(configuration))
+        self.apps = kubernetes.client.AppsV1Api(self.core.api_client)
+        # stream() swaps the request function of the client it is given, so execs get their own client and lock
+        self.exec_core = kubernetes.client.CoreV1Api(kubernetes.client.ApiClient(configuration))
+        self.exec_lock = threading.Lock()
+        self.containers = {}
+
+    def list_json(self, kind):
+        api, method, item_kind = KUBE_API_LISTS[kind]
+        response = getattr(getattr(self, api), method)(self.namespace, _preload_content=False)
+        items = json.loads(response.data).get("items", [])
+        for item in items:
+            # list responses leave the kind out of the items, kubectl adds it back
+            item.setdefault("kind", item_kind)
+            if item_kind == "Pod":
+                self.containers[item["metadata"]["name"]] = [container["name"] for container in item.get("spec", {}).get("containers", [])]
+        return items
+
+    def pod_containers(self, namespace, pod):
+        if pod not in self.containers:
+            response = self.core.read_namespaced_pod(pod, namespace, _preload_content=False)
+            self.containers[pod] = [container["name"] for container in json.loads(response.data)["spec"]["containers"]]
+        return self.containers[pod]
+
+    #Below method starts a kubectl exec or logs command through the API and returns a Popen-like handle, or None
+    #for the commands it does not handle so the caller runs kubectl
+    def popen(self, command, stdin=None, stdout=None, stderr=None, text=False):
+        arguments = command[1:]
+        namespace = self.namespace
+        if arguments[:1] == ["-n"]:
+            namespace, arguments = arguments[1], arguments[2:]
+        if arguments[:1] == ["exec"] and "--" in arguments:
+            split = arguments.index("--")
+            options = arguments[1:split]
+            pod = next(option for option in options if not option.startswith("-"))
+            interactive = stdin is not None and any(option in ("-i", "-it", "--stdin") for option in options)
+            return self.exec(namespace, pod, arguments[split + 1:], interactive, text)
+        if arguments[:1] == ["logs"]:
+            options = dict(option.lstrip("-").split("=", 1) for option in arguments[2:] if "=" in option)
+            return self.logs(namespace, arguments[1], options, text)
+        if arguments[:2] == ["get", "--raw"]:
+            return self.raw(arguments[2], text)
+        return None
+
+    #Below method streams the response of a GET of an API path like kubectl get --raw, watches included
+    def raw(self, path, text):
+        parsed = urllib.parse.urlsplit(path)
+        responses = []
+        process = KubeApiProcess(["kubectl", "get", "--raw", path], text, cancel=lambda: [response.close() for response in responses])
+
+        def pump(out, err):
+            try:
+                response = self.core.api_client.call_api(parsed.path, "GET", query_params=urllib.parse.parse_qsl(parsed.query),
+                    auth_settings=["BearerToken"], _return_http_data_only=True, _preload_content=False)
+            except self.kubernetes.client.ApiException as e:
+                err.write(f"Error from server: {e.reason} {e.body or ''}".encode())
+                return 1
+            responses.append(response)
+            # a watch is a chunked response, each chunk is written as soon as it arrives
+            for chunk in response.stream(BUNDLE_CHUNK_BYTES):
+                out.write(chunk)
+                out.flush()
+            response.release_conn()
+            return 0
+        process.start(pump)
+        return process
+
+    def exec(self, namespace, pod, command, interactive, text):
+        with self.exec_lock:
+            ws = self.kubernetes.stream.stream(self.exec_core.connect_get_namespaced_pod_exec, pod, namespace, command=command,
+                stdin=interactive, stdout=True, stderr=True, tty=False, _preload_content=False, binary=True)
+        if interactive and ws.subprotocol != KUBE_EXEC_V5_PROTOCOL:
+            # only the v5 exec protocol can signal the end of stdin, older API servers go through kubectl
+            ws.close()
+            return None
+        process = KubeApiProcess(command, text, cancel=ws.close)
+        if interactive:
+            process.stdin = KubeApiStdin(ws, text)
+
+        def pump(out, err):
+            while ws.is_open():
+                ws.update(timeout=1)
+                out.write(ws.read_channel(1))
+                err.write(ws.read_channel(2))
+            out.write(ws.read_channel(1))
+            err.write(ws.read_channel(2))
+            try:
+                return ws.returncode
+            except (TypeError, KeyError, IndexError, ValueError):
+                return 1
+        process.start(pump)
+        return process
+
+    def logs(self, namespace, pod, options, text):
+        since_seconds = None
+        if "since" in options:
+            since_seconds = int(options["since"].rstrip("s"))
+        elif "since-time" in options:
+            since = datetime.strptime(options["since-time"], "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc)
+            # the API only takes seconds, one more second than the distance to the start time
+            since_seconds = max(1, int((datetime.now(timezone.utc) - since).total_seconds()) + 1)
+        containers = self.pod_containers(namespace, pod) if options.get("all-containers") == "true" else [None]
+        responses = []
+        process = KubeApiProcess(["kubectl", "logs", pod], text, cancel=lambda: [response.close() for response in responses])
+
+        def pump(out, err):
+            for container in containers:
+                try:
+                    response = self.core.read_namespaced_pod_log(pod, namespace, container=container, since_seconds=since_seconds,
+                        timestamps=options.get("timestamps") == "true", _preload_content=False)
+                except self.kubernetes.client.ApiException as e:
+                    err.write(f"Error from server: {e.reason} {e.body or ''}".encode())
+                    return 1
+                responses.append(response)
+                if options.get("prefix") == "true":
+                    # each line starts with its source, as kubectl logs --prefix prints it
+                    prefix = f"[pod/{pod}/{container}] " if container else f"[pod/{pod}] "
+                    for line in io.BufferedReader(ChunkIterReader(response.stream(BUNDLE_CHUNK_BYTES)), BUNDLE_CHUNK_BYTES):
+                        out.write(prefix.encode() + line)
+                else:
+                    for chunk in response.stream(BUNDLE_CHUNK_BYTES):
+                        out.write(chunk)
+                response.release_conn()
+            return 0
+        process.start(pump)
+        return process
+
+#Below class is the Popen-like handle of a command run through the API backend or the docker SDK backend. A pump
+#thread writes the streams into pipes so callers read stdout and stderr exactly as from a kubectl or docker process
+class KubeApiProcess:
+    def __init__(self, command, text=False, cancel=None):
+        self.args = command
+        self.returncode = None
+        self.stdin = None
+        self.cancel = cancel
+        self.killed = False
+        stdout, self.stdout_pipe = os.pipe()
+        stderr, self.stderr_pipe = os.pipe()
+        self.stdout = open(stdout, "r" if text else "rb")
+        self.stderr = open(stderr, "r" if text else "rb")
+        self.finished = threading.Event()
+
+    def start(self, pump):
+        threading.Thread(target=self.run, args=(pump,), daemon=True).start()
+
+    def run(self, pump):
+        with open(self.stdout_pipe, "wb") as out, open(self.stderr_pipe, "wb") as err:
+            try:
+                returncode = pump(out, err)
+            except BrokenPipeError:
+                returncode = 1
+            except Exception as e:
+                try:
+                    err.write(str(e).encode())
+                except BrokenPipeError:
+                    pass
+                returncode = 1
+        if self.stdin is not None:
+            self.stdin.closed = True
+        self.returncode = -9 if self.killed else returncode
+        self.finished.set()
+
+    def poll(self):
+        return self.returncode
+
+    def wait(self, timeout=None):
+        if not self.finished.wait(timeout):
+            raise subprocess.TimeoutExpired(self.args, timeout)
+        return self.returncode
+
+    def kill(self):
+        self.killed = True
+        if self.cancel:
+            self.cancel()
+
+    terminate = kill
+
+#Below class is the stdin of an exec run through the API backend
+class KubeApiStdin:
+    def __init__(self, ws, text):
+        self.ws = ws
+        self.text = text
+        self.closed = False
+
+    def write(self, data):
+        self.ws.write_stdin(data.encode() if self.text else data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.ws.close_channel(0)
+
+# Set by main in docker mode unless --docker-backend cli, docker logs, exec and cp commands then run through it
+docker_sdk_backend = None
+
+#Below class runs the docker commands of the run in-process through the docker SDK (--docker-backend sdk). Logs are
+#streamed, execs run without a TTY with stdin attached only when a script is fed to them, and cp is a get_archive
+#tar stream extracted on the fly, all over the pooled connections of one client instead of a docker process per call
+class DockerSdkBackend:
+    def __init__(self, client):
+        import docker.utils.socket
+        self.frames_iter = docker.utils.socket.frames_iter
+        self.api = client.api
+
+    #Below method starts a docker exec, logs or cp command through the SDK and returns a Popen-like handle, or None
+    #for the commands it does not handle so the caller runs docker
+    def popen(self, command, stdin=None, stdout=None, stderr=None, text=False):
+        arguments = command[1:]
+        if arguments[:1] == ["exec"]:
+            index = 1
+            while arguments[index].startswith("-"):
+                index += 1
+            interactive = stdin is not None and any(option in ("-i", "-it", "--interactive") for option in arguments[1:index])
+            return self.exec(arguments[index], arguments[index + 1:], interactive, text)
+        if arguments[:1] == ["logs"]:
+            since = arguments[arguments.index("--since") + 1] if "--since" in arguments else None
+            return self.logs(arguments[-1], since, "--timestamps" in arguments, text)
+        if arguments[:1] == ["cp"] and ":" in arguments[1]:
+            container, path = arguments[1].split(":", 1)
+            return self.copy(container, path, arguments[2], text)
+        return None
+
+    def exec(self, container, command, interactive, text):
+        exec_id = self.api.exec_create(container, command, stdin=interactive, stdout=True, stderr=True, tty=False)["Id"]
+        sock = self.api.exec_start(exec_id, socket=True)
+        raw = getattr(sock, "_sock", sock)
+        process = KubeApiProcess(["docker", "exec", container] + command, text, cancel=raw.close)
+        if interactive:
+            process.stdin = DockerSdkStdin(raw, text)
+
+        def pump(out, err):
+            for stream, data in self.frames_iter(sock, tty=False):
+                (err if stream == 2 else out).write(data)
+            sock.close()
+            # the exit code is set a moment after the output ends
+            for _ in range(50):
+                inspect = self.api.exec_inspect(exec_id)
+                if not inspect.get("Running"):
+                    return inspect.get("ExitCode") or 0
+                time.sleep(0.1)
+            raise RuntimeError(f"docker exec in {container} still running 5s after its output ended, no exit code")
+        process.start(pump)
+        return process
+
+    def logs(self, container, since, timestamps, text):
+        process = KubeApiProcess(["docker", "logs", container], text)
+
+        def pump(out, err):
+            options = {"timestamps": timestamps}
+            if since:
+                options["since"] = int(datetime.strptime(since, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc).timestamp())
+            # stdout and stderr of the container interleaved, as kubectl logs prints them
+            for chunk in self.api.logs(container, stdout=True, stderr=True, stream=True, follow=False, **options):
+                out.write(chunk)
+            return 0
+        process.start(pump)
+        return process
+
+    #Below method copies a path of a container like docker cp: "dir/." copies the content of dir into the
+    #destination, "dir" and "dir/" copy the directory itself into an existing destination
+    def copy(self, container, path, destination, text):
+        process = KubeApiProcess(["docker", "cp", f"{container}:{path}", destination], text)
+        contents = path.endswith("/.") or not os.path.isdir(destination)
+        source = path[:-2] if path.endswith("/.") else path.rstrip("/") or "/"
+
+        def pump(out, err):
+            chunks, _ = self.api.get_archive(container, source, chunk_size=BUNDLE_CHUNK_BYTES)
+            os.makedirs(destination, exist_ok=True)
+            with tarfile.open(fileobj=io.BufferedReader(ChunkIterReader(chunks), BUNDLE_CHUNK_BYTES), mode="r|") as tar:
+                for member in tar:
+                    if contents:
+                        # the archive holds the directory itself, its content goes straight into the destination
+                        name = member.name.split("/", 1)
+                        if len(name) == 1:
+                            continue
+                        member.name = name[1]
+                    if hasattr(tarfile, "data_filter"):
+                        tar.extract(member, destination, filter="data")
+                    else:
+                        tar.extract(member, destination)
+            return 0
+        process.start(pump)
+        return process
+
+#Below class is the stdin of an exec run through the docker SDK backend, closing it half-closes the exec socket
+class DockerSdkStdin:
+    def __init__(self, sock, text):
+        self.sock = sock
+        self.text = text
+        self.closed = False
+
+    def write(self, data):
+        self.sock.sendall(data.encode() if self.text else data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.sock.shutdown(socket.SHUT_WR)
+
+#Below class is a file object over an iterator of byte chunks, such as the archive stream of the docker SDK
+class ChunkIterReader(io.RawIOBase):
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.pending = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self.pending:
+            self.pending = next(self.chunks, None)
+            if self.pending is None:
+                self.pending = b""
+                return 0
+        size = min(len(buffer), len(self.pending))
+        buffer[:size] = self.pending[:size]
+        self.pending = self.pending[size:]
+        return size
+
+#Below function starts a command, kubectl exec and logs commands run through the API backend and docker commands
+#through the SDK backend when they are enabled
+def popen_command(command, **kwargs):
+    if kube_api_backend is not None and command[0] == "kubectl":
+        process = kube_api_backend.popen(command, **kwargs)
+        if process is not None:
+            return process
+    if docker_sdk_backend is not None and command[0] == "docker":
+        process = docker_sdk_backend.popen(command, **kwargs)
+        if process is not None:
+            return process
+    return subprocess.Popen(kube_command(command), **kwargs)
+
+#Below function is subprocess.run for every command of the run, within the command limits, recorded in the run
+#stats and run through the API or docker SDK backend when it is enabled
+def run_command(command, check=False, timeout=None, **kwargs):
+    in_process = (kube_api_backend is not None and command[0] == "kubectl" and kwargs.get("capture_output")) or (docker_sdk_backend is not None and command[0] == "docker")
+    if not in_process:
+        with command_slot(command), command_call(command) as call:
+            # copies write straight to disk, what they transferred is what the destination grew by
+            copied = command[-1] if command_target(command)[0] == "cp" and run_stats is not None else None
+            size_before = path_size(copied) if copied else 0
+            try:
+                result = subprocess.run(kube_command(command), check=check, timeout=timeout, **kwargs)
+            except subprocess.CalledProcessError as e:
+                call["rc"] = e.returncode
+                raise
+            call["rc"] = result.returncode
+            if copied:
+                call["bytes"] = path_size(copied) - size_before
+            elif isinstance(result.stdout, (str, bytes)):
+                call["bytes"] = len(result.stdout)
+            elif hasattr(kwargs.get("stdout"), "tell"):
+                call["bytes"] = kwargs["stdout"].tell()
+            return result
+    output, rc, err = stream_command(command, lambda stdout: stdout.read(), time.monotonic() + timeout if timeout else None)
+    if kwargs.get("text"):
+        output = output.decode(errors="replace")
+    if check and rc != 0:
+        raise subprocess.CalledProcessError(rc, command, output, err)
+    return subprocess.CompletedProcess(command, rc, output, err)
+
+# Set by main, the limits every kubectl and docker command of the run is started within
+command_limits = None
+
+#Below class holds the global limits of a run: concurrent execs (kubectl exec and cp, docker exec), concurrent
+#streams per node (kubectl logs, exec and cp all go through the kubelet of the pod's node) and the rate commands
+#are sent to the API server at. A limit of 0 disables it
+class CommandLimits:
+    def __init__(self, max_execs=0, max_streams_per_node=0, qps=0, nodes=None):
+        self.execs = threading.BoundedSemaphore(max_execs) if max_execs else None
+        self.max_streams_per_node = max_streams_per_node
+        self.nodes = nodes or {}
+        self.node_streams = {}
+        self.qps = qps
+        self.lock = threading.Lock()
+        self.next_request = time.monotonic()
+
+    def throttle(self):
+        if not self.qps:
+            return
+        with self.lock:
+            now = time.monotonic()
+            delay = self.next_request - now
+            self.next_request = max(now, self.next_request) + 1 / self.qps
+        if delay > 0:
+            time.sleep(delay)
+
+    def node_semaphore(self, pod):
+        node = self.nodes.get(pod)
+        if not node or not self.max_streams_per_node:
+            return None
+        with self.lock:
+            if node not in self.node_streams:
+                self.node_streams[node] = threading.BoundedSemaphore(self.max_streams_per_node)
+            return self.node_streams[node]
+
+    @contextlib.contextmanager
+    def slot(self, command):
+        verb, pod = command_target(command)
+        semaphores = []
+        if verb in ("exec", "cp") and self.execs:
+            semaphores.append(self.execs)
+        if command[0] == "kubectl" and verb in ("exec", "cp", "logs"):
+            semaphores.append(self.node_semaphore(pod))
+        # always taken in the same order (exec, then node) so waiting commands cannot deadlock
+        for semaphore in semaphores:
+            if semaphore:
+                semaphore.acquire()
+        try:
+            if command[0] == "kubectl":
+                self.throttle()
+            yield
+        finally:
+            for semaphore in semaphores:
+                if semaphore:
+                    semaphore.release()
+
+#Below function returns the verb and the pod of a kubectl or docker command
+def command_target(command):
+    arguments = command[1:]
+    if command[0] == "kubectl" and arguments[:1] == ["-n"]:
+        arguments = arguments[2:]
+    if not arguments:
+        return None, None
+    if arguments[0] == "cp":
+        source = next((argument for argument in arguments[1:] if ":" in argument), "")
+        return "cp", source.split(":", 1)[0] or None
+    if arguments[0] not in ("exec", "logs", "describe"):
+        return arguments[0], None
+    return arguments[0], next((argument for argument in arguments[1:] if not argument.startswith("-")), None)
+
+#Below function returns the size of a file or of all the files under a directory
+def path_size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+#Below function returns the limits slot of a command
+def command_slot(command):
+    return command_limits.slot(command) if command_limits is not None else contextlib.nullcontext()
+
+RUN_REPORT_SLOWEST = 20
+RUN_REPORT_ARGUMENT_CHARS = 120
+
+# Set by main, records the commands of the run for run_report.json
+run_stats = None
+collector_context = threading.local()
+
+#Below function returns the collector the current thread works for
+def current_collector():
+    return getattr(collector_context, "name", None)
+
+def set_collector(name):
+    collector_context.name = name
+
+#Below function runs a collector with its name attached to the thread, so its commands are attributed to it
+def run_as_collector(name, function, *function_args, **function_kwargs):
+    set_collector(name)
+    try:
+        return function(*function_args, **function_kwargs)
+    finally:
+        set_collector(None)
+
+#Below class wraps a stream to count the bytes (or characters of a text stream) read through it
+class CountingReader:
+    def __init__(self, stream):
+        self.stream = stream
+        self.bytes = 0
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.bytes += len(data)
+        return data
+
+    def readline(self, size=-1):
+        line = self.stream.readline(size)
+        self.bytes += len(line)
+        return line
+
+    def __iter__(self):
+        for line in self.stream:
+            self.bytes += len(line)
+            yield line
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+#Below class records the wall time, bytes transferred, exit status and retries of every command (subprocess,
+#exec, copy and admin REST request) of the run. At the end it writes run_report.json with the totals per collector,
+#per pod and per command, the slowest calls and the number of forked processes, and with --profile a trace of
+#all calls in the Chrome trace event format (chrome://tracing, Perfetto)
+class RunStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = []
+        self.collectors = {}
+        self.start = time.monotonic()
+        self.start_time = time.time()
+
+    @contextlib.contextmanager
+    def call(self, command):
+        verb, pod = command_target(command)
+        call = {"command": " ".join(argument.splitlines()[0][:RUN_REPORT_ARGUMENT_CHARS] if argument else argument for argument in command),
+            "tool": f"{command[0]} {verb}" if verb else command[0], "pod": pod, "collector": current_collector(),
+            "thread": threading.get_ident(), "bytes": 0, "rc": None, "retries": 0, "forked": command[0] != "rest"}
+        start = time.monotonic()
+        try:
+            yield call
+        except subprocess.TimeoutExpired:
+            call["rc"] = "timeout"
+            raise
+        except Exception as e:
+            if call["rc"] is None:
+                call["rc"] = type(e).__name__
+            raise
+        finally:
+            call["start"] = start - self.start
+            call["seconds"] = time.monotonic() - start
+            with self.lock:
+                self.calls.append(call)
+
+    def record_collector(self, name, start, end, error=None):
+        with self.lock:
+            self.collectors[name] = {"start": start - self.start, "seconds": end - start, "error": str(error) if error else None}
+
+    def report(self, run_id=None):
+        with self.lock:
+            calls = list(self.calls)
+            collectors = dict(self.collectors)
+
+        def totals(group):
+            failed = [call for call in group if call["rc"] not in (0, None) and not (isinstance(call["rc"], int) and 200 <= call["rc"] < 400)]
+            return {"calls": len(group), "seconds": round(sum(call["seconds"] for call in group), 3), "bytes": sum(call["bytes"] for call in group),
+                "forks": sum(1 for call in group if call["forked"]), "failed": len(failed), "retries": sum(call["retries"] for call in group)}
+
+        def grouped(key):
+            groups = {}
+            for call in calls:
+                groups.setdefault(call[key] or "other", []).append(call)
+            return {name: totals(group) for name, group in sorted(groups.items())}
+
+        by_collector = grouped("collector")
+        for name, collector in collectors.items():
+            by_collector.setdefault(name, totals([])).update({"wall_seconds": round(collector["seconds"], 3), "error": collector["error"]})
+        slowest = sorted(calls, key=lambda call: call["seconds"], reverse=True)[:RUN_REPORT_SLOWEST]
+        return {
+            "run_id": run_id,
+            "started_at": datetime.fromtimestamp(self.start_time, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "wall_seconds": round(time.monotonic() - self.start, 3),
+            "totals": totals(calls),
+            "collectors": by_collector,
+            "pods": grouped("pod"),
+            "commands": grouped("tool"),
+            "slowest": [{key: round(call[key], 3) if key == "seconds" else call[key] for key in ("command", "collector", "pod", "seconds", "bytes", "rc", "retries")} for call in slowest],
+        }
+
+    def write_report(self, path, run_id=None):
+        report = self.report(run_id)
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+        return report
+
+    def write_trace(self, path):
+        with self.lock:
+            calls = list(self.calls)
+            collectors = dict(self.collectors)
+        events = [{"name": name, "cat": "collector", "ph": "X", "ts": int(collector["start"] * 1e6), "dur": int(collector["seconds"] * 1e6),
+            "pid": 1, "tid": 0, "args": {"error": collector["error"]}} for name, collector in collectors.items()]
+        events.extend({"name": call["tool"], "cat": call["collector"] or "other", "ph": "X", "ts": int(call["start"] * 1e6),
+            "dur": int(call["seconds"] * 1e6), "pid": 1, "tid": call["thread"],
+            "args": {key: call[key] for key in ("command", "pod", "bytes", "rc", "retries")}} for call in calls)
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+#Below function writes run_report.json (and run_trace.json with --profile) and logs where the run spent its time
+def write_run_report(args):
+    logger = logging.getLogger("RunReport")
+    report = run_stats.write_report(os.path.join(args.output_dir, "run_report.json"), args.run_id)
+    totals = report["totals"]
+    logger.info(f"Run took {report['wall_seconds']:.1f}s: {totals['calls']} calls ({totals['forks']} forked processes), "
+        f"{totals['bytes']} bytes transferred, {totals['failed']} failed, details in run_report.json")
+    for call in report["slowest"][:3]:
+        logger.info(f"Slow call: {call['seconds']:.1f}s {call['command'][:160]}")
+    if args.profile:
+        trace_path = os.path.join(args.output_dir, "run_trace.json")
+        run_stats.write_trace(trace_path)
+        logger.info(f"Wrote the trace of the run to {trace_path}, open it in chrome://tracing or https://ui.perfetto.dev")
+
+#Below function returns the run stats record of a command, or a throwaway one when the run is not instrumented
+def command_call(command):
+    return run_stats.call(command) if run_stats is not None else contextlib.nullcontext({})
+
+PROGRESS_INTERVAL_SECONDS = 15
+
+#Below class runs the collectors of a run as a task graph on a thread pool. A task starts as soon as the tasks it
+#runs after have finished (failed or not), so independent collectors overlap and the run takes about as long as the
+#slowest of them. The running tasks and the units finished so far are logged every PROGRESS_INTERVAL_SECONDS
+class CollectorScheduler:
+    def __init__(self, args):
+        self.args = args
+        self.tasks = {}
+
+    def add(self, name, function, function_args=(), function_kwargs=None, after=()):
+        self.tasks[name] = (function, function_args, function_kwargs or {}, tuple(after))
+
+    def run(self):
+        logger = logging.getLogger("Scheduler")
+        pending = dict(self.tasks)
+        finished = {}
+        running = {}
+        started = {}
+        run_start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=max(1, len(self.tasks))) as executor:
+            while pending or running:
+                for name in [name for name, (_, _, _, after) in pending.items() if all(task in finished for task in after)]:
+                    function, function_args, function_kwargs, _ = pending.pop(name)
+                    logger.info(f"Starting {name}")
+                    started[name] = time.monotonic()
+                    running[executor.submit(run_as_collector, name, function, *function_args, **function_kwargs)] = name
+                if not running:
+                    logger.error(f"Tasks waiting on tasks that do not exist: {', '.join(pending)}")
+                    break
+                done, _ = wait(running, timeout=PROGRESS_INTERVAL_SECONDS, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    finished[name] = future.exception()
+                    if run_stats is not None:
+                        run_stats.record_collector(name, started[name], time.monotonic(), finished[name])
+                    if finished[name]:
+                        logger.error(f"{name} failed after {time.monotonic() - started[name]:.1f}s: {finished[name]}")
+                    else:
+                        logger.info(f"Finished {name} in {time.monotonic() - started[name]:.1f}s")
+                if not done:
+                    units, failed = self.args.journal.counts() if self.args.journal is not None else (0, 0)
+                    now = time.monotonic()
+                    logger.info(f"Progress: {len(finished)}/{len(self.tasks)} tasks done, running " +
+                        ", ".join(f"{name} ({now - started[name]:.0f}s)" for name in running.values()) + f", {units} units done, {failed} failed")
+        logger.info(f"All tasks finished in {time.monotonic() - run_start:.1f}s")
+        return finished
+
+#Below function returns when an event was last seen, which depends on the API version that created it
+def event_time(event):
+    return event.get("lastTimestamp") or event.get("eventTime") or event.get("metadata", {}).get("creationTimestamp") or ""
+
+#Below function renders a pod from the inventory in the layout of "kubectl describe pod"
+def render_pod_description(inventory, pod):
+    metadata = pod.get("metadata", {})
+    spec = pod.get("spec", {})
+    status = pod.get("status", {})
+    lines = []
+
+    def field(name, value, indent=0):
+        lines.append(f"{' ' * indent}{name + ':':<{20 - indent}}{value if value not in (None, '') else '<none>'}")
+
+    def mapping(name, values, indent=0):
+        values = [f"{key}={value}" for key, value in sorted((values or {}).items())]
+        field(name, values[0] if values else "<none>", indent)
+        lines.extend(f"{' ' * 20}{value}" for value in values[1:])
+
+    def container_state(state):
+        if not state:
+            return "<none>"
+        kind, details = next(iter(state.items()))
+        if kind == "running":
+            return f"Running (started {details.get('startedAt')})"
+        reason = details.get("reason")
+        if kind == "terminated":
+            return f"Terminated ({reason}, exit code {details.get('exitCode')}, finished {details.get('finishedAt')})"
+        return f"{kind.capitalize()} ({reason})" if reason else kind.capitalize()
+
+    field("Name", metadata.get("name"))
+    field("Namespace", metadata.get("namespace"))
+    field("Node", f"{spec.get('nodeName')}/{status.get('hostIP')}" if spec.get("nodeName") else None)
+    field("Start Time", status.get("startTime"))
+    mapping("Labels", metadata.get("labels"))
+    field("Status", status.get("phase"))
+    field("IP", status.get("podIP"))
+    owners = metadata.get("ownerReferences") or []
+    field("Controlled By", ", ".join(f"{owner.get('kind')}/{owner.get('name')}" for owner in owners))
+    container_statuses = {container["name"]: container for container in status.get("containerStatuses", [])}
+    for title, containers in (("Init Containers", spec.get("initContainers")), ("Containers", spec.get("containers"))):
+        if not containers:
+            continue
+        lines.append(f"{title}:")
+        for container in containers:
+            container_status = container_statuses.get(container["name"], {})
+            lines.append(f"  {container['name']}:")
+            field("Image", container.get("image"), 4)
+            field("Port(s)", ", ".join(f"{port.get('containerPort')}/{port.get('protocol', 'TCP')}" for port in container.get("ports", [])), 4)
+            field("State", container_state(container_status.get("state")), 4)
+            if container_status.get("lastState"):
+                field("Last State", container_state(container_status.get("lastState")), 4)
+            field("Ready", container_status.get("ready", False), 4)
+            field("Restart Count", container_status.get("restartCount", 0), 4)
+            mapping("Limits", container.get("resources", {}).get("limits"), 4)
+            mapping("Requests", container.get("resources", {}).get("requests"), 4)
+    lines.append("Conditions:")
+    lines.append(f"  {'Type':<28}Status")
+    lines.extend(f"  {condition.get('type'):<28}{condition.get('status')}" for condition in status.get("conditions", []))
+    lines.append("Volumes:")
+    for volume in spec.get("volumes", []):
+        lines.append(f"  {volume.get('name')}:")
+        claim = volume.get("persistentVolumeClaim")
+        if claim:
+            pvc = inventory.pvc(claim.get("claimName")) or {}
+            field("Type", "PersistentVolumeClaim", 4)
+            field("ClaimName", claim.get("claimName"), 4)
+            field("Phase", pvc.get("status", {}).get("phase"), 4)
+            field("Capacity", pvc.get("status", {}).get("capacity", {}).get("storage"), 4)
+            field("StorageClass", pvc.get("spec", {}).get("storageClassName"), 4)
+        else:
+            field("Type", next((key for key in volume if key != "name"), None), 4)
+    events = inventory.events_for("Pod", metadata.get("name"))
+    if not events:
+        lines.append("Events:             <none>")
+    else:
+        lines.append("Events:")
+        lines.append(f"  {'Type':<9}{'Reason':<20}{'Last Seen':<22}{'Count':<7}{'From':<24}Message")
+        for event in events:
+            source = event.get("source", {}).get("component") or event.get("reportingComponent") or ""
+            lines.append(f"  {event.get('type', ''):<9}{event.get('reason', ''):<20}{event_time(event):<22}{event.get('count', 1):<7}{source:<24}{event.get('message', '').strip()}")
+    return "\n".join(lines) + "\n"
+
+#Below function parses the per component parallelism cap, either a single number for every component or "broker=4,bookie=2"
+def parse_component_parallel(value):
+    limits = {}
+    for item in value.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        component, sep, limit = item.rpartition("=")
+        try:
+            limits[component if sep else "*"] = int(limit)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"invalid component parallelism '{item}'")
+        if limits[component if sep else "*"] < 1:
+            raise argparse.ArgumentTypeError(f"component parallelism must be at least 1: '{item}'")
+    return limits
+
+#Below function returns the seconds left before the deadline, None meaning no deadline
+def remaining_time(deadline):
+    if deadline is None:
+        return None
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise subprocess.TimeoutExpired("pod deadline", 0)
+    return remaining
+
+#Below function runs (group, key, function, function_args) tasks on a bounded worker pool.
+#At most group_limits[group] (or group_limits["*"]) tasks of the same group run at once, so a large
+#component cannot take every worker. Tasks are interleaved across groups so capped workers rarely sit idle.
+#It yields (group, key, error) as the tasks finish, error being None on success
+def run_in_pool(tasks, parallel, group_limits=None):
+    group_limits = group_limits or {}
+    collector = current_collector()
+    semaphores = {}
+    for group, _, _, _ in tasks:
+        limit = group_limits.get(group, group_limits.get("*"))
+        if group not in semaphores:
+            semaphores[group] = threading.BoundedSemaphore(limit) if limit else None
+
+    def run_task(group, function, function_args):
+        set_collector(collector)
+        semaphore = semaphores[group]
+        if semaphore is None:
+            return function(*function_args)
+        with semaphore:
+            return function(*function_args)
+
+    queues = {}
+    for task in tasks:
+        queues.setdefault(task[0], []).append(task)
+    ordered = []
+    while any(queues.values()):
+        for queue in queues.values():
+            if queue:
+                ordered.append(queue.pop(0))
+
+    with ThreadPoolExecutor(max_workers=max(1, parallel)) as executor:
+        futures = {executor.submit(run_task, group, function, function_args): (group, key) for group, key, function, function_args in ordered}
+        for future in as_completed(futures):
+            group, key = futures[future]
+            yield group, key, future.exception()
+
+#Below function runs a command and hands its stdout stream to `consume`, returning (consume result, exit code, stderr).
+#The command is killed and TimeoutExpired raised once the deadline passes. With `tail_bytes` only the last bytes of
+#the stream reach `consume`
+def stream_command(command, consume, deadline=None, tail_bytes=0):
+    if tail_bytes:
+        consume = tail_consumer(consume, tail_bytes)
+    with command_slot(command):
+        return _stream_command(command, consume, deadline)
+
+def _stream_command(command, consume, deadline=None):
+    with command_call(command) as call:
+        process = popen_command(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        call["forked"] = not isinstance(process, KubeApiProcess)
+        result, returncode, stderr = _consume_process(command, process, consume, deadline, call)
+        call["rc"] = returncode
+        return result, returncode, stderr
+
+def _consume_process(command, process, consume, deadline, call):
+    stderr = []
+    drain = threading.Thread(target=lambda: stderr.append(process.stderr.read()[-65536:]), daemon=True)
+    drain.start()
+    timed_out = threading.Event()
+    timer = None
+    if deadline is not None:
+        timer = threading.Timer(max(0, deadline - time.monotonic()), lambda: (timed_out.set(), process.kill()))
+        timer.start()
+    stdout = CountingReader(process.stdout)
+    try:
+        result = consume(stdout)
+    finally:
+        call["bytes"] = stdout.bytes
+        process.stdout.close()
+        process.wait()
+        drain.join()
+        if timer:
+            timer.cancel()
+    if timed_out.is_set():
+        call["rc"] = "timeout"
+        raise subprocess.TimeoutExpired(command, deadline)
+    return result, process.returncode, b"".join(stderr).decode(errors="replace")
+
+#Below function extracts the tar.gz stream printed by a command into a local directory without buffering it
+def extract_command_tar(command, destination, deadline=None):
+    def extract(stdout):
+        with tarfile.open(fileobj=stdout, mode="r|gz") as tar:
+            if hasattr(tarfile, "data_filter"):
+                tar.extractall(destination, filter="data")
+            else:
+                tar.extractall(destination)
+    _, rc, err = stream_command(command, extract, deadline)
+    return rc, err
+
+#Below function writes the stdout of a command into a file and raises CalledProcessError when the command fails
+def copy_command_output(command, path, mode="wb", deadline=None, tail_bytes=0):
+    with open(path, mode) as f:
+        _, rc, err = stream_command(command, lambda stdout: shutil.copyfileobj(stdout, f, BUNDLE_CHUNK_BYTES), deadline, tail_bytes)
+    if rc != 0:
+        raise subprocess.CalledProcessError(rc, command[:3], stderr=err)
+
+BUNDLE_CHUNK_BYTES = 1024 * 1024
+BUNDLE_SPOOL_BYTES = 16 * 1024 * 1024
+
+#Below class keeps the last `limit` bytes written to it in a temporary file. Once the file holds twice the limit
+#its tail is moved to the front, so the disk used stays under two budgets however long the stream is
+class TailSpool:
+    def __init__(self, limit):
+        self.limit = limit
+        self.file = tempfile.TemporaryFile()
+        self.size = 0
+
+    def write(self, data):
+        self.file.write(data)
+        self.size += len(data)
+        if self.size >= 2 * self.limit:
+            self.compact()
+        return len(data)
+
+    def compact(self):
+        source, target = self.size - self.limit, 0
+        while source < self.size:
+            self.file.seek(source)
+            chunk = self.file.read(min(BUNDLE_CHUNK_BYTES, self.size - source))
+            self.file.seek(target)
+            self.file.write(chunk)
+            source += len(chunk)
+            target += len(chunk)
+        self.file.truncate(self.limit)
+        self.file.seek(self.limit)
+        self.size = self.limit
+
+    #Below method returns the spool file positioned at the start of the last `limit` bytes
+    def tail(self):
+        self.file.seek(max(0, self.size - self.limit))
+        return self.file
+
+    def close(self):
+        self.file.close()
+
+#Below function wraps a stream consumer so that it reads the last `limit` bytes of the stream, spooled first
+def tail_consumer(consume, limit):
+    def consume_tail(stdout):
+        spool = TailSpool(limit)
+        try:
+            shutil.copyfileobj(stdout, spool, BUNDLE_CHUNK_BYTES)
+            return consume(spool.tail())
+        finally:
+            spool.close()
+    return consume_tail
+# bytes handed to the kernel per copy_file_range or sendfile call
+ZERO_COPY_CHUNK_BYTES = 64 * 1024 * 1024
+
+#Below function copies up to `count` bytes from the position of one file descriptor to another inside the kernel,
+#with copy_file_range or else sendfile, and with reads and writes where neither works for the two files. It
+#returns the bytes copied, fewer when the source ends first
+def zero_copy(source, target, count):
+    copy_file_range = getattr(os, "copy_file_range", None)
+    sendfile = True
+    copied = 0
+    while copied < count:
+        size = min(count - copied, ZERO_COPY_CHUNK_BYTES)
+        try:
+            if copy_file_range:
+                n = copy_file_range(source, target, size)
+            elif sendfile:
+                n = os.sendfile(target, source, None, size)
+            else:
+                data = os.read(source, min(size, BUNDLE_CHUNK_BYTES))
+                n = len(data)
+                view = memoryview(data)
+                while view:
+                    view = view[os.write(target, view):]
+        except OSError as e:
+            # copy_file_range needs both files on one filesystem with older kernels, sendfile a source it can map
+            if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.EBADF) or not (copy_file_range or sendfile):
+                raise
+            if copy_file_range:
+                copy_file_range = None
+            else:
+                sendfile = False
+            continue
+        if n == 0:
+            break
+        copied += n
+    return copied
+
+#Below class writes every collected artifact into one tar archive as it arrives. Each entry is streamed into a
+#spool file (kept in memory up to BUNDLE_SPOOL_BYTES, then on disk) so pods can stream concurrently, and is then
+#appended to the archive under a lock. Memory stays bounded however large the logs are
+class DiagBundle:
+    def __init__(self, path, prefix="", append=False):
+        self.path = path
+        # Incremental runs append their entries under runs/<run id>/ to the existing archive
+        self.prefix = prefix
+        append = (append or prefix) and os.path.exists(path)
+        if append:
+            truncate_partial_tar(path)
+        self.tar = tarfile.open(path, "a" if append else "w")
+        self.lock = threading.Lock()
+        self.bytes_written = 0
+
+    def add_stream(self, name, stream, compress=False):
+        with tempfile.SpooledTemporaryFile(max_size=BUNDLE_SPOOL_BYTES, dir=os.path.dirname(self.path)) as spool:
+            if compress:
+                with gzip.GzipFile(filename=os.path.basename(name)[:-3], fileobj=spool, mode="wb") as target:
+                    shutil.copyfileobj(stream, target, BUNDLE_CHUNK_BYTES)
+            else:
+                shutil.copyfileobj(stream, spool, BUNDLE_CHUNK_BYTES)
+            info = tarfile.TarInfo(self.prefix + name)
+            info.size = spool.tell()
+            info.mtime = int(time.time())
+            info.mode = 0o644
+            spool.seek(0)
+            with self.lock:
+                self.tar.addfile(info, spool)
+                self.tar.fileobj.flush()
+                self.bytes_written += info.size
+        return info.size
+
+    #Below method streams the stdout of a command, or its last `tail_bytes`, into an entry and returns (size, exit code, stderr)
+    def add_command(self, name, command, compress=False, deadline=None, tail_bytes=0):
+        return stream_command(command, lambda stdout: self.add_stream(name, stdout, compress), deadline, tail_bytes)
+
+    def add_file(self, path, name):
+        with self.lock:
+            self.tar.add(path, arcname=self.prefix + name)
+
+    #Below method archives a local file as is, the data going from the file to the archive with zero_copy instead
+    #of through Python buffers. A file still being written is cut at the size it had when its header was written
+    def add_local_file(self, path, name):
+        with open(path, "rb") as source:
+            info = self.tar.gettarinfo(arcname=self.prefix + name, fileobj=source)
+            header = info.tobuf(self.tar.format, self.tar.encoding, self.tar.errors)
+            padding = -info.size % tarfile.BLOCKSIZE
+            with self.lock:
+                target = self.tar.fileobj
+                target.write(header)
+                target.flush()
+                copied = zero_copy(source.fileno(), target.fileno(), info.size)
+                target.seek(0, os.SEEK_END)
+                # a file truncated meanwhile is padded to the size in its header
+                target.write(tarfile.NUL * (info.size - copied + padding))
+                target.flush()
+                self.tar.offset += len(header) + info.size + padding
+                self.tar.members.append(info)
+                self.bytes_written += info.size
+        return info.size
+
+    #Below method copies the entries of another archive under a prefix, streamed entry by entry
+    def add_archive(self, path, prefix):
+        with tarfile.open(path, "r:") as source, self.lock:
+            for member in source:
+                member.name = self.prefix + prefix + member.name
+                self.tar.addfile(member, source.extractfile(member) if member.isfile() else None)
+                self.bytes_written += member.size
+
+    def close(self):
+        with self.lock:
+            self.tar.close()
+
+#Below function cuts a tar archive after its last complete entry and ends it there, so an archive left behind by a
+#killed run, or finished by an earlier incremental run, can be appended to
+def truncate_partial_tar(path):
+    size = os.path.getsize(path)
+    end = 0
+    try:
+        with tarfile.open(path, "r:") as tar:
+            for member in tar:
+                member_end = member.offset_data + (member.size + tarfile.BLOCKSIZE - 1) // tarfile.BLOCKSIZE * tarfile.BLOCKSIZE
+                if member_end > size:
+                    break
+                end = member_end
+    except tarfile.ReadError:
+        pass
+    with open(path, "r+b") as f:
+        f.truncate(end)
+        # tarfile only appends after the zero blocks that end an archive, not at the end of the file
+        f.seek(end)
+        f.write(b"\0" * 2 * tarfile.BLOCKSIZE)
+
+#Below function returns the in-pod command streaming a compressed tar of `names` under `directory`, and its file extension
+def in_pod_tar_command(directory, names, compression, exclude=()):
+    options = [f"--exclude={name}" for name in exclude]
+    if compression == "zstd":
+        tar = f"tar cf - {' '.join(shlex.quote(option) for option in options)} -C {directory} {' '.join(names)}"
+        # a pipeline exits with the code of zstd, the codes of tar and of a failed zstd are passed back on fd 4
+        return ["sh", "-c", f"exec 3>&1; codes=$( {{ {{ {tar}; echo $? >&4; }} | zstd -q -c >&3 || echo $? >&4; }} 4>&1 ); "
+            'for code in $codes; do [ "$code" = 0 ] || exit $code; done'], "tar.zst"
+    return ["tar", "czf", "-"] + options + ["-C", directory] + names, "tar.gz"
+
+#Below shell script copies the log files under a directory that overlap the --since window, newest first.
+#Files are selected by mtime, lines before the window start are dropped (continuation lines such as stack traces
+#follow the line they belong to), rotated .gz files are read decompressed and the copy stops at the byte budget.
+#The selection is printed as a compressed tar stream with a logs/ prefix
+WINDOW_LOGS_SCRIPT = r"""
+MINUTES=%(minutes)d
+SINCE='%(since)s'
+BUDGET=%(budget)d
+USED=0
+TMP=$(mktemp -d 2>/dev/null || echo /tmp/pulsar-diag-logs-$$)
+mkdir -p "$TMP/out/logs"
+trap 'rm -rf "$TMP"' EXIT
+cd %(directory)s || exit 2
+if [ $MINUTES -gt 0 ]; then AGE="-mmin -$MINUTES"; else AGE=""; fi
+# newest first over all the files in one sort, one name per line so that names with spaces stay whole
+find . -type f $AGE -exec stat -c '%%Y %%n' {} + | sort -rn | cut -d ' ' -f 2- > "$TMP/files"
+while IFS= read -r f <&3; do
+    case "$f" in *.gz) reader="gzip -dc";; *) reader="cat";; esac
+    name=${f#./}
+    name=${name%%.gz}
+    if [ -n "$SINCE" ]; then
+        $reader "$f" | awk -v since="$SINCE" '/^[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9][T ][0-9][0-9]:[0-9][0-9]:[0-9][0-9]/ { ts = substr($0, 1, 19); sub("T", " ", ts); keep = (ts >= since) } keep' > "$TMP/part"
+    else
+        $reader "$f" > "$TMP/part"
+    fi
+    size=$(wc -c < "$TMP/part")
+    [ $size -eq 0 ] && continue
+    mkdir -p "$TMP/out/logs/$(dirname "$name")"
+    if [ $BUDGET -gt 0 ]; then
+        left=$((BUDGET - USED))
+        [ $left -le 0 ] && break
+        if [ $size -gt $left ]; then
+            tail -c $left "$TMP/part" > "$TMP/out/logs/$name"
+            size=$left
+        else
+            mv "$TMP/part" "$TMP/out/logs/$name"
+        fi
+        USED=$((USED + size))
+    else
+        mv "$TMP/part" "$TMP/out/logs/$name"
+    fi
+done 3< "$TMP/files"
+%(pack)s
+"""
+
+#Below function parses a duration like 90s, 30m, 1h or 1h30m
+def parse_duration(value):
+    parts = re.findall(r"(\d+)([smhd])", value)
+    if not parts or "".join(number + unit for number, unit in parts) != value:
+        raise argparse.ArgumentTypeError(f"invalid duration '{value}', expected e.g. 30m, 1h or 1h30m")
+    units = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+    return timedelta(seconds=sum(int(number) * units[unit] for number, unit in parts))
+
+#Below function parses an RFC3339 timestamp like 2024-05-01T10:00:00Z, naive times are taken as UTC
+def parse_since_time(value):
+    try:
+        since = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid timestamp '{value}', expected e.g. 2024-05-01T10:00:00Z")
+    return since.astimezone(timezone.utc) if since.tzinfo else since.replace(tzinfo=timezone.utc)
+
+#Below function parses a byte size like 500000, 200K, 50M or 1G
+def parse_size(value):
+    match = re.fullmatch(r"(\d+)([KMG]?)B?", value.strip().upper())
+    if not match:
+        raise argparse.ArgumentTypeError(f"invalid size '{value}', expected e.g. 50M")
+    return int(match.group(1)) * {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}[match.group(2)]
+
+#Below function returns the start of the --since/--since-time window in UTC, or None when collecting everything
+def log_window_start(args):
+    if args.since_time:
+        return args.since_time
+    if args.since:
+        return datetime.now(timezone.utc) - args.since
+    return None
+
+#Below function builds the kubectl logs command of a pod limited to the window, `since` (an RFC3339 time) resumes the
+#stream where an incremental run stopped. The byte budget is applied by the reader to the end of the stream
+#(log_tail_bytes), --limit-bytes would keep its start and apply to each container
+def kubectl_logs_command(args, pod, since=None, timestamps=False):
+    command = ["kubectl", "-n", args.namespace, "logs", pod, "--all-containers=true"]
+    if timestamps:
+        # every line starts with [pod/<pod>/<container>] and the time the runtime wrote it
+        command += ["--prefix=true", "--timestamps=true"]
+    if since:
+        command.append(f"--since-time={since}")
+    elif args.since:
+        command.append(f"--since={int(args.since.total_seconds())}s")
+    elif args.since_time:
+        command.append(f"--since-time={args.since_time.strftime('%Y-%m-%dT%H:%M:%SZ')}")
+    return command
+
+#Below function returns how many of the newest bytes of a container log stream are kept, 0 for all of them
+def log_tail_bytes(args):
+    return args.max_bytes_per_pod or 0
+
+#Below function builds the docker logs command of a container limited to the window or resumed from `since`
+def docker_logs_command(args, container_id, since=None, timestamps=False):
+    command = ["docker", "logs"] + (["--timestamps"] if timestamps else [])
+    window_start = log_window_start(args)
+    if since:
+        command += ["--since", since]
+    elif window_start:
+        command += ["--since", window_start.strftime("%Y-%m-%dT%H:%M:%SZ")]
+    return command + [container_id]
+
+#Below function returns the in-pod command streaming /pulsar/logs as a compressed tar, and its file extension.
+#Without a window or budget the whole directory is tarred, otherwise WINDOW_LOGS_SCRIPT selects and trims the files
+def pod_logs_copy_command(args, compression, exclude=()):
+    since = log_window_start(args)
+    if not since and not args.max_bytes_per_pod:
+        return in_pod_tar_command("/pulsar", ["logs"], compression, exclude)
+    pack, extension = in_pod_tar_command('"$TMP/out"', ["logs"], compression)
+    script = WINDOW_LOGS_SCRIPT % {
+        "directory": "/pulsar/logs",
+        # whole minutes rounded up, plus one extra minute so a file written just before the window start is still considered
+        "minutes": int((datetime.now(timezone.utc) - since).total_seconds() // 60) + 2 if since else 0,
+        "since": since.strftime("%Y-%m-%d %H:%M:%S") if since else "",
+        "budget": args.max_bytes_per_pod or 0,
+        "pack": " ".join(pack) if compression != "zstd" else pack[2],
+    }
+    return ["sh", "-c", script], extension
+
+DEDUP_SEGMENT_LINES = 1000
+DEDUP_HEREDOC = "@@DIAG_DEDUP_EOF"
+# a segment starts on a timestamped line, which is unique enough to be found again in the log files
+DEDUP_ANCHOR = re.compile(rb"^(?:\d{4}-\d{2}-\d{2}[T ])?\d{2}:\d{2}:\d{2}")
+
+#Below shell script looks for the segments of the container log stream in the uncompressed files of a directory.
+#A candidate starts on the line equal to the first line of a segment and has to end, as many lines later, on its
+#last line. The lines in between are hashed by md5sum in the same awk pass, and the candidates whose hash is the
+#one of the segment are printed as "segment start end file"
+DEDUP_LOGS_SCRIPT = r"""
+TMP=$(mktemp -d 2>/dev/null || echo /tmp/pulsar-diag-dedup-$$)
+mkdir -p "$TMP"
+trap 'rm -rf "$TMP"' EXIT
+cat > "$TMP/first" <<'%(eof)s'
+%(first)s
+%(eof)s
+cat > "$TMP/last" <<'%(eof)s'
+%(last)s
+%(eof)s
+cat > "$TMP/segments" <<'%(eof)s'
+%(segments)s
+%(eof)s
+cd %(directory)s || exit 2
+set -- *.log
+[ -f "$1" ] || exit 0
+LC_ALL=C awk -v tmp="$TMP" '
+BEGIN {
+    while ((getline line < (tmp "/first")) > 0) { n++; if (!(line in first)) first[line] = n }
+    n = 0
+    while ((getline line < (tmp "/last")) > 0) { n++; last[n] = line }
+    n = 0
+    while ((getline line < (tmp "/segments")) > 0) { n++; split(line, field, " "); count[n] = field[1] + 0 }
+}
+FNR == 1 && seg { close(cmd); seg = 0 }
+!seg && ($0 in first) { seg = first[$0]; start = FNR; k++; cmd = "md5sum > " tmp "/hash." k }
+seg {
+    print | cmd
+    if (FNR == start + count[seg] - 1) {
+        close(cmd)
+        if ($0 == last[seg]) print seg, start, FNR, k, FILENAME
+        seg = 0
+    }
+}
+' "$@" > "$TMP/candidates"
+while read seg start end k file; do
+    expected=$(sed -n "${seg}p" "$TMP/segments")
+    read hash rest < "$TMP/hash.$k"
+    [ "$hash" = "${expected#* }" ] && echo "$seg $start $end $file"
+done < "$TMP/candidates"
+"""
+
+#Below class follows the container log stream of a pod while it is copied and cuts it into segments of about
+#DEDUP_SEGMENT_LINES lines, each starting on a timestamped line, with their md5. Only the segment being built is
+#kept in memory
+class LogSegmenter:
+    def __init__(self, stream=None):
+        self.stream = stream
+        self.segments = []
+        self.pending = b""
+        self.line_no = 0
+        self.current = None
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.feed(data)
+        return data
+
+    def feed(self, data):
+        lines = (self.pending + data).split(b"\n")
+        # the last piece is an incomplete line until the next read
+        self.pending = lines.pop()
+        for line in lines:
+            self.line_no += 1
+            if (self.current is None or len(self.current[1]) >= DEDUP_SEGMENT_LINES) and DEDUP_ANCHOR.match(line):
+                self.close_segment()
+                self.current = (self.line_no, [])
+            if self.current is not None:
+                self.current[1].append(line)
+
+    def close_segment(self):
+        if self.current is None:
+            return
+        start, lines = self.current
+        self.current = None
+        try:
+            first, last = lines[0].decode(), lines[-1].decode()
+        except UnicodeDecodeError:
+            return
+        # the first and last lines travel in a heredoc of DEDUP_LOGS_SCRIPT
+        if DEDUP_HEREDOC in (first, last) or "\0" in first + last:
+            return
+        data = b"\n".join(lines) + b"\n"
+        self.segments.append({"start": start, "lines": len(lines), "bytes": len(data), "md5": hashlib.md5(data).hexdigest(), "first": first, "last": last})
+
+    def finish(self):
+        self.close_segment()
+        return self.segments
+
+#Below function returns the segments of a local log file
+def log_file_segments(path):
+    segmenter = LogSegmenter()
+    with open(path, "rb") as f:
+        for data in iter(lambda: f.read(BUNDLE_CHUNK_BYTES), b""):
+            segmenter.feed(data)
+    return segmenter.finish()
+
+#Below function looks for the segments of the container log stream of a pod in its /pulsar/logs files and returns
+#the regions of these files the stream already holds, as {file: [[start, end, log start, log end, bytes], ...]}
+#with consecutive segments merged into one region
+def find_duplicate_log_regions(exec_prefix, segments, deadline=None):
+    if not segments:
+        return {}
+    script = DEDUP_LOGS_SCRIPT % {
+        "eof": DEDUP_HEREDOC,
+        "directory": "/pulsar/logs",
+        "first": "\n".join(segment["first"] for segment in segments),
+        "last": "\n".join(segment["last"] for segment in segments),
+        "segments": "\n".join(f"{segment['lines']} {segment['md5']}" for segment in segments),
+    }
+    command = exec_prefix + ["sh", "-s"]
+    with command_slot(command), command_call(command) as call:
+        process, writer = start_script_session(command, script)
+        call["forked"] = not isinstance(process, KubeApiProcess)
+        timer = threading.Timer(remaining_time(deadline), process.kill) if deadline is not None else None
+        if timer:
+            timer.start()
+        try:
+            output = process.stdout.read()
+            writer.join()
+            err = process.stderr.read()
+            process.wait()
+        finally:
+            if timer:
+                timer.cancel()
+        call["rc"] = process.returncode
+        call["bytes"] = len(output)
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, command[:len(exec_prefix) + 2], stderr=err)
+    regions = {}
+    for line in output.splitlines():
+        seg, start, end, name = line.split(" ", 3)
+        segment = segments[int(seg) - 1]
+        file_regions = regions.setdefault(name, [])
+        previous = file_regions[-1] if file_regions else None
+        if previous and previous[1] + 1 == int(start) and previous[3] + 1 == segment["start"]:
+            previous[1] = int(end)
+            previous[3] = segment["start"] + segment["lines"] - 1
+            previous[4] += segment["bytes"]
+        else:
+            file_regions.append([int(start), int(end), segment["start"], segment["start"] + segment["lines"] - 1, segment["bytes"]])
+    return regions
+
+#Below function returns the in-pod command printing a log file with its duplicate regions replaced by a reference
+#line to the lines of the container log stream holding them
+def dedup_log_file_command(name, regions, log_name):
+    command = ["sed"]
+    for start, end, log_start, log_end, _ in regions:
+        command += ["-e", f"{start},{end}c\\", "-e", f"[pulsar-diag dedup] {end - start + 1} lines identical to lines {log_start}-{log_end} of {log_name}"]
+    return command + [f"/pulsar/logs/{name}"]
+
+#Below function returns dedup.json, the map of the regions replaced in each log file of a pod
+def dedup_manifest(log_name, regions):
+    return json.dumps({"log": log_name, "files": {name: [{"lines": [start, end], "log_lines": [log_start, log_end], "bytes": size}
+        for start, end, log_start, log_end, size in file_regions] for name, file_regions in regions.items()}}, indent=2)
+
+#Below function tells whether --dedup-logs applies: the incremental and windowed copies already trim the files
+def dedup_logs_enabled(args):
+    return args.dedup_logs and not args.manifest and not log_window_start(args) and not args.max_bytes_per_pod
+
+#Below function returns the duplicate regions of the /pulsar/logs files of a pod, none when they cannot be found
+def pod_duplicate_log_regions(args, pod, segments, deadline=None):
+    logger = logging.getLogger("LogsCollector")
+    try:
+        regions = find_duplicate_log_regions(["kubectl", "-n", args.namespace, "exec", "-i", pod, "--"], segments, deadline)
+    except Exception as e:
+        logger.error(f"Error looking for duplicate logs in pod {pod}, copying all of /pulsar/logs: {e}")
+        return {}
+    saved = sum(region[4] for file_regions in regions.values() for region in file_regions)
+    logger.debug(f"{pod}: {saved} bytes of {', '.join(regions) or 'no file'} in /pulsar/logs are already in the container log stream")
+    return regions
+
+#Below function streams the logs of a single kube pod into the bundle: the kubectl logs output gzipped locally
+#and /pulsar/logs tarred and compressed inside the pod
+def bundle_pod_logs(args, component, pod, deadline):
+    logger = logging.getLogger("LogsCollector")
+    bundle = args.bundle_writer
+    exec_prefix = ["kubectl", "-n", args.namespace, "exec", pod, "--"]
+    # with --dedup-logs the stream is cut into segments while it is stored
+    segmenter = LogSegmenter() if dedup_logs_enabled(args) else None
+    def add_log_stream(stdout):
+        if segmenter:
+            segmenter.stream = stdout
+        return bundle.add_stream(f"logs/{component}/{pod}/{pod}.log.gz", segmenter or stdout, compress=True)
+    size, rc, err = stream_command(kubectl_logs_command(args, pod), add_log_stream, deadline, log_tail_bytes(args))
+    if rc != 0:
+        raise subprocess.CalledProcessError(rc, "kubectl logs", stderr=err)
+    exclude = []
+    if segmenter:
+        regions = pod_duplicate_log_regions(args, pod, segmenter.finish(), deadline)
+        for name, file_regions in list(regions.items()):
+            _, rc, err = bundle.add_command(f"logs/{component}/{pod}/logs/{name}.gz", exec_prefix + dedup_log_file_command(name, file_regions, f"{pod}.log"),
+                compress=True, deadline=deadline)
+            if rc != 0:
+                logger.error(f"Error copying {name} from pod {pod} without its duplicate lines, it is copied whole: {err.strip()}")
+                del regions[name]
+                continue
+            exclude.append(f"logs/{name}")
+        if regions:
+            bundle.add_stream(f"logs/{component}/{pod}/dedup.json", io.BytesIO(dedup_manifest(f"{pod}.log", regions).encode()))
+    tar_command, extension = pod_logs_copy_command(args, args.bundle_compression, exclude)
+    size, rc, err = bundle.add_command(f"logs/{component}/{pod}/logs.{extension}", exec_prefix + tar_command, deadline=deadline)
+    # GNU tar exits 1 when a log file grows while it is read, the archive is still complete
+    if rc not in (0, 1):
+        logger.error(f"Error streaming logs from pod {pod}: {err.strip()}")
+    else:
+        logger.debug(f"Successfully streamed {component.capitalize()} Logs from pod {pod} ({size} bytes)")
+
+#Below function streams the logs of a docker container into the bundle, the log stream as <prefix>/<name>.log.gz and
+#/pulsar/logs as <files_prefix>.tar.gz
+def bundle_docker_logs(args, container_name, container_id, prefix="logs", files_prefix=None):
+    logger = logging.getLogger("LogsCollector")
+    bundle = args.bundle_writer
+    try:
+        size, rc, err = bundle.add_command(f"{prefix}/{container_name}.log.gz", docker_logs_command(args, container_id), compress=True, tail_bytes=log_tail_bytes(args))
+        if rc != 0:
+            logger.error(f"Failed to collect logs from container {container_name}: {err.strip()}")
+        tar_command, extension = pod_logs_copy_command(args, args.bundle_compression)
+        size, rc, err = bundle.add_command(f"{files_prefix or f'logs/{container_name}/logs'}.{extension}", ["docker", "exec", container_id] + tar_command)
+        if rc not in (0, 1):
+            record_unit(args, f"logs:{container_name}", err.strip())
+            logger.error(f"Failed to stream logs from container {container_name}: {err.strip()}")
+            return
+        record_unit(args, f"logs:{container_name}")
+        logger.info(f"Successfully streamed logs from container {container_name} into {bundle.path}")
+    except Exception as e:
+        record_unit(args, f"logs:{container_name}", e)
+        logger.error(f"Failed to collect logs from container {container_name}: {e}")
+
+#Below function adds whatever was written to the output directory (describe output, tenants report...) to the
+#bundle and closes it
+def finish_bundle(args):
+    logger = logging.getLogger("Bundle")
+    bundle = args.bundle_writer
+    for root, _, files in os.walk(args.output_dir):
+        for file in sorted(files):
+            path = os.path.join(root, file)
+            if os.path.abspath(path) == os.path.abspath(bundle.path):
+                continue
+            # In incremental mode the logs and configs went into the bundle as deltas, except the per-pod config store
+            # of --config-all-pods which is only written locally
+            parts = os.path.relpath(path, args.output_dir).split(os.sep)
+            if args.manifest and parts[0] in ("logs", "conf") and not (parts[0] == "conf" and parts[1] in POD_CONFIG_STORE_ENTRIES):
+                continue
+            if file.startswith(("diag_manifest.json", "diag_journal.jsonl", "run_report.json", "run_trace.json")):
+                continue
+            bundle.add_file(path, os.path.relpath(path, args.output_dir))
+    bundle.close()
+    logger.info(f"Wrote diagnostics bundle {bundle.path} ({os.path.getsize(bundle.path)} bytes)")
+
+#Below class is the journal of completed work units (pod logs, config files, describe output, retention policies,
+#namespaces and topic stats), appended to diag_journal.jsonl as each unit finishes. With --resume the statuses of
+#the previous run are loaded so finished units are skipped and only failed or missing ones are collected again
+class DiagJournal:
+    def __init__(self, path, resume=False):
+        self.path = path
+        self.lock = threading.Lock()
+        self.status = {}
+        self.resuming = resume and os.path.exists(path)
+        if self.resuming:
+            with open(path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # the last line may be cut short when the previous run was killed
+                        continue
+                    self.status[entry["unit"]] = entry
+        self.file = open(path, "a" if self.resuming else "w")
+        if self.resuming and self.file.tell():
+            with open(path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    self.file.write("\n")
+
+    def done(self, unit):
+        return self.resuming and self.status.get(unit, {}).get("status") == "done"
+
+    def record(self, unit, error=None):
+        entry = {"unit": unit, "status": "failed" if error else "done", "time": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")}
+        if error:
+            entry["error"] = str(error)[:500]
+        with self.lock:
+            # flushed per unit so a killed run keeps everything it finished
+            self.file.write(json.dumps(entry) + "\n")
+            self.file.flush()
+            self.status[unit] = entry
+
+    def counts(self):
+        with self.lock:
+            done = sum(1 for entry in self.status.values() if entry["status"] == "done")
+            return done, len(self.status) - done
+
+    def close(self):
+        with self.lock:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.file.close()
+
+#Below function tells whether a unit already finished in the run being resumed
+def unit_done(args, unit):
+    return args.journal is not None and args.journal.done(unit)
+
+#Below function records a finished (or failed, when error is given) unit in the journal
+def record_unit(args, unit, error=None):
+    if args.journal is not None:
+        args.journal.record(unit, error)
+
+#Below class is the checkpoint manifest of incremental runs, kept as diag_manifest.json in the output directory.
+#Per pod (or container) it records the files of every collected directory with their size, mtime, md5 hash and
+#bytes left out by the window or budget, and the timestamp of the last line read from the log stream of each
+#container, plus the time each topic's stats were last taken
+class DiagManifest:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.data = {"version": 1, "runs": [], "pods": {}, "topics": {}}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.data.update(json.load(f))
+
+    def files(self, unit, directory):
+        with self.lock:
+            return dict(self.data["pods"].get(unit, {}).get("files", {}).get(directory, {}))
+
+    def update_files(self, unit, directory, entries):
+        with self.lock:
+            self.data["pods"].setdefault(unit, {}).setdefault("files", {})[directory] = entries
+
+    def logs_until(self, unit):
+        with self.lock:
+            return self.data["pods"].get(unit, {}).get("logs_until")
+
+    def set_logs_until(self, unit, timestamps):
+        with self.lock:
+            self.data["pods"].setdefault(unit, {})["logs_until"] = timestamps
+
+    def record_topic(self, topic):
+        with self.lock:
+            self.data["topics"][topic] = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+    def save(self, run_id=None):
+        with self.lock:
+            if run_id and run_id not in self.data["runs"]:
+                self.data["runs"].append(run_id)
+            # Write to a temporary file first so an interrupted save never leaves a truncated manifest
+            with open(f"{self.path}.tmp", "w") as f:
+                json.dump(self.data, f, indent=1, sort_keys=True)
+            os.replace(f"{self.path}.tmp", self.path)
+
+#Below shell script lists the files of a directory as "size mtime md5 prefix-md5 name", the name last so that it
+#may hold spaces. Files whose size and mtime match the previous run are not hashed ("-"), and prefix-md5 is the
+#hash of the first previous-size bytes, which tells whether a file only grew since then
+INCREMENTAL_LIST_SCRIPT = r"""
+cd %(directory)s || exit 2
+TMP=$(mktemp -d 2>/dev/null || echo /tmp/pulsar-diag-list-$$)
+mkdir -p "$TMP"
+trap 'rm -rf "$TMP"' EXIT
+cat > "$TMP/prev" <<'EOF_PREV'
+%(previous)s
+EOF_PREV
+%(find)s | while IFS= read -r f; do
+    [ -f "$f" ] || continue
+    name=${f#./}
+    set -- $(stat -c '%%s %%Y' "$f")
+    size=$1; mtime=$2
+    prev=$(n="$name" awk '{ size = $1; mtime = $2; sub(/^[^ ]+ [^ ]+ /, "") } $0 == ENVIRON["n"] { print size, mtime; exit }' "$TMP/prev")
+    if [ "$prev" = "$size $mtime" ]; then echo "$size $mtime - - $name"; continue; fi
+    hash=$(head -c $size "$f" | md5sum | cut -d' ' -f1)
+    prefix=-
+    psize=$(echo $prev | cut -d' ' -f1)
+    if [ -n "$psize" ] && [ $psize -lt $size ]; then prefix=$(head -c $psize "$f" | md5sum | cut -d' ' -f1); fi
+    echo "$size $mtime $hash $prefix $name"
+done
+"""
+
+#Below shell script streams the planned "offset size label name" byte ranges of a directory as a compressed tar,
+#each range stored as <label>/<name>
+INCREMENTAL_FETCH_SCRIPT = r"""
+cd %(directory)s || exit 2
+TMP=$(mktemp -d 2>/dev/null || echo /tmp/pulsar-diag-fetch-$$)
+mkdir -p "$TMP/out"
+trap 'rm -rf "$TMP"' EXIT
+while read -r offset size label name; do
+    [ -n "$name" ] || continue
+    mkdir -p "$TMP/out/$label/$(dirname "$name")"
+    head -c $size "$name" | tail -c +$((offset + 1)) > "$TMP/out/$label/$name"
+done <<'EOF_PLAN'
+%(plan)s
+EOF_PLAN
+%(pack)s
+"""
+
+#Below function compares a directory listing with the manifest and returns the (offset, size, name, local offset)
+#byte ranges to fetch and the new manifest entries. Grown files are fetched from their previous size, changed or
+#new files from the start. Files last written before `window_start` are left out, and with a `budget` the newest
+#files are fetched first and the range that does not fit is cut to its last bytes. The bytes left out of a file
+#are counted in its "skipped", so its local copy continues at <size - skipped>. `have_local` tells whether the
+#previously fetched content of a file is still available
+def incremental_plan(previous, listing, have_local=None, window_start=None, budget=0):
+    ranges = []
+    entries = {}
+    for line in listing.splitlines():
+        parts = line.split(" ", 4)
+        if len(parts) != 5:
+            continue
+        size, mtime, file_hash, prefix, name = parts
+        size, mtime = int(size), int(mtime)
+        old = previous.get(name)
+        if old and have_local and not have_local(name, old):
+            old = None
+        if file_hash == "-" and old:
+            entries[name] = old
+            continue
+        grown = old and prefix == old["hash"]
+        entries[name] = {"size": size, "mtime": mtime, "hash": file_hash, "skipped": old.get("skipped", 0) if grown else 0}
+        if old and file_hash == old["hash"]:
+            entries[name]["skipped"] = old.get("skipped", 0)
+            continue
+        offset = old["size"] if grown else 0
+        if window_start and mtime < window_start:
+            entries[name]["skipped"] += size - offset
+            continue
+        if size > offset:
+            ranges.append((mtime, offset, size, name))
+    plan = []
+    left = budget
+    for mtime, offset, size, name in sorted(ranges, key=lambda item: -item[0]) if budget else ranges:
+        if budget:
+            start = max(offset, size - left)
+            entries[name]["skipped"] += start - offset
+            left -= size - start
+            if start == size:
+                continue
+            offset = start
+        plan.append((offset, size, name, offset - entries[name]["skipped"]))
+    return plan, entries
+
+#Below function writes the <offset>/<name> ranges of an incremental fetch into a local directory, appending the
+#grown files at their previous size
+def apply_incremental_tar(stream, destination):
+    with tarfile.open(fileobj=stream, mode="r|gz") as tar:
+        for member in tar:
+            if not member.isfile():
+                continue
+            offset, _, name = member.name.lstrip("./").partition("/")
+            path = os.path.normpath(os.path.join(destination, name))
+            if not offset.isdigit() or not path.startswith(os.path.normpath(destination) + os.sep):
+                continue
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "r+b" if os.path.exists(path) else "wb") as f:
+                f.truncate(int(offset))
+                f.seek(int(offset))
+                shutil.copyfileobj(tar.extractfile(member), f, BUNDLE_CHUNK_BYTES)
+
+#Below function copies only the new bytes and changed files of a pod/container directory since the previous run.
+#`names` restricts the copy to these files, `window_start` (epoch seconds) and `budget` limit it like the log window,
+#the result lands in `destination` or, in bundle mode, in `bundle_entry` with the ranges under their file offset
+def incremental_copy(args, exec_prefix, unit, directory, destination, bundle_entry, names=None, deadline=None, window_start=None, budget=0):
+    logger = logging.getLogger("IncrementalCollector")
+    previous = args.manifest.files(unit, directory)
+    have_local = None
+    if not args.bundle_writer:
+        local_size = lambda name: os.path.getsize(os.path.join(destination, name)) if os.path.exists(os.path.join(destination, name)) else 0
+        have_local = lambda name, old: local_size(name) >= old["size"] - old.get("skipped", 0)
+    list_script = INCREMENTAL_LIST_SCRIPT % {
+        "directory": directory,
+        "previous": "\n".join(f"{entry['size']} {entry['mtime']} {name}" for name, entry in previous.items()),
+        "find": f"ls {' '.join(names)} 2>/dev/null" if names else "find . -type f",
+    }
+    listing = run_command(exec_prefix + ["sh", "-c", list_script], capture_output=True, text=True, check=True, timeout=remaining_time(deadline))
+    plan, entries = incremental_plan(previous, listing.stdout, have_local, window_start, budget)
+    fetched = sum(size - offset for offset, size, _, _ in plan)
+    logger.debug(f"{unit}:{directory} {len(plan)} of {len(entries)} files changed, fetching {fetched} bytes")
+    if plan:
+        pack, extension = in_pod_tar_command('"$TMP/out"', ["."], "gzip")
+        fetch_script = INCREMENTAL_FETCH_SCRIPT % {
+            "directory": directory,
+            "plan": "\n".join(f"{offset} {size} {offset if args.bundle_writer else local} {name}" for offset, size, name, local in plan),
+            "pack": " ".join(pack),
+        }
+        command = exec_prefix + ["sh", "-c", fetch_script]
+        if args.bundle_writer:
+            _, rc, err = args.bundle_writer.add_command(bundle_entry, command, deadline=deadline)
+        else:
+            os.makedirs(destination, exist_ok=True)
+            _, rc, err = stream_command(command, lambda stdout: apply_incremental_tar(stdout, destination), deadline)
+        if rc != 0:
+            raise subprocess.CalledProcessError(rc, command[:len(exec_prefix) + 2], stderr=err)
+    args.manifest.update_files(unit, directory, entries)
+    return fetched
+
+#Below function returns a comparable key of an RFC3339 timestamp of kubectl or docker logs --timestamps, whose
+#fraction of a second comes with a varying number of digits
+def log_timestamp_key(stamp):
+    seconds, _, fraction = stamp.rstrip("Z").partition(".")
+    return f"{seconds}.{fraction.ljust(9, '0')}"
+
+#Below class reads a kubectl logs --prefix --timestamps or docker logs --timestamps stream without the prefixes and
+#timestamps. The lines of a container not later than the last one the previous run took from it (`after`, by
+#container, "*" for all of them) are left out, and `last` maps each container to the timestamp of its last line
+class TimestampedLogReader(io.RawIOBase):
+    def __init__(self, stream, after=None):
+        self.lines = iter(stream)
+        self.after = {container: log_timestamp_key(stamp) for container, stamp in (after or {}).items()}
+        self.last = {}
+        self.pending = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        chunks = [self.pending]
+        size = len(self.pending)
+        while size < len(buffer):
+            line = next(self.lines, None)
+            if line is None:
+                break
+            container = ""
+            if line.startswith(b"["):
+                prefix, _, line = line.partition(b"] ")
+                container = prefix.decode(errors="replace").rpartition("/")[2]
+            stamp, _, text = line.partition(b" ")
+            stamp = stamp.decode(errors="replace")
+            after = self.after.get(container, self.after.get("*"))
+            if after is not None and log_timestamp_key(stamp) <= after:
+                continue
+            self.last[container] = stamp
+            chunks.append(text)
+            size += len(text)
+        data = b"".join(chunks)
+        size = min(len(buffer), len(data))
+        buffer[:size] = data[:size]
+        self.pending = data[size:]
+        return size
+
+#Below function collects the logs of a pod or container incrementally: the log stream from the last line the
+#previous run took from each container, and the new bytes of /pulsar/logs within the window and budget
+def collect_logs_incremental(args, unit, exec_prefix, logs_command, output_file_path, bundle_prefix, deadline=None):
+    logger = logging.getLogger("IncrementalCollector")
+    until = args.manifest.logs_until(unit) or {}
+    if isinstance(until, str):
+        # manifests of older runs hold one time for every container
+        until = {"*": until}
+    # the API takes whole seconds, the lines of that second already collected are left out by the reader
+    since = min(until.values(), key=log_timestamp_key)[:19] + "Z" if until else None
+    command = logs_command(since)
+    tail_bytes = log_tail_bytes(args)
+
+    def consume(write):
+        def read(stdout):
+            stream = TimestampedLogReader(stdout, until)
+            (tail_consumer(write, tail_bytes) if tail_bytes else write)(stream)
+            return stream.last
+        return read
+
+    if args.bundle_writer:
+        last, rc, err = stream_command(command, consume(lambda stream: args.bundle_writer.add_stream(f"{bundle_prefix}/{unit}.log.gz", stream, compress=True)), deadline)
+    else:
+        os.makedirs(output_file_path, exist_ok=True)
+        with open(f"{output_file_path}/{unit}.log", "ab") as f:
+            last, rc, err = stream_command(command, consume(lambda stream: shutil.copyfileobj(stream, f, BUNDLE_CHUNK_BYTES)), deadline)
+    if rc != 0:
+        raise subprocess.CalledProcessError(rc, command[:3], stderr=err)
+    if last:
+        until = {container: stamp for container, stamp in until.items() if container != "*"}
+        until.update(last)
+        args.manifest.set_logs_until(unit, until)
+    window_start = log_window_start(args)
+    fetched = incremental_copy(args, exec_prefix, unit, "/pulsar/logs", f"{output_file_path}/logs", f"{bundle_prefix}/logs-delta.tar.gz", deadline=deadline,
+        window_start=window_start.timestamp() if window_start else None, budget=args.max_bytes_per_pod or 0)
+    logger.debug(f"Collected logs of {unit} since {since or 'the beginning'}, {fetched} new bytes of /pulsar/logs")
+
+#Below function collects the kubectl logs and the /pulsar/logs directory of a single kube pod
+def collect_pod_logs(args, component, pod):
+    logger = logging.getLogger("LogsCollector")
+    deadline = time.monotonic() + args.pod_timeout if args.pod_timeout else None
+    if args.manifest:
+        return collect_logs_incremental(args, pod, ["kubectl", "-n", args.namespace, "exec", pod, "--"], lambda since: kubectl_logs_command(args, pod, since, timestamps=True),
+            f"{args.output_dir}/logs/{component}/{pod}", f"logs/{component}/{pod}", deadline)
+    if args.bundle_writer:
+        return bundle_pod_logs(args, component, pod, deadline)
+    output_file_path = f"{args.output_dir}/logs/{component}/{pod}"
+    os.makedirs(output_file_path, exist_ok=True)
+    # Collect logs from running pods
+    logger.debug(f"Collecting {component.capitalize()} logs from pod {pod}")
+    log_file_path = f"{output_file_path}/{pod}.log"
+    copy_command_output(kubectl_logs_command(args, pod), log_file_path, deadline=deadline, tail_bytes=log_tail_bytes(args))
+    logger.debug(f"Successfully collected {component.capitalize()} Logs from pod {pod}")
+    if log_window_start(args) or args.max_bytes_per_pod:
+        # Only the files overlapping the window are transferred, trimmed in the pod
+        copy_command, _ = pod_logs_copy_command(args, "gzip")
+        rc, err = extract_command_tar(["kubectl", "-n", args.namespace, "exec", pod, "--"] + copy_command, output_file_path, deadline)
+        if rc not in (0, 1):
+            logger.error(f"Error copying logs from pod {pod}: {err.strip()}")
+        return
+    exclude = []
+    if dedup_logs_enabled(args):
+        exec_prefix = ["kubectl", "-n", args.namespace, "exec", pod, "--"]
+        regions = pod_duplicate_log_regions(args, pod, log_file_segments(log_file_path), deadline)
+        for name, file_regions in list(regions.items()):
+            try:
+                copy_command_output(exec_prefix + dedup_log_file_command(name, file_regions, f"{pod}.log"), f"{output_file_path}/{name}", deadline=deadline)
+                exclude.append(f"./{name}")
+            except Exception as e:
+                logger.error(f"Error copying {name} from pod {pod} without its duplicate lines, it is copied whole: {e}")
+                del regions[name]
+        if regions:
+            with open(f"{output_file_path}/dedup.json", "w") as f:
+                f.write(dedup_manifest(f"{pod}.log", regions))
+    if kube_api_backend is not None or exclude:
+        # the same layout as kubectl cp, streamed through the API or without the files copied above
+        tar_command, _ = in_pod_tar_command("/pulsar/logs", ["."], "gzip", exclude)
+        rc, err = extract_command_tar(["kubectl", "-n", args.namespace, "exec", pod, "--"] + tar_command, output_file_path, deadline)
+        if rc not in (0, 1):
+            logger.error(f"Error copying logs from pod {pod}: {err.strip()}")
+        return
+    # Copy logs from the pod
+    process = run_command(["kubectl", "-n", args.namespace, "cp", f"{pod}:/pulsar/logs/", output_file_path], stderr=subprocess.PIPE, stdout=subprocess.PIPE, timeout=remaining_time(deadline))
+    # Only print errors that are not the tar warning
+    if process.stderr and b"Removing leading '/'" not in process.stderr:
+        logger.error(f"Error copying logs from pod {pod}: {process.stderr.decode()}")
+    else:
+        logger.debug(f"Successfully copied {component.capitalize()} Logs from pod {pod}")
+
+#Below function collects the logs of a docker container. A single container keeps the flat layout (logs/<name>.log
+#and logs/logs/), the containers of a multi-node setup get the pod layout of kube under logs/<component>/<name>/
+def collect_container_logs(args, container_name, container_id, component=None):
+    logger = logging.getLogger("LogsCollector")
+    output_file_path = f"{args.output_dir}/logs/{component}/{container_name}" if component else f"{args.output_dir}/logs"
+    bundle_prefix = f"logs/{component}/{container_name}" if component else "logs"
+    os.makedirs(output_file_path, exist_ok=True)
+    if unit_done(args, f"logs:{container_name}"):
+        logger.info(f"Logs of container {container_name} were collected by the resumed run, skipping")
+        return
+    logger.info(f"Collecting logs from container {container_name}...")
+    if args.manifest:
+        try:
+            collect_logs_incremental(args, container_name, ["docker", "exec", container_id], lambda since: docker_logs_command(args, container_id, since, timestamps=True),
+                output_file_path, bundle_prefix, None)
+            record_unit(args, f"logs:{container_name}")
+            logger.info(f"Successfully collected new logs from container {container_name}")
+        except Exception as e:
+            record_unit(args, f"logs:{container_name}", e)
+            logger.error(f"Failed to collect logs from container {container_name}: {e}")
+        return
+    if args.bundle_writer:
+        bundle_docker_logs(args, container_name, container_id, bundle_prefix, f"{bundle_prefix}/logs" if component else f"logs/{container_name}/logs")
+        return
+    try:
+        copy_command_output(docker_logs_command(args, container_id), f"{output_file_path}/{container_name}.log", tail_bytes=log_tail_bytes(args))
+        if log_window_start(args) or args.max_bytes_per_pod:
+            copy_command, _ = pod_logs_copy_command(args, "gzip")
+            rc, err = extract_command_tar(["docker", "exec", container_id] + copy_command, output_file_path)
+            if rc not in (0, 1):
+                raise RuntimeError(err.strip())
+        else:
+            run_command(["docker", "cp", f"{container_id}:/pulsar/logs/." if component else f"{container_id}:/pulsar/logs/", output_file_path], stderr=subprocess.PIPE, check=True)
+        logger.info(f"Logs collected from {container_name} to {output_file_path}")
+        logger.info(f"Successfully collected logs from container {container_name}")
+        record_unit(args, f"logs:{container_name}")
+    except Exception as e:
+        record_unit(args, f"logs:{container_name}", e)
+        logger.error(f"Failed to collect logs from container {container_name}: {e}")
+
+#Below function collects logs from the docker containers and kube pods. `containers` lists the (name, id, component)
+#of every container of a multi-node docker setup, collected in parallel
+def collect_logs(args, broker_pods=None, proxy_pods=None, bookie_pods=None, zookeeper_pods=None, bastion_pods=None, container_name=None, container_id=None, containers=None):
     logger = logging.getLogger("LogsCollector")
     if args.type == "docker":
         logger.info("Collecting logs from Docker containers...")
-        output_file_path = f"{args.output_dir}/logs"
-        os.makedirs(output_file_path, exist_ok=True)
+        os.makedirs(f"{args.output_dir}/logs", exist_ok=True)
         try:
+            if containers:
+                tasks = [(component, name, collect_container_logs, (args, name, container_id, component)) for name, container_id, component in containers]
+                logger.info(f"Collecting logs from {len(tasks)} containers with {args.parallel} workers")
+                for component, name, error in run_in_pool(tasks, args.parallel, args.component_parallel):
+                    if error:
+                        logger.error(f"Unexpected error for container {name}: {error}")
+                return
             if not container_name:
                 logger.error("No container name provided. Exiting...")
                 return
-            logger.info(f"Collecting logs from container {container_name}...")
-            try:
-                with open(f"{output_file_path}/{container_name}.log", "w") as log_file:
-                    subprocess.run(["docker", "logs", container_id], stdout=log_file, stderr=subprocess.PIPE, check=True)
-                subprocess.run(["docker", "cp", f"{container_id}:/pulsar/logs/", output_file_path], stderr=subprocess.PIPE, check=True)
-                logger.info(f"Logs collected from {container_name} to {output_file_path}")
-                logger.info(f"Successfully collected logs from container {container_name}")
-            except Exception as e:
-                logger.error(f"Failed to collect logs from container {container_name}: {e}")
+            collect_container_logs(args, container_name, container_id)
         except Exception as e:
             logger.error(f"Unexpected error occurred while collecting Docker logs: {e}")
 
@@ -107,206 +2140,1239 @@ def collect_logs(args, broker_pods=None, proxy_pods=None, bookie_pods=None, zook
         logger.info("Collecting logs from kube")
         #create logs directory
         os.makedirs(f"{args.output_dir}/logs", exist_ok=True)
-        # Collect Broker logs
-        if not broker_pods:
-            logger.info(f"No running Broker pods found in namespace {args.namespace}")
-            return
-        logger.debug(f"Broker Pods: {broker_pods}")
-        for pod in broker_pods:
-            try:
-                output_file_path = f"{args.output_dir}/logs/broker/{pod}"
-                os.makedirs(output_file_path, exist_ok=True)
-                # Collect logs from running pods
-                logger.debug(f"Collecting Broker logs from pod {pod}")
-                log_file_path = f"{output_file_path}/{pod}.log"
-                with open(log_file_path, "w") as log_file:
-                    subprocess.run(["kubectl", "-n", args.namespace, "logs", pod, "--all-containers=true"],stdout=log_file,stderr=subprocess.PIPE,check=True)
-                    logger.debug(f"Successfully collected Broker Logs from pod {pod}")
-                # Copy logs from the pod
-                process = subprocess.Popen(["kubectl", "-n", args.namespace, "cp", f"{pod}:/pulsar/logs/", output_file_path],stderr=subprocess.PIPE,stdout=subprocess.PIPE)
-                _, err = process.communicate()
-                logger.debug(f"Successfully copied Broker Logs from pod {pod}")
-                # Only print errors that are not the tar warning
-                if err and b"Removing leading '/'" not in err:
-                    logger.error(f"Error copying logs from pod {pod}: {err.decode()}")
-            except subprocess.CalledProcessError as e:
-                logger.error(f"Error collecting logs for pod {pod}: {e}")
+        pods_by_component = {"broker": broker_pods, "proxy": proxy_pods, "bookie": bookie_pods, "zookeeper": zookeeper_pods}
+        tasks = []
+        skipped = 0
+        for component, pods in pods_by_component.items():
+            if not pods:
+                logger.info(f"No running {component.capitalize()} pods found in namespace {args.namespace}")
                 continue
-            except Exception as e:
-                logger.error(f"Unexpected error for pod {pod}: {e}")
+            logger.debug(f"{component.capitalize()} Pods: {pods}")
+            for pod in pods:
+                if unit_done(args, f"logs:{component}/{pod}"):
+                    skipped += 1
+                    continue
+                tasks.append((component, pod, collect_pod_logs, (args, component, pod)))
+        if skipped:
+            logger.info(f"Skipping {skipped} pods whose logs were collected by the resumed run")
+        logger.info(f"Collecting logs from {len(tasks)} pods with {args.parallel} workers")
+        for component, pod, error in run_in_pool(tasks, args.parallel, args.component_parallel):
+            record_unit(args, f"logs:{component}/{pod}", error)
+            if isinstance(error, subprocess.TimeoutExpired):
+                logger.error(f"Timed out after {args.pod_timeout}s collecting logs for pod {pod}")
+            elif isinstance(error, subprocess.CalledProcessError):
+                logger.error(f"Error collecting logs for pod {pod}: {error}")
+            elif error:
+                logger.error(f"Unexpected error for pod {pod}: {error}")
+        logger.info("Successfully collected all logs from all pods")
+
+    elif args.type == "standalone":
+        collect_standalone_logs(args)
+
+REPORT_BUFFER_BYTES = 1024 * 1024
+REPORT_CHECKPOINT_UNITS = 1000
+REPORT_CHECKPOINT_SECONDS = 5
+PARQUET_BATCH_ROWS = 10000
+
+#Below function parses the JSON printed by pulsar-admin, keeping the raw text when it is not JSON
+def parse_admin_output(lines):
+    try:
+        return json.loads("\n".join(lines))
+    except ValueError:
+        return "\n".join(lines)
+
+#Below class is the single buffered writer of the tenants report used by every way of walking the topics.
+#It writes the text report and/or tenants_namespaces_topics.jsonl (one record per tenant, namespace retention and
+#topic with its parsed stats). Finished units are handed to the journal only after the buffers they are in have
+#been flushed, in batches of REPORT_CHECKPOINT_UNITS or every REPORT_CHECKPOINT_SECONDS
+class TenantsReportWriter:
+    def __init__(self, args, output_file_path):
+        self.args = args
+        self.path = output_file_path
+        self.jsonl_path = os.path.join(os.path.dirname(output_file_path), "tenants_namespaces_topics.jsonl")
+        resuming = args.journal is not None and args.journal.resuming
+        self.text = None
+        self.jsonl = None
+        if args.report_format in ("text", "both"):
+            append = resuming and os.path.exists(output_file_path)
+            self.text = open(output_file_path, "a" if append else "w", buffering=REPORT_BUFFER_BYTES)
+            if append:
+                self.text.write(f"\nResumed collection at {datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')}\n")
+            else:
+                self.text.write("Pulsar Tenants, Namespaces, and Topics\n")
+        if args.report_format in ("jsonl", "both") or args.parquet:
+            append = resuming and os.path.exists(self.jsonl_path)
+            self.jsonl = open(self.jsonl_path, "a" if append else "w", buffering=REPORT_BUFFER_BYTES)
+        self.pending = []
+        self.topics = 0
+        self.last_checkpoint = time.monotonic()
+
+    def _record(self, record):
+        if self.jsonl:
+            self.jsonl.write(json.dumps(record, separators=(",", ":")) + "\n")
+
+    def tenant(self, tenant):
+        if self.text:
+            self.text.write(f"\nTenant: {tenant}\n")
+        self._record({"type": "tenant", "tenant": tenant})
+
+    def namespace(self, namespace):
+        if self.text:
+            self.text.write(f"  Namespace: {namespace}\n")
+
+    def retention(self, namespace, lines, parsed=None):
+        if self.text:
+            self.text.write(f"          Retention Policies: {lines}\n")
+        self._record({"type": "namespace", "tenant": namespace.split("/")[0], "namespace": namespace,
+            "retention": parsed if parsed is not None else parse_admin_output(lines)})
+        self.done(f"retention:{namespace}")
+
+    def topic(self, topic):
+        if self.text:
+            self.text.write(f"     Topic: {topic}\n")
+
+    def stats(self, topic, lines, parsed=None):
+        if self.text:
+            self.text.write(f"          Stats: {lines}\n")
+        tenant, namespace = topic.partition("://")[2].split("/")[:2]
+        self._record({"type": "topic", "tenant": tenant, "namespace": f"{tenant}/{namespace}", "topic": topic,
+            "collected_at": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "stats": parsed if parsed is not None else parse_admin_output(lines)})
+        if self.args.manifest:
+            self.args.manifest.record_topic(topic)
+        self.topics += 1
+        self.done(f"stats:{topic}")
+
+    def internal_stats(self, topic, lines, parsed=None):
+        if self.text:
+            self.text.write(f"          Internal Stats: {lines}\n")
+        tenant, namespace = topic.partition("://")[2].split("/")[:2]
+        self._record({"type": "internal_stats", "tenant": tenant, "namespace": f"{tenant}/{namespace}", "topic": topic,
+            "collected_at": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "internal_stats": parsed if parsed is not None else parse_admin_output(lines)})
+        self.done(f"internal:{topic}")
+
+    def failed(self, unit, error):
+        self._record({"type": "error", "unit": unit, "error": str(error)[:500]})
+        record_unit(self.args, unit, error)
+
+    def done(self, unit):
+        self.pending.append(unit)
+        if len(self.pending) >= REPORT_CHECKPOINT_UNITS or time.monotonic() - self.last_checkpoint >= REPORT_CHECKPOINT_SECONDS:
+            self.checkpoint()
+
+    def checkpoint(self):
+        for f in (self.text, self.jsonl):
+            if f:
+                f.flush()
+        for unit in self.pending:
+            record_unit(self.args, unit)
+        self.pending = []
+        self.last_checkpoint = time.monotonic()
+
+    def close(self):
+        self.checkpoint()
+        for f in (self.text, self.jsonl):
+            if f:
+                f.close()
+        if self.args.parquet:
+            export_topics_parquet(self.jsonl_path, os.path.join(os.path.dirname(self.jsonl_path), "topics.parquet"))
+
+#Below function converts the topic records of the JSONL report into a Parquet file in batches, with the common
+#stats as columns and the full stats kept as JSON. pyarrow is only needed when --parquet is used
+def export_topics_parquet(jsonl_path, parquet_path):
+    logger = logging.getLogger("ParquetExport")
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        logger.error("--parquet needs pyarrow, install it with 'pip install pyarrow'")
+        return
+    columns = {"tenant": pyarrow.string(), "namespace": pyarrow.string(), "topic": pyarrow.string(), "collected_at": pyarrow.string(),
+        "msgRateIn": pyarrow.float64(), "msgRateOut": pyarrow.float64(), "msgThroughputIn": pyarrow.float64(), "msgThroughputOut": pyarrow.float64(),
+        "storageSize": pyarrow.int64(), "backlogSize": pyarrow.int64(), "publishers": pyarrow.int64(), "subscriptions": pyarrow.int64(), "stats_json": pyarrow.string()}
+    schema = pyarrow.schema(list(columns.items()))
+    rows = 0
+
+    def to_table(batch):
+        return pyarrow.Table.from_pylist(batch, schema=schema)
+
+    with open(jsonl_path) as f, pyarrow.parquet.ParquetWriter(parquet_path, schema) as writer:
+        batch = []
+        for line in f:
+            record = json.loads(line)
+            if record.get("type") != "topic":
                 continue
-       
-        # Collect Proxy logs
-        if not proxy_pods:
-            logger.info(f"No running Proxy pods found in namespace {args.namespace}")
+            stats = record["stats"] if isinstance(record["stats"], dict) else {}
+            batch.append({"tenant": record["tenant"], "namespace": record["namespace"], "topic": record["topic"], "collected_at": record["collected_at"],
+                "msgRateIn": stats.get("msgRateIn"), "msgRateOut": stats.get("msgRateOut"),
+                "msgThroughputIn": stats.get("msgThroughputIn"), "msgThroughputOut": stats.get("msgThroughputOut"),
+                "storageSize": stats.get("storageSize"), "backlogSize": stats.get("backlogSize"),
+                "publishers": len(stats.get("publishers", [])), "subscriptions": len(stats.get("subscriptions", {})),
+                "stats_json": json.dumps(record["stats"], separators=(",", ":"))})
+            if len(batch) >= PARQUET_BATCH_ROWS:
+                writer.write_table(to_table(batch))
+                rows += len(batch)
+                batch = []
+        if batch:
+            writer.write_table(to_table(batch))
+            rows += len(batch)
+    logger.info(f"Exported {rows} topics to {parquet_path}")
+
+#Below shell script walks tenants, namespaces, retention policies, topics and topic stats inside the admin pod
+#in one session. Every lookup is framed as "@@DIAG <kind> <exit code> <key>" followed by its output and "@@END",
+#topic stats run in waves of $WORKERS background jobs and are printed in topic order. Lists already in the admin
+#lookup cache of the run are written into the session and read from there instead of pulsar-admin
+BULK_ADMIN_SCRIPT = r"""
+PA=/pulsar/bin/pulsar-admin
+WORKERS=%(workers)d
+TMP=$(mktemp -d 2>/dev/null || echo /tmp/pulsar-diag-$$)
+mkdir -p "$TMP"
+trap 'rm -rf "$TMP"' EXIT
+cat > "$TMP/done" <<'EOF_DONE'
+%(done)s
+EOF_DONE
+touch "$TMP/cached"
+%(cached)s
+done_unit() {
+    grep -qxF "$1" "$TMP/done"
+}
+emit() {
+    printf '@@DIAG %%s %%s %%s\n' "$1" "$3" "$2"
+    [ -n "$4" ] && printf '%%s\n' "$4"
+    printf '@@END\n'
+}
+call() {
+    kind=$1; key=$2; shift 2
+    out=$("$@" 2>"$TMP/err.$kind"); rc=$?
+    [ $rc -ne 0 ] && out=$(cat "$TMP/err.$kind")
+    emit "$kind" "$key" "$rc" "$out"
+    return $rc
+}
+lookup() {
+    n=$(awk -v kind="$1" -v key="$2" '$1 == kind && $2 == key { print $3 }' "$TMP/cached")
+    if [ -n "$n" ]; then
+        emit "$1" "$2" 0 "$(cat "$TMP/cached.$n")"
+        return 0
+    fi
+    call "$@"
+}
+flush() {
+    j=1
+    while [ $j -le $1 ]; do
+        cat "$TMP/$j.out" 2>/dev/null; rm -f "$TMP/$j.out" "$TMP/$j.err"
+        j=$((j+1))
+    done
+}
+topics_of() {
+    done_unit "namespace:$1" && return
+    out=$(lookup topics "$1" $PA topics list "$1") || { printf '%%s\n' "$out"; return; }
+    printf '%%s\n' "$out"
+    rm -f "$TMP/failed"
+    i=0
+    for topic in $(printf '%%s\n' "$out" | sed '1d;$d'); do
+        done_unit "stats:$topic" && continue
+        i=$((i+1))
+        ( s=$($PA topics stats "$topic" 2>"$TMP/$i.err"); rc=$?
+          [ $rc -ne 0 ] && s=$(cat "$TMP/$i.err") && touch "$TMP/failed"
+          emit stats "$topic" "$rc" "$s" > "$TMP/$i.out" ) &
+        if [ $i -ge $WORKERS ]; then wait; flush $i; i=0; fi
+    done
+    wait; flush $i
+    [ -f "$TMP/failed" ] || emit namespace_done "$1" 0 ""
+}
+tenants=$(lookup tenants - $PA tenants list) || { printf '%%s\n' "$tenants"; exit 0; }
+printf '%%s\n' "$tenants"
+for tenant in $(printf '%%s\n' "$tenants" | sed '1d;$d'); do
+    nss=$(lookup namespaces "$tenant" $PA namespaces list "$tenant") || { printf '%%s\n' "$nss"; continue; }
+    printf '%%s\n' "$nss"
+    for ns in $(printf '%%s\n' "$nss" | sed '1d;$d'); do
+        done_unit "retention:$ns" && done_unit "namespace:$ns" && continue
+        emit namespace "$ns" 0 ""
+        # a failed retention lookup does not skip the topics of the namespace
+        done_unit "retention:$ns" || call retention "$ns" $PA namespaces get-retention "$ns"
+        topics_of "$ns"
+    done
+done
+"""
+
+#Below function writes the tenant, namespace and topic lists of the admin lookup cache into the bulk admin session
+def bulk_cached_lists(args):
+    cache = getattr(args, "admin_cache", None)
+    if cache is None:
+        return ""
+    files = []
+    for kind in ("tenants", "namespaces", "topics"):
+        for name in cache.names(kind):
+            value = cache.peek(kind, name)
+            if isinstance(value, list):
+                files.append((kind, name, value))
+    lines = [f"cat > \"$TMP/cached\" <<'EOF_CACHED'"] + [f"{kind} {name} {n}" for n, (kind, name, _) in enumerate(files)] + ["EOF_CACHED"]
+    for n, (_, _, value) in enumerate(files):
+        lines += [f"cat > \"$TMP/cached.{n}\" <<'EOF_CACHED'"] + value + ["EOF_CACHED"]
+    return "\n".join(lines)
+
+#Below function starts a command with stdin a pipe and feeds it a script from a thread, so a large output cannot
+#block the write. It returns the process and the writer thread
+def start_script_session(command, script):
+    process = popen_command(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    writer = threading.Thread(target=lambda: (process.stdin.write(script), process.stdin.close()), daemon=True)
+    writer.start()
+    return process, writer
+
+#Below function reads the framed records of the bulk admin script one at a time, so memory stays bounded by one record
+def read_bulk_records(stream):
+    record = None
+    for line in stream:
+        line = line.rstrip("\n")
+        if record is None:
+            if line.startswith("@@DIAG "):
+                _, kind, rc, key = line.split(" ", 3)
+                record = (kind, key, int(rc), [])
+        elif line == "@@END":
+            yield record
+            record = None
+        else:
+            record[3].append(line)
+
+#Below function fetches tenants, namespaces, retention policies, topics and topic stats through a single exec session
+#instead of one exec (and one JVM start) per lookup. It writes the same report as the per call mode and returns
+#False when the session could not be started so the caller can fall back to it
+def bulk_fetch_tenants_info(args, exec_command, report):
+    logger = logging.getLogger("TenantsInfoCollector")
+    done_units = []
+    if args.journal is not None and args.journal.resuming:
+        done_units = [unit for unit, entry in args.journal.status.items() if entry["status"] == "done" and unit.split(":", 1)[0] in ("retention", "namespace", "stats")]
+    # the retention of namespaces with cached policies is written from them, the script skips it
+    cached = {}
+    for namespace in args.admin_cache.names("policies") if getattr(args, "admin_cache", None) is not None else []:
+        policies = cached_policies(args, namespace)
+        if policies is not None and not unit_done(args, f"retention:{namespace}"):
+            cached[namespace] = policies.get("retention_policies")
+    done_units += [f"retention:{namespace}" for namespace in cached]
+    script = BULK_ADMIN_SCRIPT % {"workers": max(1, args.bulk_admin_workers), "done": "\n".join(done_units),
+        "cached": bulk_cached_lists(args)}
+    logger.info(f"Fetching pulsar info in bulk mode with {args.bulk_admin_workers} in-pod workers")
+    records = 0
+    # the whole session holds one exec slot
+    with command_slot(exec_command), command_call(exec_command) as call:
+        process, writer = start_script_session(exec_command, script)
+        call["forked"] = not isinstance(process, KubeApiProcess)
+        stdout = CountingReader(process.stdout)
+        for kind, key, rc, lines in read_bulk_records(stdout):
+            records += 1
+            if kind == "tenants":
+                if rc != 0:
+                    logger.error(f"Error fetching tenants: {' '.join(lines)}")
+                logger.debug(f"Tenants: {lines}")
+            elif kind == "namespaces":
+                report.tenant(key)
+                if rc != 0:
+                    logger.error(f"Error fetching namespaces for tenant {key}: {' '.join(lines)}")
+                    continue
+                logger.debug(f"Namespaces: {lines}")
+            elif kind == "namespace":
+                report.namespace(key)
+                if key in cached:
+                    report.retention(key, format_admin_json(cached[key]), cached[key])
+            elif kind == "retention":
+                if rc != 0:
+                    report.failed(f"retention:{key}", " ".join(lines))
+                    logger.error(f"Error fetching retention policies for namespace {key}: {' '.join(lines)}")
+                    continue
+                report.retention(key, lines)
+            elif kind == "topics":
+                if rc != 0:
+                    report.failed(f"namespace:{key}", " ".join(lines))
+                    logger.error(f"Error fetching topics for namespace {key}: {' '.join(lines)}")
+            elif kind == "stats":
+                report.topic(key)
+                if rc != 0:
+                    report.failed(f"stats:{key}", " ".join(lines))
+                    logger.error(f"Error fetching stats for topic {key}: {' '.join(lines)}")
+                    continue
+                report.stats(key, lines)
+            elif kind == "namespace_done":
+                report.done(f"namespace:{key}")
+        writer.join()
+        err = process.stderr.read()
+        process.wait()
+        call["rc"] = process.returncode
+        call["bytes"] = stdout.bytes
+    if records == 0:
+        logger.error(f"Bulk admin session failed with exit code {process.returncode}: {err.strip()}")
+        return False
+    logger.info(f"Successfully Collected the Tenants, Namespaces, and Topics info in {records} lookups over one session and saved to {report.path}")
+    return True
+
+#Below exception is raised by the admin REST client for HTTP error responses
+class PulsarAdminError(Exception):
+    def __init__(self, status, path, body):
+        super().__init__(f"HTTP {status} for {path}: {body.strip()[:200]}")
+        self.status = status
+
+#Below class talks to the broker admin REST API directly. Connections are HTTP/1.1 keep-alive and are kept in
+#a pool shared by all threads, and at most `concurrency` requests are in flight at once
+class PulsarAdminRestClient:
+    def __init__(self, base_url, token=None, concurrency=16, timeout=30, pod=None):
+        parsed = urllib.parse.urlsplit(base_url)
+        self.pod = pod
+        self.scheme = parsed.scheme or "http"
+        self.host = parsed.hostname
+        self.port = parsed.port or (443 if self.scheme == "https" else 80)
+        self.base_path = parsed.path.rstrip("/")
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self.headers = {"Accept": "application/json", "Connection": "keep-alive"}
+        if token:
+            self.headers["Authorization"] = f"Bearer {token}"
+        self._connections = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(concurrency)
+        self._counter_lock = threading.Lock()
+        self.requests = 0
+        self.connections_opened = 0
+
+    def _new_connection(self):
+        with self._counter_lock:
+            self.connections_opened += 1
+        if self.scheme == "https":
+            return http.client.HTTPSConnection(self.host, self.port, timeout=self.timeout, context=ssl.create_default_context())
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def get(self, path, raw=False):
+        with self._slots:
+            try:
+                connection = self._connections.get_nowait()
+            except queue.Empty:
+                connection = self._new_connection()
+            # A pooled connection may have been closed by the server, retry once on a fresh one. Timeouts and other
+            # errors are not retried, the broker may still be working on the request
+            with command_call(["rest", "GET", path]) as call:
+                call["forked"] = False
+                if self.pod:
+                    call["pod"] = self.pod
+                for attempt in range(2):
+                    try:
+                        connection.request("GET", self.base_path + path, headers=self.headers)
+                        response = connection.getresponse()
+                        body = response.read()
+                        break
+                    except (ConnectionResetError, ConnectionRefusedError, BrokenPipeError):
+                        connection.close()
+                        if attempt:
+                            raise
+                        connection = self._new_connection()
+                        call["retries"] = attempt + 1
+                    except (http.client.HTTPException, OSError):
+                        connection.close()
+                        raise
+                call["rc"] = response.status
+                call["bytes"] = len(body)
+            with self._counter_lock:
+                self.requests += 1
+            if response.will_close:
+                connection.close()
+            else:
+                self._connections.put(connection)
+        if response.status >= 400:
+            raise PulsarAdminError(response.status, path, body.decode(errors="replace"))
+        if raw:
+            return body
+        return json.loads(body) if body else None
+
+    def close(self):
+        while not self._connections.empty():
+            self._connections.get_nowait().close()
+
+    def tenants(self):
+        return self.get("/admin/v2/tenants")
+
+    def namespaces(self, tenant):
+        return self.get(f"/admin/v2/namespaces/{quote_path(tenant)}")
+
+    def retention(self, namespace):
+        return self.get(f"/admin/v2/namespaces/{quote_path(namespace)}/retention")
+
+    def topics(self, namespace):
+        # pulsar-admin topics list merges persistent and non-persistent topics
+        return self.get(f"/admin/v2/persistent/{quote_path(namespace)}") + self.get(f"/admin/v2/non-persistent/{quote_path(namespace)}")
+
+    def topic_stats(self, topic):
+        domain, _, name = topic.partition("://")
+        return self.get(f"/admin/v2/{domain}/{quote_path(name)}/stats")
+
+    def topic_internal_stats(self, topic):
+        domain, _, name = topic.partition("://")
+        return self.get(f"/admin/v2/{domain}/{quote_path(name)}/internalStats")
+
+    def broker_topic_stats(self):
+        return self.get("/admin/v2/broker-stats/topics")
+
+    def policies(self, namespace):
+        return self.get(f"/admin/v2/namespaces/{quote_path(namespace)}")
+
+    def partitioned_topics(self, namespace):
+        return self.get(f"/admin/v2/persistent/{quote_path(namespace)}/partitioned") + self.get(f"/admin/v2/non-persistent/{quote_path(namespace)}/partitioned")
+
+    def partitioned_metadata(self, topic):
+        domain, _, name = topic.partition("://")
+        return self.get(f"/admin/v2/{domain}/{quote_path(name)}/partitions")
+
+#Below function url-encodes every segment of a tenant/namespace/topic path
+def quote_path(name):
+    return "/".join(urllib.parse.quote(part, safe="") for part in name.split("/"))
+
+#Below function renders a REST response the way pulsar-admin prints it (pretty JSON with " : " separators)
+def format_admin_json(value):
+    return json.dumps(value, indent=2, separators=(",", " : ")).splitlines()
+
+#Below function starts a kubectl port-forward to the admin port of a pod and returns the process and the local url
+def start_port_forward(namespace, pod, remote_port=8080):
+    logger = logging.getLogger("PortForward")
+    process = subprocess.Popen(kube_command(["kubectl", "-n", namespace, "port-forward", f"pod/{pod}", f":{remote_port}"]), stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    # kubectl prints "Forwarding from 127.0.0.1:<port> -> 8080" once the listener is up
+    for line in process.stdout:
+        match = re.search(r"Forwarding from 127\.0\.0\.1:(\d+)", line)
+        if match:
+            logger.info(f"Forwarding 127.0.0.1:{match.group(1)} to pod {pod}:{remote_port}")
+            threading.Thread(target=process.stdout.read, daemon=True).start()
+            return process, f"http://127.0.0.1:{match.group(1)}"
+    process.wait()
+    raise RuntimeError(f"kubectl port-forward to pod {pod} failed: {process.stderr.read().strip()}")
+
+#Below function reads the admin token, either given inline or as file:/path like pulsar client.conf
+def read_admin_token(token):
+    if token and token.startswith("file:"):
+        with open(token[len("file:"):]) as f:
+            return f.read().strip()
+    return token
+
+#Below function fetches tenants, namespaces, retention policies, topics and topic stats over the admin REST API
+#with up to --admin-concurrency requests in flight, and writes the same report as the pulsar-admin modes
+def rest_fetch_tenants_info(args, broker_pods=None, proxy_pods=None):
+    logger = logging.getLogger("TenantsInfoCollector")
+    output_file_path = os.path.join(args.output_dir, "tenants_namespaces_topics_list.txt")
+    try:
+        client, port_forward = open_admin_client(args, broker_pods, proxy_pods)
+    except Exception as e:
+        logger.error(f"Error opening the admin REST API: {e}")
+        return
+    try:
+        logger.info("Collecting pulsar tenants info from the admin REST API")
+
+        collector = current_collector()
+
+        def lookup(kind, name):
+            set_collector(collector)
+            try:
+                # topic stats are only needed once and would hold every topic in memory, they are not cached
+                if kind == "topic_stats":
+                    return client.topic_stats(name), None
+                return admin_lookup(args, kind, name, lambda: getattr(client, kind)(name)), None
+            except Exception as e:
+                return None, e
+
+        def fetch_retention(name):
+            # taken from the policies when the topology collector fetched them
+            policies = cached_policies(args, name)
+            return (policies.get("retention_policies"), None) if policies is not None else lookup("retention", name)
+
+        try:
+            tenants = admin_lookup(args, "tenants", "-", client.tenants)
+            logger.debug(f"Tenants: {tenants}")
+        except Exception as e:
+            logger.error(f"Error fetching tenants: {e}")
             return
-        logger.debug(f"Proxy Pods: {proxy_pods}")
-        for pod in proxy_pods:
+        report = TenantsReportWriter(args, output_file_path)
+        with ThreadPoolExecutor(max_workers=args.admin_concurrency) as executor:
+            namespace_lists = executor.map(lambda tenant: lookup("namespaces", tenant), tenants)
+            for tenant, (pulsar_namespaces, error) in zip(tenants, namespace_lists):
+                report.tenant(tenant)
+                if error:
+                    logger.error(f"Error fetching namespaces for tenant {tenant}: {error}")
+                    continue
+                logger.debug(f"Namespaces: {pulsar_namespaces}")
+                # all lookups of the tenant are sent at once, the report is written namespace by namespace
+                retentions = {pns: executor.submit(fetch_retention, pns) for pns in pulsar_namespaces if not unit_done(args, f"retention:{pns}")}
+                topic_lists = {pns: executor.submit(lookup, "topics", pns) for pns in pulsar_namespaces if not unit_done(args, f"namespace:{pns}")}
+                for pns in pulsar_namespaces:
+                    if pns not in retentions and pns not in topic_lists:
+                        continue
+                    report.namespace(pns)
+                    if pns in retentions:
+                        retention, error = retentions[pns].result()
+                        if error:
+                            report.failed(f"retention:{pns}", error)
+                            logger.error(f"Error fetching retention policies for namespace {pns}: {error}")
+                        else:
+                            report.retention(pns, format_admin_json(retention), retention)
+                    if pns not in topic_lists:
+                        continue
+                    topics, error = topic_lists[pns].result()
+                    if error:
+                        report.failed(f"namespace:{pns}", error)
+                        logger.error(f"Error fetching topics for namespace {pns}: {error}")
+                        continue
+                    topics = [topic for topic in topics if not unit_done(args, f"stats:{topic}")]
+                    failed = False
+                    for topic, (stats, error) in zip(topics, executor.map(lambda topic: lookup("topic_stats", topic), topics)):
+                        report.topic(topic)
+                        if error:
+                            report.failed(f"stats:{topic}", error)
+                            failed = True
+                            logger.error(f"Error fetching stats for topic {topic}: {error}")
+                            continue
+                        report.stats(topic, format_admin_json(stats), stats)
+                    if not failed:
+                        report.done(f"namespace:{pns}")
+        report.close()
+    finally:
+        client.close()
+        if port_forward:
+            port_forward.terminate()
+    logger.info(f"Successfully Collected the Tenants, Namespaces, and Topics info in {client.requests} requests over {client.connections_opened} connections and saved to {output_file_path}")
+
+#Below class is the in-run cache of admin lookups keyed by kind and tenant, namespace or topic. The topology
+#collector fills it and the later stages take tenants, namespaces, topic lists and retention (from the namespace
+#policies) from it instead of asking the admin API again. A lookup of a key another thread is fetching waits for
+#it, failed lookups are not kept so the next stage retries them
+class AdminLookupCache:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.hits = 0
+
+    def put(self, kind, name, value):
+        future = Future()
+        future.set_result(value)
+        with self.lock:
+            self.entries[(kind, name)] = future
+
+    def get(self, kind, name, fetch):
+        with self.lock:
+            future = self.entries.get((kind, name))
+            owner = future is None
+            if owner:
+                future = self.entries[(kind, name)] = Future()
+            else:
+                self.hits += 1
+        if owner:
             try:
-                output_file_path = f"{args.output_dir}/logs/proxy/{pod}"
-                os.makedirs(output_file_path, exist_ok=True)
-                logger.debug(f"Collecting Proxy logs from pod {pod}")
-                # Collect logs from running pods
-                log_file_path = f"{output_file_path}/{pod}.log"
-                with open(log_file_path, "w") as log_file:
-                    subprocess.run(["kubectl", "-n", args.namespace, "logs", pod, "--all-containers=true"],stdout=log_file,stderr=subprocess.PIPE,check=True)
-                    logger.debug(f"Succesfully collected Proxy Logs from pod {pod}")
-                # Copy logs from the pod
-                process = subprocess.Popen(["kubectl", "-n", args.namespace, "cp", f"{pod}:/pulsar/logs/", output_file_path],stderr=subprocess.PIPE,stdout=subprocess.PIPE)
-                _, err = process.communicate()
-                # Only print errors that are not the tar warning
-                logger.debug(f"succesfully copied Proxy Logs from pod {pod}")
-                if err and b"Removing leading '/'" not in err:
-                    logger.debug(f"Error copying logs from pod {pod}: {err.decode()}")
-            except subprocess.CalledProcessError as e:
-                logger.error(f"Error collecting logs for pod {pod}: {e}")
-                continue
+                future.set_result(fetch())
             except Exception as e:
-                logger.error(f"Unexpected error for pod {pod}: {e}")
+                future.set_exception(e)
+                with self.lock:
+                    self.entries.pop((kind, name), None)
+        return future.result()
+
+    def names(self, kind):
+        with self.lock:
+            return [name for entry_kind, name in self.entries if entry_kind == kind]
+
+    #Below method returns a cached value without fetching it, or None
+    def peek(self, kind, name):
+        with self.lock:
+            future = self.entries.get((kind, name))
+        if future is None or future.exception() is not None:
+            return None
+        with self.lock:
+            self.hits += 1
+        return future.result()
+
+#Below function looks a value up through the cache of the run
+def admin_lookup(args, kind, name, fetch):
+    cache = getattr(args, "admin_cache", None)
+    return cache.get(kind, name, fetch) if cache is not None else fetch()
+
+#Below function returns the cached policies of a namespace, or None when they were not fetched. Their
+#retention_policies are what get-retention returns (null when not set)
+def cached_policies(args, namespace):
+    cache = getattr(args, "admin_cache", None)
+    policies = cache.peek("policies", namespace) if cache is not None else None
+    return policies if isinstance(policies, dict) else None
+
+#Below function opens the admin REST client of --admin-url, port-forwarding to a broker or proxy pod with
+#--admin-url port-forward. It returns (client, port-forward process or None) and raises when that fails
+def open_admin_client(args, broker_pods=None, proxy_pods=None):
+    logger = logging.getLogger("AdminClient")
+    port_forward = None
+    admin_url = args.admin_url
+    if admin_url == "port-forward":
+        # Bastion pods do not serve the admin API, so forward to a broker or a proxy
+        target_pods = broker_pods or proxy_pods
+        if not target_pods:
+            raise RuntimeError("no running broker or proxy pods found to port-forward to")
+        port_forward, admin_url = start_port_forward(args.namespace, target_pods[0])
+    logger.info(f"Using the admin REST API at {admin_url}")
+    return PulsarAdminRestClient(admin_url, token=read_admin_token(args.admin_token), concurrency=args.admin_concurrency), port_forward
+
+TOPOLOGY_FORMAT = "pulsar-diag-topology/1"
+TOPOLOGY_PARTITION = re.compile(r"^(.*)-partition-\d+$")
+
+#Below shell script fetches the topology inside the admin pod in one session, framed like BULK_ADMIN_SCRIPT:
+#tenants, namespaces, and per namespace its policies, topics, partitioned topics and the partition count of each.
+#Namespaces run in waves of $WORKERS background jobs and are printed in namespace order
+TOPOLOGY_SCRIPT = r"""
+PA=/pulsar/bin/pulsar-admin
+WORKERS=%(workers)d
+TMP=$(mktemp -d 2>/dev/null || echo /tmp/pulsar-diag-topology-$$)
+mkdir -p "$TMP"
+trap 'rm -rf "$TMP"' EXIT
+emit() {
+    printf '@@DIAG %%s %%s %%s\n' "$1" "$3" "$2"
+    [ -n "$4" ] && printf '%%s\n' "$4"
+    printf '@@END\n'
+}
+call() {
+    job=$1; kind=$2; key=$3; shift 3
+    out=$("$@" 2>"$TMP/$job.err"); rc=$?
+    [ $rc -ne 0 ] && out=$(cat "$TMP/$job.err")
+    emit "$kind" "$key" "$rc" "$out"
+    return $rc
+}
+namespace_topology() {
+    call "$1" policies "$2" $PA namespaces policies "$2"
+    call "$1" topics "$2" $PA topics list "$2"
+    parts=$(call "$1" partitioned "$2" $PA topics list-partitioned-topics "$2") || { printf '%%s\n' "$parts"; return; }
+    printf '%%s\n' "$parts"
+    for topic in $(printf '%%s\n' "$parts" | sed '1d;$d'); do
+        call "$1" partitions "$topic" $PA topics get-partitioned-topic-metadata "$topic"
+    done
+}
+flush() {
+    j=1
+    while [ $j -le $1 ]; do
+        cat "$TMP/$j.out" 2>/dev/null; rm -f "$TMP/$j.out" "$TMP/$j.err"
+        j=$((j+1))
+    done
+}
+tenants=$(call 0 tenants - $PA tenants list) || { printf '%%s\n' "$tenants"; exit 0; }
+printf '%%s\n' "$tenants"
+for tenant in $(printf '%%s\n' "$tenants" | sed '1d;$d'); do
+    nss=$(call 0 namespaces "$tenant" $PA namespaces list "$tenant") || { printf '%%s\n' "$nss"; continue; }
+    printf '%%s\n' "$nss"
+    i=0
+    for ns in $(printf '%%s\n' "$nss" | sed '1d;$d'); do
+        i=$((i+1))
+        namespace_topology "$i" "$ns" > "$TMP/$i.out" &
+        if [ $i -ge $WORKERS ]; then wait; flush $i; i=0; fi
+    done
+    wait; flush $i
+done
+"""
+
+#Below function drops the unset parts of namespace policies (nulls and empty maps and lists), most namespaces only
+#set a few of them
+def compact_policies(value):
+    if isinstance(value, dict):
+        compacted = {key: compact_policies(item) for key, item in value.items()}
+        return {key: item for key, item in compacted.items() if item is not None and item != {} and item != []}
+    if isinstance(value, list):
+        return [compact_policies(item) for item in value]
+    return value
+
+#Below class accumulates the topology as the lookups come in and puts every lookup into the cache of the run
+class TopologyBuilder:
+    def __init__(self, cache):
+        self.cache = cache
+        self.tenants = {}
+        self.namespaces = {}
+        self.failed = []
+
+    def namespace(self, name):
+        return self.namespaces.setdefault(name, {"policies": None, "topics": [], "partitioned": {}})
+
+    def tenant_list(self, tenants):
+        self.cache.put("tenants", "-", tenants)
+        for tenant in tenants:
+            self.tenants.setdefault(tenant, [])
+
+    def namespace_list(self, tenant, namespaces):
+        self.cache.put("namespaces", tenant, namespaces)
+        self.tenants[tenant] = list(namespaces)
+        for namespace in namespaces:
+            self.namespace(namespace)
+
+    def policies(self, namespace, policies):
+        self.cache.put("policies", namespace, policies)
+        self.namespace(namespace)["policies"] = compact_policies(policies)
+
+    def topic_list(self, namespace, topics):
+        self.cache.put("topics", namespace, topics)
+        self.namespace(namespace)["topics"] = topics
+
+    def partitioned_list(self, namespace, topics):
+        self.cache.put("partitioned", namespace, topics)
+        for topic in topics:
+            self.namespace(namespace)["partitioned"].setdefault(topic, None)
+
+    def partitions(self, topic, metadata):
+        self.cache.put("partitions", topic, metadata)
+        namespace = "/".join(topic.partition("://")[2].split("/")[:2])
+        self.namespace(namespace)["partitioned"][topic] = int((metadata or {}).get("partitions") or 0)
+
+    def fail(self, kind, key, error):
+        self.failed.append({"kind": kind, "key": key, "error": str(error)[:500]})
+
+    def topology(self):
+        namespaces = {}
+        for name, entry in sorted(self.namespaces.items()):
+            partitioned = entry["partitioned"]
+            # the topic list names the partitions of partitioned topics, they are counted with their topic
+            partitions = [TOPOLOGY_PARTITION.match(topic) for topic in entry["topics"]]
+            topics = sum(1 for match in partitions if not (match and match.group(1) in partitioned))
+            namespaces[name] = {"policies": entry["policies"], "topics": topics, "partitioned": dict(sorted(partitioned.items())),
+                "partitions": sum(count or 0 for count in partitioned.values())}
+        return {"format": TOPOLOGY_FORMAT, "collected_at": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "totals": {"tenants": len(self.tenants), "namespaces": len(namespaces), "topics": sum(entry["topics"] for entry in namespaces.values()),
+                "partitioned_topics": sum(len(entry["partitioned"]) for entry in namespaces.values()),
+                "partitions": sum(entry["partitions"] for entry in namespaces.values())},
+            "tenants": {tenant: sorted(tenant_namespaces) for tenant, tenant_namespaces in sorted(self.tenants.items())},
+            "namespaces": namespaces, "failed": self.failed}
+
+#Below function writes the capacity relevant policies of every namespace of a topology as a table
+def write_topology_summary(path, topology):
+    totals = topology["totals"]
+    with open(path, "w") as f:
+        f.write(f"Topology: {totals['tenants']} tenants, {totals['namespaces']} namespaces, {totals['topics']} topics, "
+            f"{totals['partitioned_topics']} partitioned topics with {totals['partitions']} partitions\n\n")
+        f.write(f"  {'namespace':<40} {'topics':>7} {'part.':>6} {'parts':>6} {'E/Qw/Qa':>8} {'retention':>14} {'ttl s':>8} {'backlog quota':>18}  replication\n")
+        for name, entry in topology["namespaces"].items():
+            policies = entry["policies"] or {}
+            persistence = policies.get("persistence") or {}
+            ensemble = "/".join(str(persistence.get(key, "-")) for key in ("bookkeeperEnsemble", "bookkeeperWriteQuorum", "bookkeeperAckQuorum")) if persistence else "-"
+            retention = policies.get("retention_policies") or {}
+            retention = f"{retention.get('retentionTimeInMinutes', '-')}m/{retention.get('retentionSizeInMB', '-')}MB" if retention else "-"
+            quota = (policies.get("backlog_quota_map") or {}).get("destination_storage") or {}
+            quota = f"{quota.get('limitSize', quota.get('limit', '-'))}/{quota.get('policy', '-')}" if quota else "-"
+            f.write(f"  {name:<40} {entry['topics']:>7} {len(entry['partitioned']):>6} {entry['partitions']:>6} {ensemble:>8} {retention:>14} "
+                f"{policies.get('message_ttl_in_seconds', '-'):>8} {quota:>18}  {','.join(policies.get('replication_clusters') or []) or '-'}\n")
+        for failure in topology["failed"]:
+            f.write(f"\nFailed {failure['kind']} {failure['key']}: {failure['error']}")
+
+#Below function fetches the topology through one exec session running TOPOLOGY_SCRIPT and returns the lookups made
+def exec_topology(args, exec_command, builder):
+    logger = logging.getLogger("TopologyCollector")
+    records = 0
+    with command_slot(exec_command), command_call(exec_command) as call:
+        process, writer = start_script_session(exec_command, TOPOLOGY_SCRIPT % {"workers": max(1, args.bulk_admin_workers)})
+        call["forked"] = not isinstance(process, KubeApiProcess)
+        stdout = CountingReader(process.stdout)
+        for kind, key, rc, lines in read_bulk_records(stdout):
+            records += 1
+            if rc != 0:
+                builder.fail(kind, key, " ".join(lines))
+                logger.error(f"Error fetching the {kind} of {key}: {' '.join(lines)}")
                 continue
-       
-       ## Collecting bookie logs
-        if not bookie_pods:
-            logger.info(f"No running Bookie pods found in namespace {args.namespace}")
-            return
-        logger.debug(f"Bookie Pods: {bookie_pods}")
-        for pod in bookie_pods:
             try:
-                output_file_path = f"{args.output_dir}/logs/bookie/{pod}"
-                os.makedirs(output_file_path, exist_ok=True)
-                # Collect logs from running pods
-                log_file_path = f"{output_file_path}/{pod}.log"
-                with open(log_file_path, "w") as log_file:
-                    subprocess.run(["kubectl", "-n", args.namespace, "logs", pod, "--all-containers=true"],stdout=log_file,stderr=subprocess.PIPE,check=True)
-                    logger.debug(f"succesfully collected Bookie Logs from pod {pod}")
-                # Copy logs from the pod
-                process = subprocess.Popen(["kubectl", "-n", args.namespace, "cp", f"{pod}:/pulsar/logs/", output_file_path],stderr=subprocess.PIPE,stdout=subprocess.PIPE)
-                _, err = process.communicate()
-                logger.debug(f"succesfully copied Bookie Logs from pod {pod}")
-                # Only print errors that are not the tar warning
-                if err and b"Removing leading '/'" not in err:
-                    logger.debug(f"Error copying logs from pod {pod}: {err.decode()}")
-            except subprocess.CalledProcessError as e:
-                logger.error(f"Error collecting logs for pod {pod}: {e}")
+                if kind == "tenants":
+                    builder.tenant_list(lines)
+                elif kind == "namespaces":
+                    builder.namespace_list(key, lines)
+                elif kind == "policies":
+                    builder.policies(key, json.loads("\n".join(lines)))
+                elif kind == "topics":
+                    builder.topic_list(key, lines)
+                elif kind == "partitioned":
+                    builder.partitioned_list(key, lines)
+                elif kind == "partitions":
+                    builder.partitions(key, json.loads("\n".join(lines)))
+            except ValueError as e:
+                builder.fail(kind, key, e)
+                logger.error(f"Error parsing the {kind} of {key}: {e}")
+        writer.join()
+        err = process.stderr.read()
+        process.wait()
+        call["rc"] = process.returncode
+        call["bytes"] = stdout.bytes
+    if records == 0:
+        raise RuntimeError(f"topology session failed with exit code {process.returncode}: {err.strip()}")
+    return records
+
+#Below function fetches the topology over the admin REST API, namespaces and partitioned topics in parallel, and
+#returns the requests made
+def rest_topology(args, client, builder):
+    collector = current_collector()
+
+    def lookup(kind, key, function):
+        set_collector(collector)
+        try:
+            return kind, key, function(key), None
+        except Exception as e:
+            return kind, key, None, e
+
+    builder.tenant_list(client.tenants())
+    requests = 1
+    with ThreadPoolExecutor(max_workers=max(1, args.admin_concurrency)) as executor:
+        pending = [executor.submit(lookup, "namespaces", tenant, client.namespaces) for tenant in builder.tenants]
+        while pending:
+            kind, key, value, error = pending.pop(0).result()
+            requests += 1
+            if error:
+                builder.fail(kind, key, error)
                 continue
+            if kind == "namespaces":
+                builder.namespace_list(key, value)
+                for namespace in value:
+                    pending += [executor.submit(lookup, "policies", namespace, client.policies), executor.submit(lookup, "topics", namespace, client.topics),
+                        executor.submit(lookup, "partitioned", namespace, client.partitioned_topics)]
+            elif kind == "policies":
+                builder.policies(key, value)
+            elif kind == "topics":
+                builder.topic_list(key, value)
+            elif kind == "partitioned":
+                builder.partitioned_list(key, value)
+                pending += [executor.submit(lookup, "partitions", topic, client.partitioned_metadata) for topic in value]
+            elif kind == "partitions":
+                builder.partitions(key, value)
+    return requests
+
+#Below function collects the topology: the full policies of every namespace (retention, backlog quotas, TTL,
+#dispatch and publish rates, persistence, offload, subscription and replication policies) and the partition
+#count of every partitioned topic, through one exec session in the admin pod (or container) or over the admin
+#REST API. It is written as compact JSON to topology.json with a table in topology.txt, and the lookups stay in
+#the cache of the run for the tenants collector
+def collect_topology(args, broker_pods=None, proxy_pods=None, bastion_pods=None, container_id=None):
+    logger = logging.getLogger("TopologyCollector")
+    path = os.path.join(args.output_dir, "topology.json")
+    builder = TopologyBuilder(args.admin_cache)
+    try:
+        if args.admin_url:
+            client, port_forward = open_admin_client(args, broker_pods, proxy_pods)
+            try:
+                lookups = rest_topology(args, client, builder)
+            finally:
+                client.close()
+                if port_forward:
+                    port_forward.terminate()
+        elif args.type == "docker":
+            lookups = exec_topology(args, ["docker", "exec", "-i", container_id, "sh", "-s"], builder)
+        else:
+            admin_pods = bastion_pods or proxy_pods or broker_pods
+            if not admin_pods:
+                logger.error("No running bastion, proxy or broker pods found. Exiting...")
+                return
+            lookups = exec_topology(args, ["kubectl", "-n", args.namespace, "exec", "-i", admin_pods[0], "--", "sh", "-s"], builder)
+    except Exception as e:
+        logger.error(f"Error fetching the topology: {e}")
+        return
+    topology = builder.topology()
+    with open(path, "w") as f:
+        json.dump(topology, f, separators=(",", ":"))
+    write_topology_summary(os.path.join(args.output_dir, "topology.txt"), topology)
+    totals = topology["totals"]
+    logger.info(f"Collected the topology of {totals['namespaces']} namespaces, {totals['topics']} topics and {totals['partitioned_topics']} partitioned topics "
+        f"in {lookups} lookups to {path}")
+
+HOT_TOPIC_RANKINGS = {
+    "rate": lambda summary: summary["msgRateIn"] + summary["msgRateOut"],
+    "throughput": lambda summary: summary["msgThroughputIn"] + summary["msgThroughputOut"],
+    "backlog": lambda summary: summary["backlog"],
+    "subscriptions": lambda summary: summary["subscriptions"],
+}
+HOT_TOPIC_DETAILS = {"stats": "stats", "internal": "stats-internal"}
+# pulsar-admin inside a broker pod talks to that broker only, so broker-stats covers the topics it owns
+BROKER_LOCAL_ADMIN_URL = "http://localhost:8080"
+
+#Below function parses a comma separated list of hot topic rankings, e.g. rate,backlog
+def parse_hot_topic_rankings(value):
+    rankings = [item.strip() for item in value.split(",") if item.strip()]
+    unknown = [item for item in rankings if item not in HOT_TOPIC_RANKINGS]
+    if unknown or not rankings:
+        raise argparse.ArgumentTypeError(f"invalid topic rankings '{value}', choose from {','.join(HOT_TOPIC_RANKINGS)}")
+    return rankings
+
+#Below function walks the output of broker-stats topics (namespace, bundle, domain, topic) and yields (topic, stats)
+def iter_broker_topic_stats(value):
+    if not isinstance(value, dict):
+        return
+    for key, item in value.items():
+        if "://" in key and isinstance(item, dict):
+            yield key, item
+        else:
+            yield from iter_broker_topic_stats(item)
+
+#Below function keeps the numbers topics are ranked by, so only a few values per topic stay in memory
+def summarize_topic_stats(stats):
+    subscriptions = stats.get("subscriptions") or {}
+    return {"msgRateIn": float(stats.get("msgRateIn") or 0), "msgRateOut": float(stats.get("msgRateOut") or 0),
+        "msgThroughputIn": float(stats.get("msgThroughputIn") or 0), "msgThroughputOut": float(stats.get("msgThroughputOut") or 0),
+        "backlog": sum(int(subscription.get("msgBacklog") or 0) for subscription in subscriptions.values() if isinstance(subscription, dict)),
+        "subscriptions": len(subscriptions)}
+
+#Below function returns the top topics of each ranking, leaving out topics with nothing to rank them by
+def rank_hot_topics(summaries, top, rankings):
+    ranked = {}
+    for name in rankings:
+        key = HOT_TOPIC_RANKINGS[name]
+        ranked[name] = [topic for topic in heapq.nlargest(top, summaries, key=lambda topic: key(summaries[topic])) if key(summaries[topic]) > 0]
+    return ranked
+
+def write_hot_topics(path, summaries, ranked, brokers):
+    with open(path, "w") as f:
+        f.write(f"Hot topics out of {len(summaries)} topics on {brokers} brokers\n")
+        for name, topics in ranked.items():
+            f.write(f"\nTop {len(topics)} by {name}\n")
+            f.write(f"  {'msg/s in':>12} {'msg/s out':>12} {'bytes/s in':>14} {'bytes/s out':>14} {'backlog':>12} {'subs':>6}  topic\n")
+            for topic in topics:
+                summary = summaries[topic]
+                f.write(f"  {summary['msgRateIn']:>12.1f} {summary['msgRateOut']:>12.1f} {summary['msgThroughputIn']:>14.1f} {summary['msgThroughputOut']:>14.1f}"
+                    f" {summary['backlog']:>12} {summary['subscriptions']:>6}  {topic}\n")
+
+#Below function collects the hot topics only. The aggregated topic stats of every broker are fetched in parallel
+#(sources maps a broker to the function returning its broker-stats topics output), topics are ranked and stats and
+#internal stats are fetched through detail(kind, topic) for the top --top-topics of each ranking, so the cost
+#scales with the brokers and --top-topics instead of the number of topics
+def collect_hot_topics(args, sources, detail):
+    logger = logging.getLogger("HotTopicsCollector")
+    output_file_path = os.path.join(args.output_dir, "tenants_namespaces_topics_list.txt")
+    collector = current_collector()
+    summaries = {}
+    args.hot_ledgers = {}
+
+    def broker_stats(name):
+        set_collector(collector)
+        return sources[name]()
+
+    with ThreadPoolExecutor(max_workers=max(1, min(args.parallel, len(sources)))) as executor:
+        futures = {executor.submit(broker_stats, name): name for name in sources}
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                topics = 0
+                for topic, stats in iter_broker_topic_stats(future.result()):
+                    summaries[topic] = summarize_topic_stats(stats)
+                    topics += 1
+                logger.info(f"Broker {name} reported {topics} topics")
             except Exception as e:
-                logger.error(f"Unexpected error for pod {pod}: {e}")
+                logger.error(f"Error fetching the topic stats of broker {name}: {e}")
+    if not summaries:
+        logger.error("No topic stats received from the brokers. Exiting...")
+        return
+    ranked = rank_hot_topics(summaries, args.top_topics, args.top_topics_by)
+    write_hot_topics(os.path.join(args.output_dir, "hot_topics.txt"), summaries, ranked, len(sources))
+    hot = list(dict.fromkeys(topic for topics in ranked.values() for topic in topics))
+    logger.info(f"Fetching stats and internal stats of {len(hot)} hot topics out of {len(summaries)}")
+
+    def topic_details(topic):
+        set_collector(collector)
+        results = []
+        for kind in HOT_TOPIC_DETAILS:
+            if unit_done(args, f"{kind}:{topic}"):
                 continue
-        
-        # Collect Zookeeper logs
-        if not zookeeper_pods:
-            logger.info(f"No running Zookeeper pods found in namespace {args.namespace}")
-            return
-        logger.debug(f"Zookeeper Pods: {zookeeper_pods}")
-        for pod in zookeeper_pods:
             try:
-                output_file_path = f"{args.output_dir}/logs/zookeeper/{pod}"
-                os.makedirs(output_file_path, exist_ok=True)
-
-            # Collect logs from running pods
-                log_file_path = f"{output_file_path}/{pod}.log"
-                with open(log_file_path, "w") as log_file:
-                    subprocess.run(["kubectl", "-n", args.namespace, "logs", pod, "--all-containers=true"],stdout=log_file,stderr=subprocess.PIPE,check=True)
-                    logger.debug(f"succesfully collected Zookeeper Logs from pod {pod}")
-            # Copy logs from the pod
-                process = subprocess.Popen(["kubectl", "-n", args.namespace, "cp", f"{pod}:/pulsar/logs/", output_file_path],stderr=subprocess.PIPE,stdout=subprocess.PIPE)
-                logger.debug(f"succesfully copied Zookeeper Logs from pod {pod}")
-                _, err = process.communicate()
-            # Only print errors that are not the tar warning
-                if err and b"Removing leading '/'" not in err:
-                    logger.debug(f"Error copying logs from pod {pod}: {err.decode()}")
-            except subprocess.CalledProcessError as e:
-                logger.error(f"Error collecting logs for pod {pod}: {e}")
-                continue  # Continue to the next pod if an error occurs
+                results.append((kind, detail(kind, topic), None))
             except Exception as e:
-                logger.error(f"Unexpected error for pod {pod}: {e}")
-                continue  # Continue to the next pod if any other exception occurs
-        logger.info("Successfully collected all logs from all pods")
+                results.append((kind, None, e))
+        return results
+
+    report = TenantsReportWriter(args, output_file_path)
+    with ThreadPoolExecutor(max_workers=max(1, args.parallel)) as executor:
+        for topic, results in zip(hot, executor.map(topic_details, hot)):
+            if results:
+                report.topic(topic)
+            for kind, value, error in results:
+                if error:
+                    report.failed(f"{kind}:{topic}", error)
+                    logger.error(f"Error fetching {HOT_TOPIC_DETAILS[kind]} for topic {topic}: {error}")
+                    continue
+                if kind == "stats":
+                    report.stats(topic, *value)
+                else:
+                    report.internal_stats(topic, *value)
+                    # the bookie collector looks up the metadata of the ledgers of the hot topics
+                    internal = value[1] if isinstance(value[1], dict) else {}
+                    args.hot_ledgers[topic] = [ledger["ledgerId"] for ledger in internal.get("ledgers") or [] if isinstance(ledger, dict) and "ledgerId" in ledger]
+    report.close()
+    logger.info(f"Successfully Collected the stats of {len(hot)} hot topics and saved to {output_file_path} and hot_topics.txt")
+
+#Below function sets up the broker stats sources of the hot topics mode: one pulsar-admin exec per broker pod (or
+#the container), or the admin REST API, port-forwarded to every broker pod with --admin-url port-forward
+def hot_fetch_tenants_info(args, broker_pods=None, proxy_pods=None, bastion_pods=None, container_name=None, container_id=None):
+    logger = logging.getLogger("HotTopicsCollector")
+    stats_dir = os.path.join(args.output_dir, "broker_stats")
+    os.makedirs(stats_dir, exist_ok=True)
+
+    def exec_broker_stats(command, name):
+        # saved as it streams in, the output of a broker with many topics is large
+        path = os.path.join(stats_dir, f"{name}.json")
+        copy_command_output(command, path)
+        with open(path) as f:
+            return json.load(f)
+
+    def rest_broker_stats(client, name):
+        stats = client.broker_topic_stats()
+        with open(os.path.join(stats_dir, f"{name}.json"), "w") as f:
+            json.dump(stats, f)
+        return stats
+
+    def exec_detail(prefix):
+        def detail(kind, topic):
+            result = run_command(prefix + ["topics", HOT_TOPIC_DETAILS[kind], topic], capture_output=True, text=True, check=True)
+            lines = result.stdout.splitlines()
+            return lines, parse_admin_output(lines)
+        return detail
+
+    if args.admin_url:
+        token = read_admin_token(args.admin_token)
+        clients = {}
+        port_forwards = []
+        try:
+            if args.admin_url == "port-forward":
+                if not broker_pods:
+                    logger.error("No running broker pods found to port-forward to. Exiting...")
+                    return
+                with ThreadPoolExecutor(max_workers=max(1, args.parallel)) as executor:
+                    forwards = executor.map(lambda pod: lookup_port_forward(args.namespace, pod), broker_pods)
+                    for pod, (forward, error) in zip(broker_pods, forwards):
+                        if error:
+                            logger.error(f"Error starting port-forward to broker {pod}: {error}")
+                            continue
+                        port_forwards.append(forward[0])
+                        clients[pod] = PulsarAdminRestClient(forward[1], token=token, concurrency=args.admin_concurrency)
+            else:
+                logger.info(f"Ranking the topics of the broker serving {args.admin_url}, use --admin-url port-forward to cover every broker")
+                clients["admin-url"] = PulsarAdminRestClient(args.admin_url, token=token, concurrency=args.admin_concurrency)
+            if clients:
+                detail_client = next(iter(clients.values()))
+
+                def rest_detail(kind, topic):
+                    value = detail_client.topic_stats(topic) if kind == "stats" else detail_client.topic_internal_stats(topic)
+                    return format_admin_json(value), value
+
+                collect_hot_topics(args, {name: lambda client=client, name=name: rest_broker_stats(client, name) for name, client in clients.items()}, rest_detail)
+        finally:
+            for client in clients.values():
+                client.close()
+            for port_forward in port_forwards:
+                port_forward.terminate()
+        return
+    if args.type == "docker":
+        if not container_id:
+            logger.error("No container ID provided. Exiting...")
+            return
+        admin = ["docker", "exec", container_id, "/pulsar/bin/pulsar-admin"]
+        name = container_name or container_id
+        collect_hot_topics(args, {name: lambda: exec_broker_stats(admin + ["--admin-url", BROKER_LOCAL_ADMIN_URL, "broker-stats", "topics"], name)},
+            exec_detail(admin))
+        return
+    if not broker_pods:
+        logger.error("No running broker pods found. Exiting...")
+        return
+    admin_pod = (bastion_pods or proxy_pods or broker_pods)[0]
+    sources = {pod: lambda pod=pod: exec_broker_stats(["kubectl", "-n", args.namespace, "exec", pod, "--", "/pulsar/bin/pulsar-admin",
+        "--admin-url", BROKER_LOCAL_ADMIN_URL, "broker-stats", "topics"], pod) for pod in broker_pods}
+    logger.info(f"Ranking the topics of {len(broker_pods)} brokers, fetching the hot topics from pod {admin_pod}")
+    collect_hot_topics(args, sources, exec_detail(["kubectl", "-n", args.namespace, "exec", admin_pod, "--", "/pulsar/bin/pulsar-admin"]))
 
-    elif args.type == "standalone":
-        logger.info("Collecting logs from standalone")
-        subprocess.run(["cp", "-r", "/var/log/pulsar", args.output_dir])
+#Below function starts a port-forward and returns ((process, url), None), or (None, error) when it fails
+def lookup_port_forward(namespace, pod, remote_port=8080):
+    try:
+        return start_port_forward(namespace, pod, remote_port), None
+    except Exception as e:
+        return None, e
 
 def fetch_tenants_info(args, broker_pods=None, proxy_pods=None, bastion_pods=None, container_name=None, container_id=None):
     logger = logging.getLogger("TenantsInfoCollector")
+    if args.top_topics:
+        hot_fetch_tenants_info(args, broker_pods, proxy_pods, bastion_pods, container_name, container_id)
+        return
+    if args.admin_url:
+        rest_fetch_tenants_info(args, broker_pods, proxy_pods)
+        return
     if args.type == "docker":
         logger.info("Collecting pulsar tenants info from docker")
         output_file_path = os.path.join(args.output_dir, "tenants_namespaces_topics_list.txt")
-        with open(output_file_path, "w") as f:
-         f.write("Pulsar Tenants, Namespaces, and Topics\n")
+        report = TenantsReportWriter(args, output_file_path)
         if not container_id:
             logger.error("No container ID provided. Exiting...")
+            report.close()
+            return
+        # one exec session in docker mode, whatever --bulk-admin says: there is no cluster of pods to spread calls over
+        elif bulk_fetch_tenants_info(args, ["docker", "exec", "-i", container_id, "sh", "-s"], report):
+            report.close()
             return
         else:
             try:
-                result = subprocess.run(["docker", "exec", "-it", container_id, "/pulsar/bin/pulsar-admin", "tenants", "list"],
-                    capture_output=True, text=True, check=True)
-                tenants = result.stdout.splitlines()
+                tenants = admin_lookup(args, "tenants", "-", lambda: run_command(["docker", "exec", container_id, "/pulsar/bin/pulsar-admin", "tenants", "list"],
+                    capture_output=True, text=True, check=True).stdout.splitlines())
                 logger.debug(f"Tenants: {tenants}")
                 for tenant in tenants:
                     tenant = tenant.strip()
                     logger.debug(f"Tenant: {tenant}")
                     # Write tenant to file
-                    with open(output_file_path, "a") as f:
-                        f.write(f"\nTenant: {tenant}\n")
+                    report.tenant(tenant)
 
                     try:
                         logger.debug(f"Fetching namespaces for tenant {tenant}")
                         # Fetch namespaces for the tenant
-                        result = subprocess.run(["docker", "exec", "-it", container_id, "/pulsar/bin/pulsar-admin", "namespaces", "list", tenant],
-                            capture_output=True, text=True, check=True)
-                        pulsar_namespaces = result.stdout.splitlines()
+                        pulsar_namespaces = admin_lookup(args, "namespaces", tenant, lambda: run_command(["docker", "exec", container_id, "/pulsar/bin/pulsar-admin",
+                            "namespaces", "list", tenant], capture_output=True, text=True, check=True).stdout.splitlines())
                         logger.debug(f"Namespaces: {pulsar_namespaces}")
                     except subprocess.CalledProcessError as e:
                         logger.error(f"Error fetching namespaces for tenant {tenant}: {e}")
                         continue
           
                     for pns in pulsar_namespaces:
-                        #write namespace retention policies to file
-                        with open(output_file_path, "a") as f:
-                            f.write(f"  Namespace: {pns}\n")
-                        try:
-                            # Fetch namespace retention policies
-                            logger.debug(f"Fetching retention policies for namespace {pns}")
-                            retention_policies = subprocess.run(["docker", "exec", "-it", container_id, "/pulsar/bin/pulsar-admin", "namespaces", "get-retention", pns],
-                                capture_output=True, text=True, check=True)
-                            retention = retention_policies.stdout.splitlines()
-                            # Write retention policies to file
-                            with open(output_file_path, "a") as f:
-                                f.write(f"          Retention Policies: {retention}\n")
-                        except subprocess.CalledProcessError as e:
-                            logger.error(f"Error fetching retention policies for namespace {pns}: {e}")
+                        retention_done = unit_done(args, f"retention:{pns}")
+                        if retention_done and unit_done(args, f"namespace:{pns}"):
+                            continue
+                        report.namespace(pns)
+                        policies = cached_policies(args, pns)
+                        if policies is not None and not retention_done:
+                            report.retention(pns, format_admin_json(policies.get("retention_policies")), policies.get("retention_policies"))
+                        elif not retention_done:
+                            try:
+                                # Fetch namespace retention policies
+                                logger.debug(f"Fetching retention policies for namespace {pns}")
+                                retention_policies = run_command(["docker", "exec", container_id, "/pulsar/bin/pulsar-admin", "namespaces", "get-retention", pns],
+                                    capture_output=True, text=True, check=True)
+                                retention = retention_policies.stdout.splitlines()
+                                # Write retention policies to file
+                                report.retention(pns, retention)
+                            except subprocess.CalledProcessError as e:
+                                # the topics of the namespace are still fetched
+                                report.failed(f"retention:{pns}", e)
+                                logger.error(f"Error fetching retention policies for namespace {pns}: {e}")
+                        if unit_done(args, f"namespace:{pns}"):
                             continue
-                
+
                         try:
                             # Fetch topics for the namespace
                             logger.debug(f"Fetching topics for namespace {pns}")
-                            topics_result = subprocess.run(["docker", "exec", "-it", container_id, "/pulsar/bin/pulsar-admin", "topics", "list", pns],
-                                capture_output=True, text=True, check=True)
-                            topics = topics_result.stdout.splitlines()
+                            topics = admin_lookup(args, "topics", pns, lambda: run_command(["docker", "exec", container_id, "/pulsar/bin/pulsar-admin", "topics", "list", pns],
+                                capture_output=True, text=True, check=True).stdout.splitlines())
                         except subprocess.CalledProcessError as e:
+                            report.failed(f"namespace:{pns}", e)
                             logger.error(f"Error fetching topics for namespace {pns}: {e}")
                             continue
 
+                        failed = False
                         for topic in topics:
+                            if unit_done(args, f"stats:{topic}"):
+                                continue
                             # Write topic to file
-                            with open(output_file_path, "a") as f:
-                                f.write(f"     Topic: {topic}\n")
+                            report.topic(topic)
                             try:
                                 # Fetch topic stats
                                 logger.debug(f"Fetching stats for topic {topic}")
-                                topic_stats = subprocess.run(["docker", "exec", "-it", container_id, "/pulsar/bin/pulsar-admin", "topics", "stats", topic],
+                                topic_stats = run_command(["docker", "exec", container_id, "/pulsar/bin/pulsar-admin", "topics", "stats", topic],
                                     capture_output=True, text=True, check=True)
                                 stats = topic_stats.stdout.splitlines()
                                 # Write stats to file
-                                with open(output_file_path, "a") as f:
-                                    f.write(f"          Stats: {stats}\n")
+                                report.stats(topic, stats)
                             except subprocess.CalledProcessError as e:
+                                report.failed(f"stats:{topic}", e)
+                                failed = True
                                 logger.error(f"Error fetching stats for topic {topic}: {e}")
                                 continue
+                        if not failed:
+                            report.done(f"namespace:{pns}")
             except subprocess.CalledProcessError as e:
                 logger.error(f"Error fetching tenants: {e}")
+                report.close()
                 return
+            report.close()
             logger.info(f"Successfully Collected the Tenants, Namespaces, and Topics info and saved to {output_file_path}")
         
 
@@ -347,108 +3413,353 @@ def fetch_tenants_info(args, broker_pods=None, proxy_pods=None, bastion_pods=Non
      output_file_path = os.path.join(args.output_dir, "tenants_namespaces_topics_list.txt")
 
     # Clear or create the file before appending data
-     with open(output_file_path, "w") as f:
-         f.write("Pulsar Tenants, Namespaces, and Topics\n")
+     report = TenantsReportWriter(args, output_file_path)
      logger.info(f"Fetching pulsar info from pod {pod_name}")
+     if args.bulk_admin and bulk_fetch_tenants_info(args, ["kubectl", "-n", args.namespace, "exec", "-i", pod_name, "--", "sh", "-s"], report):
+         report.close()
+         return
      
      #for pod_name in pod_name:
      try:
             # Fetch tenants
-            result = subprocess.run(["kubectl", "-n", args.namespace, "exec", "-it", pod_name, "--", "/pulsar/bin/pulsar-admin", "tenants", "list"],
-                capture_output=True, text=True, check=True)
-            tenants = result.stdout.splitlines()
+            tenants = admin_lookup(args, "tenants", "-", lambda: run_command(["kubectl", "-n", args.namespace, "exec", pod_name, "--", "/pulsar/bin/pulsar-admin",
+                "tenants", "list"], capture_output=True, text=True, check=True).stdout.splitlines())
             logger.debug(f"Tenants: {tenants}")
      except subprocess.CalledProcessError as e:
         logger.error(f"Error fetching tenants from pod {pod_name}: {e}")
+        report.close()
         return
      for tenant in tenants:
             tenant = tenant.strip()
             logger.debug(f"Tenant: {tenant}")
             # Write tenant to file
-            with open(output_file_path, "a") as f:
-                f.write(f"\nTenant: {tenant}\n")
+            report.tenant(tenant)
 
             try:
                 logger.debug(f"Fetching namespaces for tenant {tenant}")
                 # Fetch namespaces for the tenant
-                result = subprocess.run(["kubectl", "-n", args.namespace, "exec", "-it", pod_name, "--", "/pulsar/bin/pulsar-admin", "namespaces", "list", tenant],
-                    capture_output=True, text=True, check=True)
-                pulsar_namespaces = result.stdout.splitlines()
+                pulsar_namespaces = admin_lookup(args, "namespaces", tenant, lambda: run_command(["kubectl", "-n", args.namespace, "exec", pod_name, "--",
+                    "/pulsar/bin/pulsar-admin", "namespaces", "list", tenant], capture_output=True, text=True, check=True).stdout.splitlines())
                 logger.debug(f"Namespaces: {pulsar_namespaces}")
             except subprocess.CalledProcessError as e:
                 logger.error(f"Error fetching namespaces for tenant {tenant}: {e}")
                 continue
           
             for pns in pulsar_namespaces:
-                #write namespace retention policies to file
-                with open(output_file_path, "a") as f:
-                    f.write(f"  Namespace: {pns}\n")
-                try:
-                    # Fetch namespace retention policies
-                    logger.debug(f"Fetching retention policies for namespace {pns}")
-                    retention_policies = subprocess.run(["kubectl", "-n", args.namespace, "exec", "-it", pod_name, "--", "/pulsar/bin/pulsar-admin", "namespaces", "get-retention", pns],
-                        capture_output=True, text=True, check=True)
-                    retention = retention_policies.stdout.splitlines()
-                    # Write retention policies to file
-                    with open(output_file_path, "a") as f:
-                        f.write(f"          Retention Policies: {retention}\n")
-                except subprocess.CalledProcessError as e:
-                    logger.error(f"Error fetching retention policies for namespace {pns}: {e}")
+                retention_done = unit_done(args, f"retention:{pns}")
+                if retention_done and unit_done(args, f"namespace:{pns}"):
                     continue
-                
-            for pns in pulsar_namespaces:
+                report.namespace(pns)
+                policies = cached_policies(args, pns)
+                if policies is not None and not retention_done:
+                    report.retention(pns, format_admin_json(policies.get("retention_policies")), policies.get("retention_policies"))
+                elif not retention_done:
+                    try:
+                        # Fetch namespace retention policies
+                        logger.debug(f"Fetching retention policies for namespace {pns}")
+                        retention_policies = run_command(["kubectl", "-n", args.namespace, "exec", pod_name, "--", "/pulsar/bin/pulsar-admin", "namespaces", "get-retention", pns],
+                            capture_output=True, text=True, check=True)
+                        retention = retention_policies.stdout.splitlines()
+                        # Write retention policies to file
+                        report.retention(pns, retention)
+                    except subprocess.CalledProcessError as e:
+                        # the topics of the namespace are still fetched
+                        report.failed(f"retention:{pns}", e)
+                        logger.error(f"Error fetching retention policies for namespace {pns}: {e}")
+                if unit_done(args, f"namespace:{pns}"):
+                    continue
+
                 try:
                     # Fetch topics for the namespace
                     logger.debug(f"Fetching topics for namespace {pns}")
-                    topics_result = subprocess.run(["kubectl", "-n", args.namespace, "exec", "-it", pod_name, "--", "/pulsar/bin/pulsar-admin", "topics", "list", pns],
-                        capture_output=True, text=True, check=True)
-                    topics = topics_result.stdout.splitlines()
+                    topics = admin_lookup(args, "topics", pns, lambda: run_command(["kubectl", "-n", args.namespace, "exec", pod_name, "--", "/pulsar/bin/pulsar-admin",
+                        "topics", "list", pns], capture_output=True, text=True, check=True).stdout.splitlines())
                 except subprocess.CalledProcessError as e:
+                    report.failed(f"namespace:{pns}", e)
                     logger.error(f"Error fetching topics for namespace {pns}: {e}")
                     continue
 
+                failed = False
                 for topic in topics:
+                    if unit_done(args, f"stats:{topic}"):
+                        continue
                     # Write topic to file
-                    with open(output_file_path, "a") as f:
-                        f.write(f"     Topic: {topic}\n")
+                    report.topic(topic)
                     try:
                         # Fetch topic stats
                         logger.debug(f"Fetching stats for topic {topic}")
-                        topic_stats = subprocess.run(["kubectl", "-n", args.namespace, "exec", "-it", pod_name, "--", "/pulsar/bin/pulsar-admin", "topics", "stats", topic],
+                        topic_stats = run_command(["kubectl", "-n", args.namespace, "exec", pod_name, "--", "/pulsar/bin/pulsar-admin", "topics", "stats", topic],
                             capture_output=True, text=True, check=True)
                         stats = topic_stats.stdout.splitlines()
                         # Write stats to file
-                        with open(output_file_path, "a") as f:
-                            f.write(f"          Stats: {stats}\n")
+                        report.stats(topic, stats)
                     except subprocess.CalledProcessError as e:
+                        report.failed(f"stats:{topic}", e)
+                        failed = True
                         logger.error(f"Error fetching stats for topic {topic}: {e}")
                         continue
+                if not failed:
+                    report.done(f"namespace:{pns}")
 
+     report.close()
      logger.info(f"Successfully Collected the Tenants, Namespaces, and Topics info and saved to {output_file_path}")
 
-def get_pulsar_config(args, broker_pods=None, proxy_pods=None, bookie_pods=None, zookeeper_pods=None, bastion_pods=None, container_id=None, container_name=None):
+POD_CONFIG_FILES = ["broker.conf", "proxy.conf", "bookkeeper.conf", "zookeeper.conf", "client.conf"]
+# files compared across the pods of a component by the drift report, the others are only stored
+POD_CONFIG_COMPARED = {
+    "broker": ["broker.conf", "runtime-config.json"],
+    "proxy": ["proxy.conf"],
+    "bookie": ["bookkeeper.conf"],
+    "zookeeper": ["zookeeper.conf"],
+    "bastion": ["client.conf"],
+}
+# keys expected to differ from pod to pod, left out of the drift report
+POD_CONFIG_PER_POD_KEYS = {"advertisedAddress", "advertisedListeners", "bookieId", "brokerId"}
+POD_CONFIG_DRIFT_PODS = 5
+
+#Below shell script prints the conf files of a pod and, in broker pods, the runtime configuration of the broker and
+#the dynamic configuration of the cluster, as records of read_bulk_records
+POD_CONFIG_SCRIPT = r"""
+for f in %(files)s; do
+    if [ -f "/pulsar/conf/$f" ]; then
+        echo "@@DIAG conf 0 $f"
+        cat "/pulsar/conf/$f"
+        [ -n "$(tail -c 1 "/pulsar/conf/$f")" ] && echo
+    else
+        echo "@@DIAG conf 1 $f"
+    fi
+    echo "@@END"
+done
+if [ %(runtime)d -eq 1 ]; then
+    out=$(/pulsar/bin/pulsar-admin --admin-url %(admin_url)s brokers get-runtime-config 2>&1)
+    echo "@@DIAG runtime $? runtime-config.json"
+    printf '%%s\n' "$out"
+    echo "@@END"
+fi
+if [ %(dynamic)d -eq 1 ]; then
+    out=$(/pulsar/bin/pulsar-admin --admin-url %(admin_url)s brokers get-all-dynamic-config 2>&1)
+    echo "@@DIAG dynamic $? dynamic-config.json"
+    printf '%%s\n' "$out"
+    echo "@@END"
+fi
+"""
+
+#Below function returns the configuration of a conf file or of a JSON config as a {key: value} dict
+def parse_config_text(name, text):
+    if name.endswith(".json"):
+        try:
+            data = json.loads(text)
+        except ValueError:
+            return {}
+        return {key: value if isinstance(value, str) else json.dumps(value, sort_keys=True) for key, value in data.items()} if isinstance(data, dict) else {}
+    config = {}
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line[0] in "#!" or "=" not in line:
+            continue
+        key, value = line.split("=", 1)
+        config[key.strip()] = value.strip()
+    return config
+
+# what PodConfigStore writes under conf/
+POD_CONFIG_STORE_ENTRIES = ("distinct", "pod_config_map.json", "config_drift.txt")
+
+#Below class stores the config files of every pod once per distinct content under conf/distinct/<file>.<hash>, with
+#the pod to hash map in conf/pod_config_map.json and the key level drift between the pods of a component in
+#conf/config_drift.txt
+class PodConfigStore:
+    def __init__(self, directory, resume=False):
+        self.directory = directory
+        self.distinct_dir = os.path.join(directory, "distinct")
+        os.makedirs(self.distinct_dir, exist_ok=True)
+        self.map_path = os.path.join(directory, "pod_config_map.json")
+        self.pods = {}
+        if resume and os.path.exists(self.map_path):
+            # pods finished by the interrupted run are not fetched again
+            with open(self.map_path) as f:
+                self.pods = json.load(f)
+        self.lock = threading.Lock()
+
+    def file_path(self, name, digest):
+        return os.path.join(self.distinct_dir, f"{name}.{digest}")
+
+    def add(self, component, pod, files):
+        hashes = {}
+        for name, text in sorted(files.items()):
+            data = text.encode()
+            digest = hashlib.sha256(data).hexdigest()[:16]
+            hashes[name] = digest
+            with self.lock:
+                if not os.path.exists(self.file_path(name, digest)):
+                    with open(self.file_path(name, digest), "wb") as f:
+                        f.write(data)
+        with self.lock:
+            self.pods[pod] = {"component": component, "files": hashes}
+
+    def read(self, name, digest):
+        with open(self.file_path(name, digest)) as f:
+            return parse_config_text(name, f.read())
+
+    def write(self):
+        with open(self.map_path, "w") as f:
+            json.dump(dict(sorted(self.pods.items())), f, indent=2)
+        distinct = len(os.listdir(self.distinct_dir))
+        lines = [f"Config of {len(self.pods)} pods, {distinct} distinct files in {self.distinct_dir}",
+            f"Keys expected to differ per pod are not compared: {', '.join(sorted(POD_CONFIG_PER_POD_KEYS))}", ""]
+        drifted = 0
+        for component, names in POD_CONFIG_COMPARED.items():
+            pods = sorted(pod for pod, entry in self.pods.items() if entry["component"] == component)
+            for name in names:
+                versions = {}
+                for pod in pods:
+                    if name in self.pods[pod]["files"]:
+                        versions.setdefault(self.pods[pod]["files"][name], []).append(pod)
+                if not versions:
+                    continue
+                covered = sum(len(members) for members in versions.values())
+                if len(versions) == 1:
+                    lines.append(f"{component} {name}: identical in {covered} pods")
+                    continue
+                configs = {digest: self.read(name, digest) for digest in versions}
+                keys = sorted({key for config in configs.values() for key in config} - POD_CONFIG_PER_POD_KEYS)
+                differing = [key for key in keys if len({config.get(key) for config in configs.values()}) > 1]
+                lines.append(f"{component} {name}: {len(versions)} versions in {covered} pods, {len(differing)} keys differ")
+                drifted += len(differing)
+                for key in differing:
+                    lines.append(f"  {key}")
+                    values = {}
+                    for digest, members in versions.items():
+                        values.setdefault(configs[digest].get(key), []).extend(members)
+                    for value, members in sorted(values.items(), key=lambda item: -len(item[1])):
+                        shown = ", ".join(sorted(members)[:POD_CONFIG_DRIFT_PODS]) + (f" and {len(members) - POD_CONFIG_DRIFT_PODS} more" if len(members) > POD_CONFIG_DRIFT_PODS else "")
+                        lines.append(f"    {'<unset>' if value is None else value[:200]}: {len(members)} pods ({shown})")
+        with open(os.path.join(self.directory, "config_drift.txt"), "w") as f:
+            f.write("\n".join(lines) + "\n")
+        return distinct, drifted
+
+#Below function fetches the conf files of a pod in one exec, plus the runtime config of a broker and, when `dynamic`,
+#the dynamic config of the cluster, and returns them as {file name: text}
+def fetch_pod_config(args, component, pod, dynamic=False, exec_prefix=None):
+    logger = logging.getLogger("PulsarConfigCollector")
+    script = POD_CONFIG_SCRIPT % {
+        "files": " ".join(POD_CONFIG_FILES),
+        "runtime": 1 if component == "broker" else 0,
+        "dynamic": 1 if dynamic else 0,
+        "admin_url": BROKER_LOCAL_ADMIN_URL,
+    }
+    command = (exec_prefix or ["kubectl", "-n", args.namespace, "exec", "-i", pod, "--"]) + ["sh", "-s"]
+    files = {}
+    with command_slot(command), command_call(command) as call:
+        process, writer = start_script_session(command, script)
+        call["forked"] = not isinstance(process, KubeApiProcess)
+        stdout = CountingReader(process.stdout)
+        for kind, name, rc, lines in read_bulk_records(stdout):
+            if rc != 0:
+                if kind != "conf":
+                    logger.error(f"Error fetching the {kind} config from pod {pod}: {' '.join(lines)[:300]}")
+                continue
+            text = "\n".join(lines) + "\n"
+            if kind != "conf":
+                # sorted so the same configuration hashes the same on every broker
+                try:
+                    text = json.dumps(json.loads(text), indent=2, sort_keys=True) + "\n"
+                except ValueError:
+                    pass
+            files[name] = text
+        writer.join()
+        err = process.stderr.read()
+        process.wait()
+        call["rc"] = process.returncode
+        call["bytes"] = stdout.bytes
+    if not files:
+        raise RuntimeError(f"exit code {process.returncode}: {err.strip()}")
+    return files
+
+#Below function collects the config of every pod, or of every container with `exec_prefix`, in parallel into a
+#PodConfigStore
+def collect_pod_configs(args, pods_by_component, exec_prefix=None):
+    logger = logging.getLogger("PulsarConfigCollector")
+    store = PodConfigStore(os.path.join(args.output_dir, "conf"), resume=args.journal.resuming)
+    fetch = lambda component, pod, dynamic: store.add(component, pod, fetch_pod_config(args, component, pod, dynamic, exec_prefix(pod) if exec_prefix else None))
+    tasks = []
+    first_broker = True
+    for component, pods in pods_by_component.items():
+        for pod in pods or []:
+            if unit_done(args, f"conf:{pod}") and pod in store.pods:
+                continue
+            # the dynamic config is cluster wide, one broker is enough
+            tasks.append((component, pod, fetch, (component, pod, component == "broker" and first_broker)))
+            first_broker = first_broker and component != "broker"
+    logger.info(f"Collecting the config of {len(tasks)} pods with {args.parallel} workers")
+    for component, pod, error in run_in_pool(tasks, args.parallel, args.component_parallel):
+        record_unit(args, f"conf:{pod}", error)
+        if error:
+            logger.error(f"Error fetching pulsar config from pod {pod}: {error}")
+    distinct, drifted = store.write()
+    logger.info(f"Successfully collected the config of {len(store.pods)} pods into {distinct} distinct files, {drifted} keys drift between the pods of a component (see conf/config_drift.txt)")
+
+def get_pulsar_config(args, broker_pods=None, proxy_pods=None, bookie_pods=None, zookeeper_pods=None, bastion_pods=None, container_id=None, container_name=None, containers=None):
     logger = logging.getLogger("PulsarConfigCollector")
+    if args.type == "docker" and containers:
+        # the containers of a multi-node setup are compared like the pods of a cluster
+        by_component = {}
+        for name, _, component in containers:
+            by_component.setdefault(component, []).append(name)
+        return collect_pod_configs(args, by_component, lambda name: ["docker", "exec", "-i", name])
     if args.type == "docker":
         logger.info("Collecting pulsar config from docker")
         if not container_id:
             logger.error("No container ID provided. Exiting...")
             return
+        elif unit_done(args, f"conf:{container_name or container_id}"):
+            logger.info(f"Pulsar configs of container {container_id} were collected by the resumed run, skipping")
         else:
+            unit = f"conf:{container_name or container_id}"
+            if args.manifest:
+                try:
+                    incremental_copy(args, ["docker", "exec", container_id], container_name or container_id, "/pulsar/conf", f"{args.output_dir}/conf", f"conf/{container_name or container_id}/conf-delta.tar.gz")
+                except Exception as e:
+                    record_unit(args, unit, e)
+                    logger.error(f"Error fetching pulsar config from container {container_id}: {e}")
+                    return
+                record_unit(args, unit)
+                logger.info(f"Successfully collected changed pulsar configs from container {container_id}")
+                return
+            if args.bundle_writer:
+                tar_command, extension = in_pod_tar_command("/pulsar", ["conf"], args.bundle_compression)
+                try:
+                    _, rc, err = args.bundle_writer.add_command(f"conf/{container_name or container_id}/conf.{extension}", ["docker", "exec", container_id] + tar_command)
+                except Exception as e:
+                    record_unit(args, unit, e)
+                    logger.error(f"Unexpected error fetching pulsar config from container {container_id}: {e}")
+                    return
+                if rc not in (0, 1):
+                    record_unit(args, unit, err.strip())
+                    logger.error(f"Error fetching pulsar config from container {container_id}: {err.strip()}")
+                    return
+                record_unit(args, unit)
+                logger.info(f"Successfully streamed pulsar configs from container {container_id}")
+                return
             #copying the configuration from the docker instance
             output_file_path = f"{args.output_dir}"
             os.makedirs(output_file_path, exist_ok=True)
             try:
-                subprocess.run(["docker", "cp", f"{container_id}:/pulsar/conf/", f"{output_file_path}"],
+                run_command(["docker", "cp", f"{container_id}:/pulsar/conf/", f"{output_file_path}"],
                     capture_output=True, text=True, check=True)
             except subprocess.CalledProcessError as e:
+                record_unit(args, unit, e)
                 logger.error(f"Error fetching pulsar config from container {container_id}: {e}")
                 return
             except Exception as e:
+                record_unit(args, unit, e)
                 logger.error(f"Unexpected error fetching pulsar config from container {container_id}: {e}")
                 return
+            record_unit(args, unit)
             logger.info(f"Successfully collected pulsar configs from container {container_id}")
 
     elif args.type == "kube":
+        if args.config_all_pods:
+            return collect_pod_configs(args, {"broker": broker_pods, "proxy": proxy_pods, "bookie": bookie_pods, "zookeeper": zookeeper_pods, "bastion": bastion_pods})
         logger.info("Collecting pulsar config from kube")
         output_file_path = f"{args.output_dir}/conf"
         os.makedirs(output_file_path, exist_ok=True)
@@ -472,30 +3783,62 @@ def get_pulsar_config(args, broker_pods=None, proxy_pods=None, bookie_pods=None,
         for pod in admin_pod:
             first_pod = pod
         logger.debug(f"Fetching pulsar config from pod {first_pod}")
-        try:
-                # Fetch pulsar config from the pod
-            subprocess.run(["kubectl", "-n", args.namespace, "cp", f"{first_pod}:/pulsar/conf/broker.conf", f"{output_file_path}/broker.conf"],
-                    capture_output=True, text=True, check=True)
-            subprocess.run(["kubectl", "-n", args.namespace, "cp", f"{first_pod}:/pulsar/conf/proxy.conf", f"{output_file_path}/proxy.conf"],
-                    capture_output=True, text=True, check=True)
-            subprocess.run(["kubectl", "-n", args.namespace, "cp", f"{first_pod}:/pulsar/conf/bookkeeper.conf", f"{output_file_path}/bookkeeper.conf"],
-                    capture_output=True, text=True, check=True)
-            subprocess.run(["kubectl", "-n", args.namespace, "cp", f"{first_pod}:/pulsar/conf/zookeeper.conf", f"{output_file_path}/zookeeper.conf"],
-                    capture_output=True, text=True, check=True)
-        except subprocess.CalledProcessError as e:
-            logger.error(f"Error fetching pulsar config from pod {first_pod}: {e}")
+        conf_files = ["broker.conf", "proxy.conf", "bookkeeper.conf", "zookeeper.conf"]
+        if args.manifest or args.bundle_writer:
+            if unit_done(args, f"conf:{first_pod}"):
+                logger.info(f"Pulsar configs of pod {first_pod} were collected by the resumed run, skipping")
+                return
+        if args.manifest:
+            try:
+                incremental_copy(args, ["kubectl", "-n", args.namespace, "exec", first_pod, "--"], first_pod, "/pulsar/conf", output_file_path, f"conf/{first_pod}/conf-delta.tar.gz",
+                    names=conf_files)
+            except Exception as e:
+                record_unit(args, f"conf:{first_pod}", e)
+                logger.error(f"Error fetching pulsar config from pod {first_pod}: {e}")
+                return
+            record_unit(args, f"conf:{first_pod}")
+            logger.info(f"Successfully collected changed pulsar configs from pod {first_pod}")
             return
-        except Exception as e:
-            logger.error(f"Unexpected error fetching pulsar config from pod {first_pod}: {e}")
+        if args.bundle_writer:
+            tar_command, extension = in_pod_tar_command("/pulsar/conf", conf_files, args.bundle_compression)
+            try:
+                _, rc, err = args.bundle_writer.add_command(f"conf/{first_pod}/conf.{extension}", ["kubectl", "-n", args.namespace, "exec", first_pod, "--"] + tar_command)
+            except Exception as e:
+                record_unit(args, f"conf:{first_pod}", e)
+                logger.error(f"Unexpected error fetching pulsar config from pod {first_pod}: {e}")
+                return
+            # tar still archives the files it found when one of them is missing, the unit is recorded as failed
+            if rc != 0:
+                record_unit(args, f"conf:{first_pod}", err.strip())
+                logger.error(f"Error fetching pulsar config from pod {first_pod}: {err.strip()}")
+                return
+            record_unit(args, f"conf:{first_pod}")
+            logger.info(f"Successfully streamed pulsar configs from pod {first_pod}")
             return
+        for conf_file in conf_files:
+            if unit_done(args, f"conf:{first_pod}/{conf_file}"):
+                continue
+            try:
+                # Fetch pulsar config from the pod
+                if kube_api_backend is not None:
+                    copy_command_output(["kubectl", "-n", args.namespace, "exec", first_pod, "--", "cat", f"/pulsar/conf/{conf_file}"], f"{output_file_path}/{conf_file}")
+                else:
+                    run_command(["kubectl", "-n", args.namespace, "cp", f"{first_pod}:/pulsar/conf/{conf_file}", f"{output_file_path}/{conf_file}"],
+                        capture_output=True, text=True, check=True)
+                record_unit(args, f"conf:{first_pod}/{conf_file}")
+            except subprocess.CalledProcessError as e:
+                record_unit(args, f"conf:{first_pod}/{conf_file}", e)
+                logger.error(f"Error fetching pulsar config from pod {first_pod}: {e}")
+                return
+            except Exception as e:
+                record_unit(args, f"conf:{first_pod}/{conf_file}", e)
+                logger.error(f"Unexpected error fetching pulsar config from pod {first_pod}: {e}")
+                return
         logger.info(f"Successfully collected pulsar configs from pod {first_pod}")
 
 
     elif args.type == "standalone":
-        logger.info("Collecting pulsar config from standalone")
-        result = subprocess.run(["/pulsar/bin/pulsar-admin", "brokers", "list"],
-            capture_output=True, text=True, check=True)
-        return result.stdout
+        collect_standalone_config(args)
 
 def describe_pods(args, pods_info=None):
     #Describe all pods in the namespace
@@ -507,74 +3850,1987 @@ def describe_pods(args, pods_info=None):
         for pods in pods_info:
             pod_name = pods[0]
             pod_status = pods[1]
+            if unit_done(args, f"describe:{pod_name}"):
+                continue
             logger.debug(f"Describing pod: {pod_name}")
             try:
+                pod = args.inventory.pod(pod_name) if args.inventory else None
                 with open(f"{output_file_path}/{pod_name}.yaml", "w") as file:
-                    subprocess.run(["kubectl", "-n", args.namespace, "describe", "pod", pod_name], stdout=file, text=True)
+                    if pod:
+                        file.write(render_pod_description(args.inventory, pod))
+                    else:
+                        run_command(["kubectl", "-n", args.namespace, "describe", "pod", pod_name], stdout=file, text=True, check=True)
+                record_unit(args, f"describe:{pod_name}")
             except subprocess.CalledProcessError as e:
+                record_unit(args, f"describe:{pod_name}", e)
                 logger.error(f"Error describing pod {pod_name}: {e}")
                 continue
             except Exception as e:
+                record_unit(args, f"describe:{pod_name}", e)
                 logger.error(f"Unexpected error describing pod {pod_name}: {e}")
                 continue
   
 
+JVM_COMPONENTS = ("broker", "proxy", "bookie", "zookeeper")
+JVM_HOT_FRAMES = 20
+JVM_HISTOGRAM_ROWS = 60
+JVM_GC_LOG_TAIL_BYTES = 256 * 1024
+JVM_LOCK = re.compile(r"<(0x[0-9a-f]+)> \(a ([^)]+)\)")
+
+#Below shell script takes the thread dumps of the JVM of a pod in one exec session: --jvm-samples dumps
+#--jvm-interval apart with jcmd Thread.print (jstack when there is no jcmd), framed like the bulk admin records,
+#then optionally the class histogram and the tail of the newest GC log
+JVM_PROFILE_SCRIPT = r"""
+JCMD=$(command -v jcmd || echo "$JAVA_HOME/bin/jcmd")
+JSTACK=$(command -v jstack || echo "$JAVA_HOME/bin/jstack")
+PID=$("$JCMD" -l 2>/dev/null | awk '$2 !~ /JCmd/ {print $1; exit}')
+[ -z "$PID" ] && PID=$(pgrep -o java 2>/dev/null)
+if [ -z "$PID" ]; then
+    printf '@@DIAG error 1 -\nno JVM found, jcmd -l and pgrep java returned nothing\n@@END\n'
+    exit 0
+fi
+i=1
+while [ $i -le %(samples)d ]; do
+    printf '@@DIAG sample 0 %%s\n' "$i"
+    "$JCMD" "$PID" Thread.print -l 2>&1 || "$JSTACK" -l "$PID" 2>&1
+    printf '@@END\n'
+    [ $i -lt %(samples)d ] && sleep %(interval)s
+    i=$((i+1))
+done
+if [ %(gc)d -eq 1 ]; then
+    printf '@@DIAG histogram 0 %%s\n' "$PID"
+    "$JCMD" "$PID" GC.class_histogram 2>&1 | head -n %(histogram_rows)d
+    printf '@@END\n'
+    gclog=$(ls -t /pulsar/logs/*gc*.log* 2>/dev/null | grep -v '\.gz$' | head -n 1)
+    if [ -n "$gclog" ]; then
+        printf '@@DIAG gclog 0 %%s\n' "$gclog"
+        tail -c %(gc_tail_bytes)d "$gclog"
+        printf '@@END\n'
+    fi
+fi
+"""
+
+#Below function parses a comma separated list of components to profile, e.g. broker,bookie
+def parse_jvm_components(value):
+    components = [item.strip() for item in value.split(",") if item.strip()]
+    unknown = [item for item in components if item not in JVM_COMPONENTS]
+    if unknown or not components:
+        raise argparse.ArgumentTypeError(f"invalid components '{value}', choose from {','.join(JVM_COMPONENTS)}")
+    return components
+
+#Below function parses a jcmd Thread.print or jstack dump into threads with their state, frames (innermost first),
+#the lock they wait for and the locks they hold. It also tells whether the JVM reported a deadlock
+def parse_thread_dump(lines):
+    threads = []
+    thread = None
+    deadlock = False
+    for line in lines:
+        if line.startswith("Found one Java-level deadlock") or line.startswith("Found a total of"):
+            # the deadlock report repeats thread names, it is not part of the threads
+            deadlock = True
+            thread = None
+            continue
+        if deadlock:
+            continue
+        if line.startswith('"'):
+            thread = {"name": line[1:line.find('"', 1)], "state": None, "frames": [], "waiting": None, "locked": []}
+            threads.append(thread)
+            continue
+        if thread is None:
+            continue
+        stripped = line.strip()
+        if stripped.startswith("java.lang.Thread.State:"):
+            thread["state"] = stripped.split(":", 1)[1].split()[0]
+        elif stripped.startswith("at "):
+            thread["frames"].append(stripped[3:].split("(", 1)[0])
+        elif stripped.startswith("- waiting to lock"):
+            match = JVM_LOCK.search(stripped)
+            thread["waiting"] = match.groups() if match else None
+        elif stripped.startswith("- locked"):
+            match = JVM_LOCK.search(stripped)
+            if match:
+                thread["locked"].append(match.groups())
+    return threads, deadlock
+
+#Below function names the pool a thread belongs to by dropping its trailing numbers, e.g. pulsar-io-4-1 -> pulsar-io
+def thread_group(name):
+    return re.sub(r"([-_ #.:]*\d+)+$", "", name) or name
+
+#Below class aggregates the thread dumps of the pods of one component: collapsed stacks (pool;outermost;...;innermost
+#with a count, the format of flamegraph.pl and speedscope) of all threads and of the RUNNABLE ones, hot frames of
+#the RUNNABLE threads, thread states and the locks BLOCKED threads wait for with the thread holding them
+class JvmProfile:
+    def __init__(self, component):
+        self.component = component
+        self.lock = threading.Lock()
+        self.samples = 0
+        self.threads = 0
+        self.pods = set()
+        self.deadlocks = set()
+        self.states = {}
+        self.stacks = {}
+        self.runnable_stacks = {}
+        self.self_frames = {}
+        self.inclusive_frames = {}
+        self.contention = {}
+
+    def add(self, pod, lines):
+        threads, deadlock = parse_thread_dump(lines)
+        if not threads:
+            return False
+        owners = {address: thread for thread in threads for address, _ in thread["locked"]}
+        with self.lock:
+            self.samples += 1
+            self.threads += len(threads)
+            self.pods.add(pod)
+            if deadlock:
+                self.deadlocks.add(pod)
+            for thread in threads:
+                state = thread["state"] or "UNKNOWN"
+                self.states[state] = self.states.get(state, 0) + 1
+                stack = ";".join(frame.replace(";", ":") for frame in [thread_group(thread["name"])] + thread["frames"][::-1])
+                self.stacks[stack] = self.stacks.get(stack, 0) + 1
+                if state == "RUNNABLE" and thread["frames"]:
+                    self.runnable_stacks[stack] = self.runnable_stacks.get(stack, 0) + 1
+                    self.self_frames[thread["frames"][0]] = self.self_frames.get(thread["frames"][0], 0) + 1
+                    for frame in set(thread["frames"]):
+                        self.inclusive_frames[frame] = self.inclusive_frames.get(frame, 0) + 1
+                if thread["waiting"]:
+                    address, lock_class = thread["waiting"]
+                    owner = owners.get(address)
+                    key = (lock_class, thread_group(owner["name"]) if owner else "-", owner["frames"][0] if owner and owner["frames"] else "-")
+                    self.contention[key] = self.contention.get(key, 0) + 1
+        return True
+
+    def write_collapsed(self, directory):
+        for suffix, stacks in (("collapsed", self.stacks), ("runnable.collapsed", self.runnable_stacks)):
+            with open(os.path.join(directory, f"{self.component}.{suffix}"), "w") as f:
+                for stack, count in sorted(stacks.items()):
+                    f.write(f"{stack} {count}\n")
+
+    def write_summary(self, f):
+        f.write(f"\nComponent: {self.component} ({self.samples} thread dumps of {len(self.pods)} pods, {self.threads / max(1, self.samples):.0f} threads per dump)\n")
+        if self.deadlocks:
+            f.write(f"  JAVA-LEVEL DEADLOCK reported in: {', '.join(sorted(self.deadlocks))}\n")
+        f.write("  Thread states: " + ", ".join(f"{state} {count * 100 / max(1, self.threads):.1f}%" for state, count in sorted(self.states.items(), key=lambda item: -item[1])) + "\n")
+        runnable = max(1, self.states.get("RUNNABLE", 0))
+        for title, frames in (("Hot frames (top of RUNNABLE stacks)", self.self_frames), ("Hot frames (anywhere in RUNNABLE stacks)", self.inclusive_frames)):
+            f.write(f"  {title}:\n")
+            for frame, count in heapq.nlargest(JVM_HOT_FRAMES, frames.items(), key=lambda item: item[1]):
+                f.write(f"    {count * 100 / runnable:6.1f}% {count:>7}  {frame}\n")
+        if self.contention:
+            f.write("  Lock contention (BLOCKED thread samples per lock and holder):\n")
+            for (lock_class, owner, frame), count in heapq.nlargest(JVM_HOT_FRAMES, self.contention.items(), key=lambda item: item[1]):
+                f.write(f"    {count:>7}  {lock_class} held by {owner} at {frame}\n")
+
+#Below function profiles the JVM of one pod in one exec session. The dumps are written to jvm/<pod>/ as they
+#arrive and added to the profile of the component
+def profile_pod_jvm(args, pod, exec_prefix, profile):
+    directory = os.path.join(args.output_dir, "jvm", pod)
+    os.makedirs(directory, exist_ok=True)
+    script = JVM_PROFILE_SCRIPT % {"samples": args.jvm_samples, "interval": format(args.jvm_interval.total_seconds(), "g"), "gc": 1 if args.jvm_gc else 0,
+        "histogram_rows": JVM_HISTOGRAM_ROWS, "gc_tail_bytes": JVM_GC_LOG_TAIL_BYTES}
+    command = exec_prefix + ["sh", "-s"]
+    samples = 0
+    errors = []
+    # the whole session holds one exec slot
+    with command_slot(command), command_call(command) as call:
+        process, writer = start_script_session(command, script)
+        call["forked"] = not isinstance(process, KubeApiProcess)
+        stdout = CountingReader(process.stdout)
+        with open(os.path.join(directory, "thread_dumps.txt"), "w") as dumps:
+            for kind, key, rc, lines in read_bulk_records(stdout):
+                if kind == "sample":
+                    dumps.write(f"===== sample {key} =====\n")
+                    dumps.write("\n".join(lines) + "\n")
+                    if profile.add(pod, lines):
+                        samples += 1
+                    else:
+                        errors.append(" ".join(lines)[:300])
+                elif kind == "histogram":
+                    with open(os.path.join(directory, "class_histogram.txt"), "w") as f:
+                        f.write("\n".join(lines) + "\n")
+                elif kind == "gclog":
+                    with open(os.path.join(directory, "gc_log_tail.txt"), "w") as f:
+                        f.write(f"# last {JVM_GC_LOG_TAIL_BYTES} bytes of {key}\n" + "\n".join(lines) + "\n")
+                elif kind == "error":
+                    errors.append(" ".join(lines))
+        writer.join()
+        err = process.stderr.read()
+        process.wait()
+        call["rc"] = process.returncode
+        call["bytes"] = stdout.bytes
+    if not samples:
+        raise RuntimeError(errors[0] if errors else f"exit code {process.returncode}: {err.strip()}")
+    return samples
+
+#Below function takes --jvm-samples thread dumps --jvm-interval apart in every pod of the --jvm-components, in
+#parallel across pods, and aggregates them per component into collapsed stacks (jvm/<component>.collapsed for
+#flamegraph.pl or speedscope) and jvm/summary.txt with thread states, hot frames and lock contention
+def collect_jvm_profile(args, broker_pods=None, proxy_pods=None, bookie_pods=None, zookeeper_pods=None, container_name=None, container_id=None, containers=None):
+    logger = logging.getLogger("JvmProfiler")
+    jvm_dir = os.path.join(args.output_dir, "jvm")
+    os.makedirs(jvm_dir, exist_ok=True)
+    if args.type == "docker" and containers:
+        targets = [(component, name, ["docker", "exec", "-i", container_id]) for name, container_id, component in containers if component in args.jvm_components]
+    elif args.type == "docker":
+        if not container_id:
+            logger.error("No container ID provided. Exiting...")
+            return
+        targets = [("standalone", container_name or container_id, ["docker", "exec", "-i", container_id])]
+    else:
+        pods_by_component = {"broker": broker_pods, "proxy": proxy_pods, "bookie": bookie_pods, "zookeeper": zookeeper_pods}
+        targets = [(component, pod, ["kubectl", "-n", args.namespace, "exec", "-i", pod, "--"]) for component in args.jvm_components for pod in pods_by_component[component] or []]
+    if not targets:
+        logger.error(f"No running {', '.join(args.jvm_components)} pods found to profile. Exiting...")
+        return
+    profiles = {component: JvmProfile(component) for component, _, _ in targets}
+    tasks = [(component, pod, profile_pod_jvm, (args, pod, prefix, profiles[component])) for component, pod, prefix in targets]
+    logger.info(f"Taking {args.jvm_samples} thread dumps {args.jvm_interval.total_seconds():g}s apart in {len(tasks)} pods")
+    for component, pod, error in run_in_pool(tasks, args.parallel, args.component_parallel):
+        if error:
+            logger.error(f"Error profiling the JVM of pod {pod}: {error}")
+    with open(os.path.join(jvm_dir, "summary.txt"), "w") as f:
+        f.write("JVM thread dump profile\n")
+        for profile in profiles.values():
+            if profile.samples:
+                profile.write_collapsed(jvm_dir)
+                profile.write_summary(f)
+    for profile in profiles.values():
+        if profile.deadlocks:
+            logger.error(f"The JVM reported a Java-level deadlock in {', '.join(sorted(profile.deadlocks))}, see jvm/summary.txt")
+    logger.info(f"Profiled {sum(profile.samples for profile in profiles.values())} thread dumps of {len(tasks)} pods to {jvm_dir}")
+
+# metrics port of each component, pulsar and proxy serve /metrics on the web port, bookies and zookeeper on the stats port
+METRICS_PORTS = {"broker": 8080, "proxy": 8080, "bookkeeper": 8000, "zookeeper": 8000}
+# METRICS_PORTS component of the docker containers whose component is named differently
+CONTAINER_METRICS_COMPONENTS = {"bookie": "bookkeeper", "standalone": "broker"}
+METRICS_SUMMARY_FAMILIES = 15
+METRICS_HISTOGRAM_QUANTILES = (0.5, 0.95, 0.99)
+PROMETHEUS_LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+#Below function parses the Prometheus text format and yields (series, value), series being the metric name with
+#its labels exactly as exposed
+def parse_prometheus_text(text):
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        try:
+            if "{" in line:
+                end = line.rindex("}")
+                series, value = line[:end + 1], line[end + 1:].split()[0]
+            else:
+                series, value = line.split()[:2]
+            yield series, float(value)
+        except (ValueError, IndexError):
+            continue
+
+#Below function delta-encodes a column: the first value and then the difference to the previous value, with
+#missing samples as null. Integral numbers are written without a fraction so counters stay short
+def delta_encode(values):
+    encoded = []
+    previous = None
+    for value in values:
+        if value != value or value in (float("inf"), float("-inf")):
+            encoded.append(None)
+            continue
+        delta = value if previous is None else value - previous
+        encoded.append(int(delta) if float(delta).is_integer() else delta)
+        previous = value
+    return encoded
+
+#Below function reverses delta_encode
+def delta_decode(encoded):
+    values = []
+    previous = None
+    for delta in encoded:
+        if delta is None:
+            values.append(None)
+            continue
+        previous = delta if previous is None else previous + delta
+        values.append(previous)
+    return values
+
+#Below class keeps the metric samples of all targets in columns: series names are interned once for the whole run
+#and every target keeps one array of timestamps and one array of values per series, so a sample costs 8 bytes
+#instead of the exposition text repeated every interval. write() saves them delta-encoded to metrics/samples.json.gz
+class MetricsSamples:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.series = {}
+        self.targets = {}
+
+    def add(self, target, timestamp, samples):
+        with self.lock:
+            data = self.targets.setdefault(target, {"timestamps": array.array("d"), "columns": {}})
+            index = len(data["timestamps"])
+            data["timestamps"].append(timestamp)
+            for series, value in samples:
+                series_id = self.series.setdefault(series, len(self.series))
+                column = data["columns"].get(series_id)
+                if column is None:
+                    column = data["columns"][series_id] = array.array("d", [math.nan] * index)
+                if len(column) == index:
+                    column.append(value)
+            for column in data["columns"].values():
+                if len(column) == index:
+                    column.append(math.nan)
+
+    def write(self, path, interval):
+        names = sorted(self.series, key=self.series.get)
+        with gzip.open(path, "wt") as f:
+            json.dump({"format": "pulsar-diag-metrics/1", "interval_seconds": interval, "series": names,
+                "targets": {target: {"timestamps_ms": delta_encode([round(timestamp * 1000) for timestamp in data["timestamps"]]),
+                    "columns": {str(series_id): delta_encode(column) for series_id, column in data["columns"].items()}}
+                    for target, data in self.targets.items()}}, f, separators=(",", ":"))
+
+    #Below method summarizes the samples of a target: per counter family (_total, _count) the summed rate per
+    #interval, per quantile series the latency over the samples and per histogram the quantiles of the window
+    def summary(self, target):
+        data = self.targets[target]
+        names = {series_id: series for series, series_id in self.series.items()}
+        timestamps = data["timestamps"]
+        intervals = [later - earlier for earlier, later in zip(timestamps, timestamps[1:])]
+        counters = {}
+        quantiles = {}
+        buckets = {}
+        for series_id, column in data["columns"].items():
+            series = names[series_id]
+            family = series.split("{", 1)[0]
+            labels = dict(PROMETHEUS_LABEL.findall(series))
+            if family.endswith(("_total", "_count")) and intervals:
+                increases = counters.setdefault(family, [0.0] * len(intervals))
+                for i, (earlier, later) in enumerate(zip(column, column[1:])):
+                    if earlier == earlier and later == later:
+                        # a counter that went down was reset, it counted `later` since
+                        increases[i] += later - earlier if later >= earlier else later
+            elif "quantile" in labels:
+                values = quantiles.setdefault((family, labels["quantile"]), [math.nan] * len(column))
+                for i, value in enumerate(column):
+                    if value == value and not value <= values[i]:
+                        values[i] = value
+            elif family.endswith("_bucket") and "le" in labels:
+                present = [value for value in column if value == value]
+                if len(present) > 1:
+                    histogram = buckets.setdefault(family[:-len("_bucket")], {})
+                    bound = float(labels["le"])
+                    histogram[bound] = histogram.get(bound, 0) + max(0, present[-1] - present[0])
+        rates = []
+        for family, increases in counters.items():
+            interval_rates = [increase / seconds for increase, seconds in zip(increases, intervals) if seconds > 0]
+            if interval_rates and any(interval_rates):
+                rates.append((family, sum(interval_rates) / len(interval_rates), min(interval_rates), max(interval_rates)))
+        rates.sort(key=lambda rate: rate[1], reverse=True)
+        latencies = []
+        for (family, quantile), values in sorted(quantiles.items()):
+            present = [value for value in values if value == value]
+            if present:
+                latencies.append((family, quantile, sum(present) / len(present), max(present)))
+        histograms = []
+        for family, histogram in sorted(buckets.items()):
+            bounds = sorted(histogram)
+            total = histogram[bounds[-1]]
+            if total <= 0:
+                continue
+            values = []
+            for quantile in METRICS_HISTOGRAM_QUANTILES:
+                rank = quantile * total
+                lower_bound, lower_count = 0.0, 0.0
+                for bound in bounds:
+                    if histogram[bound] >= rank:
+                        # linear interpolation inside the bucket, like histogram_quantile()
+                        if bound == float("inf"):
+                            values.append(lower_bound)
+                        else:
+                            width = histogram[bound] - lower_count
+                            values.append(lower_bound + (bound - lower_bound) * ((rank - lower_count) / width if width else 1))
+                        break
+                    lower_bound, lower_count = bound, histogram[bound]
+            histograms.append((family, total, values))
+        return {"samples": len(timestamps), "seconds": timestamps[-1] - timestamps[0] if timestamps else 0, "series": len(data["columns"]),
+            "rates": rates[:METRICS_SUMMARY_FAMILIES], "latencies": latencies, "histograms": histograms}
+
+def write_metrics_summary(path, samples, failures):
+    with open(path, "w") as f:
+        f.write("Pulsar metrics summary\n")
+        for target in sorted(samples.targets):
+            summary = samples.summary(target)
+            f.write(f"\nPod: {target} ({summary['samples']} samples over {summary['seconds']:.0f}s, {summary['series']} series, {failures.get(target, 0)} failed scrapes)\n")
+            if summary["rates"]:
+                f.write(f"  {'rate per second':<70} {'avg':>14} {'min':>14} {'max':>14}\n")
+                for family, average, low, high in summary["rates"]:
+                    f.write(f"  {family:<70} {average:>14.2f} {low:>14.2f} {high:>14.2f}\n")
+            if summary["latencies"]:
+                f.write(f"  {'quantile':<70} {'avg':>14} {'max':>14}\n")
+                for family, quantile, average, high in summary["latencies"]:
+                    f.write(f"  {family + ' p' + quantile:<70} {average:>14.3f} {high:>14.3f}\n")
+            if summary["histograms"]:
+                f.write(f"  {'histogram':<70} {'count':>14}" + "".join(f" {'p' + format(quantile * 100, 'g'):>14}" for quantile in METRICS_HISTOGRAM_QUANTILES) + "\n")
+                for family, total, values in summary["histograms"]:
+                    f.write(f"  {family:<70} {total:>14.0f}" + "".join(f" {value:>14.3f}" for value in values) + "\n")
+        for target in sorted(set(failures) - set(samples.targets)):
+            f.write(f"\nPod: {target} (no samples, {failures[target]} failed scrapes)\n")
+
+#Below function parses a --metrics-url value, "name=url" or a url named after its host and port
+def parse_metrics_url(value):
+    name, sep, url = value.partition("=")
+    if not sep or "://" in name:
+        name, url = urllib.parse.urlsplit(value).netloc, value
+    if not urllib.parse.urlsplit(url).scheme.startswith("http"):
+        raise argparse.ArgumentTypeError(f"invalid metrics url '{value}', expected e.g. broker-0=http://localhost:8080/metrics")
+    return name, url
+
+#Below function returns the address of a docker container on its first network, or None when it has none
+def container_address(container_id):
+    result = run_command(["docker", "inspect", "-f", "{{range .NetworkSettings.Networks}}{{.IPAddress}} {{end}}", container_id],
+        capture_output=True, text=True, check=True)
+    return next(iter(result.stdout.split()), None)
+
+#Below function scrapes /metrics of every target in parallel every --metrics-interval for --metrics-duration.
+#Targets are the --metrics-url urls, or a port-forward to the metrics port of every broker, bookie, proxy and
+#zookeeper pod (in docker, the metrics port of every container at its address, http://localhost:8080/metrics for a
+#single container). Each target keeps one keep-alive connection, the first scrape of each is saved as is and the
+#samples go to metrics/samples.json.gz with a summary in metrics/summary.txt
+def collect_metrics(args, broker_pods=None, proxy_pods=None, bookie_pods=None, zookeeper_pods=None, containers=None):
+    logger = logging.getLogger("MetricsCollector")
+    metrics_dir = os.path.join(args.output_dir, "metrics")
+    os.makedirs(metrics_dir, exist_ok=True)
+    token = read_admin_token(args.admin_token)
+    interval = args.metrics_interval.total_seconds()
+    duration = args.metrics_duration.total_seconds()
+    targets = {}
+    port_forwards = []
+    clients = {}
+    try:
+        if args.metrics_url:
+            for name, url in args.metrics_url:
+                targets[name] = url
+        elif args.type == "kube":
+            pods = [(pod, METRICS_PORTS[component]) for component, component_pods in
+                (("broker", broker_pods), ("proxy", proxy_pods), ("bookkeeper", bookie_pods), ("zookeeper", zookeeper_pods)) for pod in component_pods or []]
+            with ThreadPoolExecutor(max_workers=max(1, args.parallel)) as executor:
+                forwards = executor.map(lambda target: lookup_port_forward(args.namespace, target[0], target[1]), pods)
+                for (pod, port), (forward, error) in zip(pods, forwards):
+                    if error:
+                        logger.error(f"Error starting port-forward to the metrics port {port} of pod {pod}: {error}")
+                        continue
+                    port_forwards.append(forward[0])
+                    targets[pod] = f"{forward[1]}/metrics"
+        elif args.type == "standalone":
+            targets["standalone"] = f"{args.admin_url}/metrics"
+        elif containers:
+            for name, container_id, component in containers:
+                port = METRICS_PORTS.get(CONTAINER_METRICS_COMPONENTS.get(component, component))
+                if not port:
+                    continue
+                try:
+                    address = container_address(container_id)
+                except subprocess.CalledProcessError as e:
+                    logger.error(f"Error looking up the address of container {name}: {e}")
+                    continue
+                if not address:
+                    logger.error(f"Container {name} has no network address, skipping its metrics")
+                    continue
+                targets[name] = f"http://{address}:{port}/metrics"
+        else:
+            targets[args.container or "standalone"] = "http://localhost:8080/metrics"
+        if not targets:
+            logger.error("No metrics targets found. Exiting...")
+            return
+        for name, url in targets.items():
+            parsed = urllib.parse.urlsplit(url)
+            clients[name] = (PulsarAdminRestClient(f"{parsed.scheme}://{parsed.netloc}", token=token, concurrency=1, pod=name),
+                parsed.path + (f"?{parsed.query}" if parsed.query else ""))
+        logger.info(f"Sampling the metrics of {len(clients)} pods every {interval:.0f}s for {duration:.0f}s")
+        samples = MetricsSamples()
+        failures = {}
+        collector = current_collector()
+
+        def scrape(name):
+            set_collector(collector)
+            client, path = clients[name]
+            try:
+                text = client.get(path, raw=True).decode(errors="replace")
+            except Exception as e:
+                return name, e
+            if name not in samples.targets:
+                with open(os.path.join(metrics_dir, f"{name}.prom"), "w") as f:
+                    f.write(text)
+            samples.add(name, time.time(), list(parse_prometheus_text(text)))
+            return name, None
+
+        start = time.monotonic()
+        rounds = max(1, int(duration // interval) + 1) if interval > 0 else 1
+        with ThreadPoolExecutor(max_workers=min(len(clients), 64)) as executor:
+            for i in range(rounds):
+                # sample on a fixed schedule, a slow round does not shift the following ones
+                time.sleep(max(0, start + i * interval - time.monotonic()))
+                for name, error in executor.map(scrape, clients):
+                    if error:
+                        failures[name] = failures.get(name, 0) + 1
+                        logger.error(f"Error scraping the metrics of {name}: {error}")
+    finally:
+        for client, _ in clients.values():
+            client.close()
+        for port_forward in port_forwards:
+            port_forward.terminate()
+    samples.write(os.path.join(metrics_dir, "samples.json.gz"), interval)
+    write_metrics_summary(os.path.join(metrics_dir, "summary.txt"), samples, failures)
+    logger.info(f"Collected {rounds} metric samples of {len(samples.targets)} pods ({len(samples.series)} series) to {metrics_dir}")
+
+# bookies serve their admin REST API on the stats port next to /metrics (httpServerEnabled)
+BOOKIE_HTTP_PORT = METRICS_PORTS["bookkeeper"]
+BOOKIE_DISKSTATS_SECONDS = 2
+# ledgers per page of /api/v1/ledger/list, fixed by the bookie
+BOOKIE_LEDGER_PAGE = 100
+BOOKIE_DIRECTORY_KINDS = {"journalDirectories": "journal", "journalDirectory": "journal", "ledgerDirectories": "ledger", "indexDirectories": "index"}
+BOOKIE_ID = re.compile(r"(?:BookieID:\s*)?([\w.-]+:\d+)(?:,|\s|$)")
+
+#Below shell script probes one bookie in one exec session, framed like the bulk admin records: its journal, ledger
+#and index directories (from bookkeeper.conf), df and the entry log files of each, two /proc/diskstats samples
+#$INTERVAL seconds apart for the disk latency, and the state and disk info of its REST API. The first bookie also
+#runs the cluster wide probes: the read-write and read-only bookies, bookieinfo, the auditor and the autorecovery state
+BOOKIE_PROBE_SCRIPT = r"""
+BK=/pulsar/bin/bookkeeper
+CONF=/pulsar/conf/bookkeeper.conf
+TMP=$(mktemp -d 2>/dev/null || echo /tmp/pulsar-diag-bookie-$$)
+mkdir -p "$TMP"
+trap 'rm -rf "$TMP"' EXIT
+http_get() {
+    if command -v curl >/dev/null 2>&1; then
+        curl -sSf --max-time 10 "http://localhost:%(port)d$1"
+    else
+        wget -q -T 10 -O - "http://localhost:%(port)d$1"
+    fi
+}
+dir_files() {
+    ls -ln "$1/current" 2>/dev/null | awk 'NR > 1 { n++; s += $5 } END { print n + 0, s + 0 }'
+}
+record() {
+    kind=$1; key=$2; shift 2
+    out=$("$@" 2>"$TMP/err"); rc=$?
+    [ $rc -ne 0 ] && out=$(cat "$TMP/err")
+    printf '@@DIAG %%s %%s %%s\n' "$kind" "$rc" "$key"
+    [ -n "$out" ] && printf '%%s\n' "$out"
+    printf '@@END\n'
+}
+cd /pulsar 2>/dev/null
+dirs=$(grep -E '^(journalDirectories|journalDirectory|ledgerDirectories|indexDirectories)=' "$CONF" 2>/dev/null)
+[ -n "$dirs" ] || dirs=$(ls -d data/standalone/bookkeeper* 2>/dev/null | sed 's/^/ledgerDirectories=/')
+printf '@@DIAG dirs 0 -\n%%s\n@@END\n' "$dirs"
+for dir in $(printf '%%s\n' "$dirs" | cut -d= -f2- | tr ',' '\n' | sort -u); do
+    record df "$dir" df -kP "$dir"
+    record files "$dir" dir_files "$dir"
+done
+record diskstats 1 cat /proc/diskstats
+sleep %(interval)d
+record diskstats 2 cat /proc/diskstats
+record state - http_get /api/v1/bookie/state
+record info - http_get /api/v1/bookie/info
+if [ %(cluster)d -eq 1 ]; then
+    record listbookies rw $BK shell listbookies -rw -h
+    record listbookies ro $BK shell listbookies -ro -h
+    record bookieinfo - $BK shell bookieinfo
+    record auditor - $BK shell whoisauditor
+    record autorecovery - http_get /api/v1/autorecovery/status
+fi
+"""
+
+#Below shell script fetches ledger metadata from the REST API of a bookie, $PAUSE seconds apart: the metadata of
+#each listed ledger id, or when none is listed the first %(pages)d pages of the ledger list with their metadata,
+#stopping at the first empty page. Each response is framed like the bulk admin records
+BOOKIE_LEDGER_SCRIPT = r"""
+PAUSE=%(pause)s
+http_get() {
+    if command -v curl >/dev/null 2>&1; then
+        curl -sSf --max-time 10 "http://localhost:%(port)d$1" 2>&1
+    else
+        wget -q -T 10 -O - "http://localhost:%(port)d$1" 2>&1
+    fi
+}
+emit() {
+    printf '@@DIAG %%s %%s %%s\n' "$1" "$3" "$2"
+    [ -n "$4" ] && printf '%%s\n' "$4"
+    printf '@@END\n'
+}
+ids="%(ids)s"
+if [ -n "$ids" ]; then
+    for id in $ids; do
+        out=$(http_get "/api/v1/ledger/metadata/?ledger_id=$id"); rc=$?
+        emit ledger "$id" "$rc" "$out"
+        sleep $PAUSE
+    done
+else
+    page=1
+    while [ $page -le %(pages)d ]; do
+        out=$(http_get "/api/v1/ledger/list/?print_metadata=true&page=$page"); rc=$?
+        emit page "$page" "$rc" "$out"
+        [ $rc -ne 0 ] && break
+        printf '%%s' "$out" | grep -q '[0-9]' || break
+        page=$((page+1))
+        sleep $PAUSE
+    done
+fi
+"""
+
+#Below function parses df -kP output into the device, sizes and mount of the directory
+def parse_df(lines):
+    fields = lines[-1].split() if len(lines) > 1 else []
+    try:
+        return {"device": fields[0], "size_kb": int(fields[1]), "used_kb": int(fields[2]), "available_kb": int(fields[3]),
+            "used_percent": int(fields[4].rstrip("%")), "mount": fields[5]}
+    except (IndexError, ValueError):
+        return {}
+
+def parse_diskstats(lines):
+    stats = {}
+    for line in lines:
+        fields = line.split()
+        if len(fields) >= 14:
+            stats[fields[2]] = [int(value) for value in fields[3:14]]
+    return stats
+
+#Below function returns the read and write latency (ms per request) and the utilization of a device between two
+#/proc/diskstats samples, or None when the device is not in them (overlay or tmpfs directories)
+def disk_latency(first, second, device, seconds):
+    name = device.rsplit("/", 1)[-1]
+    if name not in first or name not in second:
+        return None
+    delta = [after - before for before, after in zip(first[name], second[name])]
+    reads, read_ms, writes, write_ms, busy_ms = delta[0], delta[3], delta[4], delta[7], delta[9]
+    return {"reads": reads, "writes": writes, "read_await_ms": round(read_ms / reads, 2) if reads else 0.0,
+        "write_await_ms": round(write_ms / writes, 2) if writes else 0.0, "util_percent": round(min(100.0, busy_ms / (seconds * 10)), 1)}
+
+#Below function keeps the fields of a ledger's metadata that matter for write latency and placement, the bookies of
+#the last ensemble and the number of ensemble changes. Versions of the REST API name the ensembles differently
+def summarize_ledger(ledger_id, metadata, topic=None):
+    ensembles = metadata.get("allEnsembles") or metadata.get("ensembles") or {}
+    last = ensembles[max(ensembles, key=int)] if isinstance(ensembles, dict) and ensembles else []
+    summary = {"ledgerId": int(ledger_id), "topic": topic, "state": metadata.get("state"), "ensembleSize": metadata.get("ensembleSize"),
+        "writeQuorumSize": metadata.get("writeQuorumSize"), "ackQuorumSize": metadata.get("ackQuorumSize"), "lastEntryId": metadata.get("lastEntryId"),
+        "length": metadata.get("length"), "ctime": metadata.get("ctime"), "ensembleChanges": max(0, len(ensembles) - 1),
+        "lastEnsemble": [str(bookie.get("id", bookie)) if isinstance(bookie, dict) else str(bookie) for bookie in last]}
+    return {key: value for key, value in summary.items() if value is not None}
+
+#Below function runs the probe session in one bookie and returns its structured record, saved to bookies/<pod>.json
+def probe_bookie(args, pod, exec_prefix, cluster, records):
+    script = BOOKIE_PROBE_SCRIPT % {"port": BOOKIE_HTTP_PORT, "interval": BOOKIE_DISKSTATS_SECONDS, "cluster": 1 if cluster else 0}
+    command = exec_prefix + ["sh", "-s"]
+    record = {"pod": pod, "collected_at": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"), "directories": {}, "disks": [], "errors": []}
+    diskstats = {}
+    with command_slot(command), command_call(command) as call:
+        process, writer = start_script_session(command, script)
+        call["forked"] = not isinstance(process, KubeApiProcess)
+        stdout = CountingReader(process.stdout)
+        for kind, key, rc, lines in read_bulk_records(stdout):
+            if rc != 0:
+                record["errors"].append(f"{kind} {key}: {' '.join(lines)[:300]}")
+            elif kind == "dirs":
+                for line in lines:
+                    name, _, value = line.partition("=")
+                    record["directories"].setdefault(BOOKIE_DIRECTORY_KINDS.get(name, name), []).extend(item for item in value.split(",") if item)
+            elif kind == "df":
+                record["disks"].append(dict(parse_df(lines), directory=key))
+            elif kind == "files":
+                disk = next((disk for disk in record["disks"] if disk["directory"] == key), None)
+                if disk is not None and lines:
+                    disk["files"], disk["bytes"] = (int(value) for value in lines[0].split()[:2])
+            elif kind == "diskstats":
+                diskstats[key] = parse_diskstats(lines)
+            elif kind in ("state", "info", "autorecovery"):
+                record[kind] = parse_admin_output(lines)
+            elif kind == "listbookies":
+                record.setdefault("cluster", {})[f"{key}_bookies"] = [match.group(1) for match in map(BOOKIE_ID.match, lines) if match]
+            elif kind == "bookieinfo":
+                record.setdefault("cluster", {})[kind] = lines
+            elif kind == "auditor":
+                record.setdefault("cluster", {})[kind] = next((line.split(":", 1)[1].strip() for line in lines if line.startswith("Auditor:")), None)
+        writer.join()
+        err = process.stderr.read()
+        process.wait()
+        call["rc"] = process.returncode
+        call["bytes"] = stdout.bytes
+    if not record["directories"] and not record["errors"]:
+        raise RuntimeError(f"exit code {process.returncode}: {err.strip()}")
+    for disk in record["disks"]:
+        disk["kind"] = next((kind for kind, directories in record["directories"].items() if disk["directory"] in directories), None)
+        if "1" in diskstats and "2" in diskstats and disk.get("device"):
+            disk["latency"] = disk_latency(diskstats["1"], diskstats["2"], disk["device"], BOOKIE_DISKSTATS_SECONDS)
+    records[pod] = record
+
+#Below function picks the ledgers to look up: the newest ledgers of each hot topic (from their internal stats),
+#up to --bookie-ledgers in all
+def hot_topic_ledgers(args):
+    hot = getattr(args, "hot_ledgers", None) or {}
+    per_topic = max(1, args.bookie_ledgers // len(hot)) if hot else 0
+    ledgers = {}
+    for topic, ids in hot.items():
+        for ledger_id in ids[-per_topic:]:
+            ledgers.setdefault(ledger_id, topic)
+    return dict(list(ledgers.items())[:args.bookie_ledgers])
+
+#Below function fetches ledger metadata through the REST API of one bookie in one exec session, paced to
+#--bookie-ledger-qps, and writes bookies/ledgers.jsonl. It returns the ledger summaries
+def fetch_bookie_ledgers(args, pod, exec_prefix):
+    logger = logging.getLogger("BookieCollector")
+    topics = hot_topic_ledgers(args)
+    pages = max(1, -(-args.bookie_ledgers // BOOKIE_LEDGER_PAGE))
+    script = BOOKIE_LEDGER_SCRIPT % {"port": BOOKIE_HTTP_PORT, "pause": format(1 / args.bookie_ledger_qps, "g") if args.bookie_ledger_qps > 0 else "0",
+        "ids": " ".join(str(ledger_id) for ledger_id in topics), "pages": pages}
+    if topics:
+        logger.info(f"Fetching the metadata of {len(topics)} ledgers of {len(set(topics.values()))} hot topics from bookie {pod}")
+    else:
+        logger.info(f"Fetching up to {pages} pages of the ledger list with metadata from bookie {pod}")
+    command = exec_prefix + ["sh", "-s"]
+    ledgers = []
+    errors = 0
+    with command_slot(command), command_call(command) as call:
+        process, writer = start_script_session(command, script)
+        call["forked"] = not isinstance(process, KubeApiProcess)
+        stdout = CountingReader(process.stdout)
+        for kind, key, rc, lines in read_bulk_records(stdout):
+            if rc != 0:
+                errors += 1
+                logger.error(f"Error fetching ledger {kind} {key} from bookie {pod}: {' '.join(lines)[:300]}")
+                continue
+            try:
+                value = json.loads("\n".join(lines) or "{}")
+            except ValueError as e:
+                errors += 1
+                logger.error(f"Error parsing ledger {kind} {key} from bookie {pod}: {e}")
+                continue
+            for ledger_id, metadata in (value.items() if isinstance(value, dict) else []):
+                if len(ledgers) < args.bookie_ledgers:
+                    ledgers.append(summarize_ledger(ledger_id, metadata if isinstance(metadata, dict) else {}, topics.get(int(ledger_id))))
+        writer.join()
+        process.wait()
+        call["rc"] = process.returncode
+        call["bytes"] = stdout.bytes
+    with open(os.path.join(args.output_dir, "bookies", "ledgers.jsonl"), "w") as f:
+        for ledger in ledgers:
+            f.write(json.dumps(ledger, separators=(",", ":")) + "\n")
+    if errors and not ledgers:
+        raise RuntimeError(f"{errors} ledger lookups failed")
+    return ledgers
+
+#Below function tells whether a bookie id (host:port, the host usually <pod>.<service>...) belongs to a pod
+def bookie_id_matches(bookie_id, pod):
+    return bookie_id.split(":", 1)[0].split(".", 1)[0] == pod
+
+def write_bookie_summary(path, records, ledgers):
+    cluster = next((record["cluster"] for record in records.values() if "cluster" in record), {})
+    readonly = cluster.get("ro_bookies", [])
+    with open(path, "w") as f:
+        f.write(f"Bookie diagnostics of {len(records)} bookies\n")
+        if cluster:
+            f.write(f"  read-write bookies: {len(cluster.get('rw_bookies', []))}, read-only bookies: {len(readonly)} {' '.join(readonly)}\n")
+            f.write(f"  auditor: {cluster.get('auditor') or '-'}\n")
+        f.write(f"\n  {'bookie':<32} {'state':>6} {'kind':>8} {'used %':>7} {'free GB':>8} {'files':>7} {'r ms':>7} {'w ms':>7} {'util %':>7} {'ledgers':>8}  directory\n")
+        for pod, record in sorted(records.items()):
+            state = record.get("state") if isinstance(record.get("state"), dict) else {}
+            mode = "-" if not state else "ro" if state.get("readOnly") else "rw" if state.get("running", True) else "down"
+            if any(bookie_id_matches(bookie_id, pod) for bookie_id in readonly):
+                mode = "ro"
+            for disk in record["disks"] or [{}]:
+                latency = disk.get("latency") or {}
+                f.write(f"  {pod:<32} {mode:>6} {disk.get('kind') or '-':>8} {disk.get('used_percent', '-'):>7} "
+                    f"{format(disk['available_kb'] / 1048576, '.1f') if 'available_kb' in disk else '-':>8} {disk.get('files', '-'):>7} "
+                    f"{latency.get('read_await_ms', '-'):>7} {latency.get('write_await_ms', '-'):>7} {latency.get('util_percent', '-'):>7} {record.get('ledgers', 0):>8}  {disk.get('directory', '-')}\n")
+            for error in record["errors"]:
+                f.write(f"  {pod:<32} error: {error}\n")
+        if ledgers:
+            states = {}
+            quorums = {}
+            for ledger in ledgers:
+                states[ledger.get("state", "-")] = states.get(ledger.get("state", "-"), 0) + 1
+                quorum = f"{ledger.get('ensembleSize', '-')}/{ledger.get('writeQuorumSize', '-')}/{ledger.get('ackQuorumSize', '-')}"
+                quorums[quorum] = quorums.get(quorum, 0) + 1
+            f.write(f"\n{len(ledgers)} ledgers inspected, by state: {', '.join(f'{state} {count}' for state, count in sorted(states.items()))}, "
+                f"by E/Qw/Qa: {', '.join(f'{quorum} {count}' for quorum, count in sorted(quorums.items()))}\n")
+            changed = sorted(ledgers, key=lambda ledger: ledger.get("ensembleChanges", 0), reverse=True)[:10]
+            for ledger in changed:
+                if ledger.get("ensembleChanges"):
+                    f.write(f"  ledger {ledger['ledgerId']}: {ledger['ensembleChanges']} ensemble changes, {ledger.get('topic') or '-'}\n")
+
+#Below function probes every bookie pod (or bookie container) in parallel, bounded by --parallel and
+#--component-parallel: disk usage and latency of the journal and ledger directories, the bookie state and, from the
+#first bookie, the cluster wide bookie lists, the auditor and the metadata of the hot topics' ledgers. Each bookie
+#gets a structured record in bookies/<pod>.json, with bookies/ledgers.jsonl and bookies/summary.txt
+def collect_bookie_diag(args, bookie_pods=None, container_name=None, container_id=None, containers=None):
+    logger = logging.getLogger("BookieCollector")
+    bookie_dir = os.path.join(args.output_dir, "bookies")
+    os.makedirs(bookie_dir, exist_ok=True)
+    if args.type == "docker" and containers:
+        targets = [(name, ["docker", "exec", "-i", container_id]) for name, container_id, component in containers if component == "bookie"]
+    elif args.type == "docker":
+        if not container_id:
+            logger.error("No container ID provided. Exiting...")
+            return
+        targets = [(container_name or container_id, ["docker", "exec", "-i", container_id])]
+    else:
+        targets = [(pod, ["kubectl", "-n", args.namespace, "exec", "-i", pod, "--"]) for pod in bookie_pods or []]
+    if not targets:
+        logger.error("No running bookie pods found. Exiting...")
+        return
+    records = {}
+    ledgers = []
+
+    def ledger_task(pod, prefix):
+        ledgers.extend(fetch_bookie_ledgers(args, pod, prefix))
+
+    tasks = [("bookie", pod, probe_bookie, (args, pod, prefix, i == 0, records)) for i, (pod, prefix) in enumerate(targets)]
+    if args.bookie_ledgers > 0:
+        tasks.append(("ledgers", targets[0][0], ledger_task, targets[0]))
+    logger.info(f"Probing {len(targets)} bookies")
+    for group, pod, error in run_in_pool(tasks, args.parallel, args.component_parallel):
+        if error:
+            logger.error(f"Error fetching the {'ledger metadata from' if group == 'ledgers' else 'diagnostics of'} bookie {pod}: {error}")
+    for pod, record in records.items():
+        record["ledgers"] = sum(1 for ledger in ledgers if any(bookie_id_matches(bookie_id, pod) for bookie_id in ledger.get("lastEnsemble", [])))
+        with open(os.path.join(bookie_dir, f"{pod}.json"), "w") as f:
+            json.dump(record, f, indent=2)
+    write_bookie_summary(os.path.join(bookie_dir, "summary.txt"), records, ledgers)
+    logger.info(f"Collected the diagnostics of {len(records)} bookies and {len(ledgers)} ledgers to {bookie_dir}")
+
+WATCH_SNAPSHOT_STAMP = "%Y%m%dT%H%M%SZ"
+WATCH_COMPONENTS = ("broker", "proxy", "bookkeeper", "zookeeper", "bastion")
+# the log tail of a snapshot reaches this far back into the previous one, so no line falls between two snapshots
+WATCH_LOG_OVERLAP_SECONDS = 10
+WATCH_STREAM_SECONDS = 300
+WATCH_RETRY_SECONDS = 5
+WATCH_DUMP_COOLDOWN_SECONDS = 900
+WATCH_TRIGGER = re.compile(r"([A-Za-z_:][\w:]*)\s*(>=|<=|>|<)\s*(-?[\d.]+(?:[eE][-+]?\d+)?)")
+WATCH_OPERATORS = {">": lambda value, threshold: value > threshold, ">=": lambda value, threshold: value >= threshold,
+    "<": lambda value, threshold: value < threshold, "<=": lambda value, threshold: value <= threshold}
+
+#Below function parses a --watch-trigger value, a metric name, a comparison and a threshold like
+#pulsar_storage_write_latency>100
+def parse_watch_trigger(value):
+    match = WATCH_TRIGGER.fullmatch(value.strip())
+    if not match:
+        raise argparse.ArgumentTypeError(f"invalid trigger '{value}', expected e.g. pulsar_storage_write_latency>100")
+    return match.group(1), match.group(2), float(match.group(3))
+
+#Below class keeps the pods of the inventory current while watching: the pods are listed once and then updated
+#one ADDED, MODIFIED or DELETED event at a time from a watch of the API server started at the resource version of
+#the list (kubectl get --raw, in-process with the API backend). An ended watch resumes from the last version seen,
+#the pods are only listed again when the API server no longer has that version
+class PodWatcher:
+    def __init__(self, inventory):
+        self.inventory = inventory
+        self.namespace = inventory.namespace
+        self.lock = threading.Lock()
+        self.version = None
+        self.changes = 0
+        self.stopped = threading.Event()
+        self.process = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.list()
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        process = self.process
+        if process is not None:
+            process.kill()
+        self.thread.join(timeout=5)
+
+    def list(self):
+        result = run_command(["kubectl", "get", "--raw", f"/api/v1/namespaces/{self.namespace}/pods"], capture_output=True, text=True, check=True)
+        listing = json.loads(result.stdout)
+        pods = listing.get("items", [])
+        for pod in pods:
+            pod.setdefault("kind", "Pod")
+        with self.lock:
+            # replaced, never changed in place, so readers iterate a consistent list without the lock
+            self.inventory.items["pods"] = pods
+            self.version = listing.get("metadata", {}).get("resourceVersion")
+            self.changes += 1
+
+    def apply(self, event):
+        kind = event.get("type")
+        item = event.get("object") or {}
+        if kind == "ERROR":
+            # 410 Gone: the version is too old to resume from
+            if item.get("code") == 410:
+                self.version = None
+                return
+            raise RuntimeError(item.get("message") or "watch error")
+        version = item.get("metadata", {}).get("resourceVersion")
+        if kind == "BOOKMARK":
+            self.version = version or self.version
+            return
+        name = item["metadata"]["name"]
+        item.setdefault("kind", "Pod")
+        with self.lock:
+            pods = [pod for pod in self.inventory.items["pods"] if pod["metadata"]["name"] != name]
+            if kind != "DELETED":
+                pods.append(item)
+            self.inventory.items["pods"] = pods
+            self.version = version or self.version
+            self.changes += 1
+
+    #Below method follows one watch until the API server ends it
+    def follow(self):
+        query = urllib.parse.urlencode({"watch": "true", "allowWatchBookmarks": "true", "resourceVersion": self.version, "timeoutSeconds": WATCH_STREAM_SECONDS})
+        # a long lived stream, outside the command limits and the run stats
+        self.process = popen_command(["kubectl", "get", "--raw", f"/api/v1/namespaces/{self.namespace}/pods?{query}"],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        try:
+            for line in self.process.stdout:
+                if line.strip():
+                    self.apply(json.loads(line))
+                if self.version is None:
+                    break
+        finally:
+            self.process.kill()
+            self.process.wait()
+            error = self.process.stderr.read().decode(errors="replace").strip()
+            self.process.stdout.close()
+            self.process.stderr.close()
+        if self.process.returncode not in (0, -9) and not self.stopped.is_set():
+            raise RuntimeError(error or f"kubectl exited with {self.process.returncode}")
+
+    def run(self):
+        logger = logging.getLogger("PodWatcher")
+        while not self.stopped.is_set():
+            try:
+                if self.version is None:
+                    self.list()
+                    logger.info(f"Listed {len(self.inventory.items['pods'])} pods of namespace {self.namespace}")
+                self.follow()
+            except Exception as e:
+                if self.stopped.is_set():
+                    break
+                logger.error(f"Error watching the pods of namespace {self.namespace}, retrying in {WATCH_RETRY_SECONDS}s: {e}")
+                self.stopped.wait(WATCH_RETRY_SECONDS)
+
+#Below class is the ring buffer of snapshots under watch/snapshots/<UTC time>: after each snapshot the oldest ones
+#are removed while they are older than --watch-retention or all of them take more than --watch-max-bytes. The
+#newest snapshot is always kept
+class SnapshotRing:
+    def __init__(self, directory, retention, max_bytes):
+        self.directory = directory
+        self.retention = retention
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        # snapshots of an earlier watch of the same output directory stay in the ring
+        self.entries = [(name, path_size(os.path.join(directory, name))) for name in sorted(os.listdir(directory))
+            if os.path.isdir(os.path.join(directory, name))]
+
+    def total(self):
+        return sum(size for _, size in self.entries)
+
+    def new(self):
+        now = datetime.now(timezone.utc)
+        name = now.strftime(WATCH_SNAPSHOT_STAMP)
+        while self.entries and name <= self.entries[-1][0]:
+            now += timedelta(seconds=1)
+            name = now.strftime(WATCH_SNAPSHOT_STAMP)
+        os.makedirs(os.path.join(self.directory, name))
+        return name, os.path.join(self.directory, name)
+
+    def add(self, name):
+        self.entries.append((name, path_size(os.path.join(self.directory, name))))
+        return self.evict()
+
+    def evict(self):
+        oldest = (datetime.now(timezone.utc) - self.retention).strftime(WATCH_SNAPSHOT_STAMP)
+        evicted = 0
+        while len(self.entries) > 1 and (self.entries[0][0] < oldest or self.total() > self.max_bytes):
+            name, _ = self.entries.pop(0)
+            shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+            evicted += 1
+        return evicted
+
+    #Below method puts the snapshots of the ring into a dump as hard links, so they survive eviction without
+    #being copied (copied when the dump is on another filesystem)
+    def preserve(self, destination):
+        for name, _ in self.entries:
+            source = os.path.join(self.directory, name)
+            for root, _, files in os.walk(source):
+                target = os.path.join(destination, name, os.path.relpath(root, source))
+                os.makedirs(target, exist_ok=True)
+                for file in files:
+                    try:
+                        os.link(os.path.join(root, file), os.path.join(target, file))
+                    except OSError:
+                        shutil.copy2(os.path.join(root, file), os.path.join(target, file))
+
+#Below class is the watch mode: a snapshot every --watch interval (the log tail of every pod since the previous
+#snapshot, one metrics scrape of every broker, bookie, proxy and zookeeper pod and the hot topics ranked from the
+#broker stats) into the snapshot ring, and a full collection into watch/dumps/<UTC time> when a --watch-trigger
+#threshold is crossed or on SIGUSR1. The pods come from the inventory kept current by a PodWatcher, port-forwards
+#and keep-alive connections to the metrics ports stay open between snapshots and are only set up for new pods
+class WatchSession:
+    def __init__(self, args):
+        self.args = args
+        self.directory = os.path.join(args.output_dir, "watch")
+        self.interval = args.watch.total_seconds()
+        self.ring = SnapshotRing(os.path.join(self.directory, "snapshots"), args.watch_retention, args.watch_max_bytes)
+        if args.inventory is None:
+            args.inventory = KubeInventory(args.namespace)
+        self.watcher = PodWatcher(args.inventory)
+        self.token = read_admin_token(args.admin_token)
+        self.targets = {}
+        self.targets_version = None
+        self.last_snapshot = None
+        self.last_dump = None
+        self.stop = threading.Event()
+        self.wake = threading.Event()
+        self.dump_requested = threading.Event()
+
+    def request_dump(self, *_):
+        self.dump_requested.set()
+        self.wake.set()
+
+    def request_stop(self, *_):
+        self.stop.set()
+        self.wake.set()
+
+    def pods(self):
+        return {component: component_pods(self.args, self.args.inventory.pod_rows(), component) for component in WATCH_COMPONENTS}
+
+    #Below method opens metrics targets for new pods and closes those of pods that are gone or whose port-forward died
+    def refresh_targets(self, pods):
+        logger = logging.getLogger("Watch")
+        if self.args.metrics_url:
+            if not self.targets:
+                for name, url in self.args.metrics_url:
+                    parsed = urllib.parse.urlsplit(url)
+                    self.targets[name] = (None, PulsarAdminRestClient(f"{parsed.scheme}://{parsed.netloc}", token=self.token, concurrency=1, pod=name),
+                        parsed.path + (f"?{parsed.query}" if parsed.query else ""), None)
+            return
+        wanted = {pod: component for component in METRICS_PORTS for pod in pods[component]}
+        for pod, (forward, client, _, _) in list(self.targets.items()):
+            if pod not in wanted or forward.poll() is not None:
+                client.close()
+                forward.terminate()
+                del self.targets[pod]
+        missing = [pod for pod in wanted if pod not in self.targets]
+        if not missing:
+            return
+        with ThreadPoolExecutor(max_workers=max(1, min(self.args.parallel, len(missing)))) as executor:
+            forwards = executor.map(lambda pod: lookup_port_forward(self.args.namespace, pod, METRICS_PORTS[wanted[pod]]), missing)
+            for pod, (forward, error) in zip(missing, forwards):
+                if error:
+                    logger.error(f"Error starting port-forward to the metrics port of pod {pod}: {error}")
+                    continue
+                self.targets[pod] = (forward[0], PulsarAdminRestClient(forward[1], token=self.token, concurrency=1, pod=pod), "/metrics", wanted[pod])
+
+    def close_targets(self):
+        for forward, client, _, _ in self.targets.values():
+            client.close()
+            if forward is not None:
+                forward.terminate()
+        self.targets = {}
+
+    #Below method takes one snapshot and returns the crossed trigger, or None
+    def snapshot(self):
+        global run_stats
+        logger = logging.getLogger("Watch")
+        # the run stats only cover the current snapshot, a long watch does not accumulate them
+        run_stats = RunStats()
+        start = time.monotonic()
+        name, directory = self.ring.new()
+        pods = self.pods()
+        if self.targets_version != self.watcher.changes or any(forward is not None and forward.poll() is not None for forward, _, _, _ in self.targets.values()):
+            self.targets_version = self.watcher.changes
+            self.refresh_targets(pods)
+        since = self.interval if self.last_snapshot is None else time.monotonic() - self.last_snapshot
+        self.last_snapshot = time.monotonic()
+        since = math.ceil(since) + WATCH_LOG_OVERLAP_SECONDS
+        samples = MetricsSamples()
+        summaries = {}
+        summaries_lock = threading.Lock()
+        failures = []
+
+        def tail(component, pod):
+            set_collector("watch")
+            os.makedirs(os.path.join(directory, "logs", component), exist_ok=True)
+            with gzip.open(os.path.join(directory, "logs", component, f"{pod}.log.gz"), "wb") as f:
+                _, rc, err = stream_command(["kubectl", "-n", self.args.namespace, "logs", pod, "--all-containers=true", f"--since={since}s"],
+                    lambda stdout: shutil.copyfileobj(stdout, f, BUNDLE_CHUNK_BYTES))
+            if rc != 0:
+                raise RuntimeError(err.strip())
+
+        def scrape(target):
+            set_collector("watch")
+            _, client, path, component = self.targets[target]
+            samples.add(target, time.time(), list(parse_prometheus_text(client.get(path, raw=True).decode(errors="replace"))))
+            # brokers serve the admin API on the same port, so the hot topics come over the same connection
+            if component == "broker":
+                topics = {topic: summarize_topic_stats(stats) for topic, stats in iter_broker_topic_stats(client.broker_topic_stats())}
+                with summaries_lock:
+                    summaries.update(topics)
+
+        with ThreadPoolExecutor(max_workers=max(1, self.args.parallel)) as executor:
+            futures = {executor.submit(tail, component, pod): f"log tail of {pod}" for component, component_pods in pods.items() for pod in component_pods}
+            futures.update({executor.submit(scrape, target): f"metrics of {target}" for target in self.targets})
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    failures.append(futures[future])
+                    logger.error(f"Error collecting the {futures[future]}: {e}")
+        if samples.targets:
+            samples.write(os.path.join(directory, "samples.json.gz"), self.interval)
+        if summaries:
+            brokers = sum(1 for _, _, _, component in self.targets.values() if component == "broker")
+            write_hot_topics(os.path.join(directory, "hot_topics.txt"), summaries, rank_hot_topics(summaries, self.args.top_topics or 10, self.args.top_topics_by), brokers)
+        with open(os.path.join(directory, "snapshot.json"), "w") as f:
+            json.dump({"time": name, "seconds": round(time.monotonic() - start, 3), "log_since_seconds": since,
+                "pods": {component: component_pods for component, component_pods in pods.items() if component_pods},
+                "metrics_targets": sorted(samples.targets), "failed": failures}, f, indent=2)
+        evicted = self.ring.add(name)
+        logger.info(f"Snapshot {name}: {sum(len(component_pods) for component_pods in pods.values())} pods, {len(samples.targets)} metrics targets, "
+            f"{len(failures)} failed in {time.monotonic() - start:.1f}s, {len(self.ring.entries)} snapshots ({self.ring.total()} bytes) kept"
+            + (f", {evicted} evicted" if evicted else ""))
+        return self.crossed_trigger(samples)
+
+    def crossed_trigger(self, samples):
+        names = {series_id: series for series, series_id in samples.series.items()}
+        for metric, operator, threshold in self.args.watch_trigger or []:
+            for target, data in samples.targets.items():
+                for series_id, column in data["columns"].items():
+                    series = names[series_id]
+                    if series.split("{", 1)[0] == metric and column[-1] == column[-1] and WATCH_OPERATORS[operator](column[-1], threshold):
+                        return f"{series} of {target} is {column[-1]:g} ({operator} {threshold:g})"
+        return None
+
+    #Below method runs a full collection into watch/dumps/<UTC time>, with the snapshots of the ring linked under
+    #snapshots/ so the minutes before the dump are kept with it
+    def dump(self, reason):
+        global run_stats, command_limits
+        logger = logging.getLogger("Watch")
+        name = datetime.now(timezone.utc).strftime(WATCH_SNAPSHOT_STAMP)
+        directory = os.path.join(self.directory, "dumps", name)
+        os.makedirs(directory, exist_ok=True)
+        logger.info(f"Dumping a full collection to {directory}: {reason}")
+        with open(os.path.join(directory, "dump_reason.txt"), "w") as f:
+            f.write(f"{name} {reason}\n")
+        self.ring.preserve(os.path.join(directory, "snapshots"))
+        args = copy.copy(self.args)
+        args.output_dir = directory
+        args.run_id = name
+        args.manifest = None
+        args.journal = DiagJournal(os.path.join(directory, "diag_journal.jsonl"), resume=False)
+        args.bundle_writer = DiagBundle(os.path.join(directory, "pulsar_diag_bundle.tar")) if args.bundle else None
+        args.admin_cache = AdminLookupCache()
+        watch_stats, watch_limits = run_stats, command_limits
+        run_stats = RunStats()
+        try:
+            set_collector("discovery")
+            # the events and the other kinds are only fetched for dumps, the pods are current already
+            try:
+                args.inventory = KubeInventory(args.namespace).fetch(kube_api_backend)
+                args.inventory.save(os.path.join(directory, "inventory"))
+            except Exception as e:
+                logger.error(f"Error fetching the namespace inventory of the dump, using the watched pods: {e}")
+                args.inventory = self.args.inventory
+            set_collector(None)
+            collect_kube(args)
+        except Exception as e:
+            logger.error(f"Error dumping a full collection to {directory}: {e}")
+        finally:
+            run_stats, command_limits = watch_stats, watch_limits
+        self.last_dump = time.monotonic()
+
+    def run(self):
+        logger = logging.getLogger("Watch")
+        try:
+            self.watcher.start()
+        except Exception as e:
+            logger.error(f"Error listing the pods of namespace {self.args.namespace}: {e}")
+            return 1
+        if hasattr(signal, "SIGUSR1"):
+            signal.signal(signal.SIGUSR1, self.request_dump)
+        signal.signal(signal.SIGTERM, self.request_stop)
+        signal.signal(signal.SIGINT, self.request_stop)
+        logger.info(f"Watching namespace {self.args.namespace}: a snapshot every {self.interval:.0f}s to {self.ring.directory}, kept for "
+            f"{self.args.watch_retention} up to {self.args.watch_max_bytes} bytes" + (f", send SIGUSR1 to process {os.getpid()} for a full dump" if hasattr(signal, "SIGUSR1") else ""))
+        end = time.monotonic() + self.args.watch_for.total_seconds() if self.args.watch_for else None
+        next_snapshot = time.monotonic()
+        try:
+            while not self.stop.is_set():
+                wake_at = next_snapshot if end is None else min(next_snapshot, end)
+                self.wake.wait(max(0, wake_at - time.monotonic()))
+                self.wake.clear()
+                if self.stop.is_set() or (end is not None and time.monotonic() >= end):
+                    break
+                if self.dump_requested.is_set():
+                    self.dump_requested.clear()
+                    self.dump("requested with SIGUSR1")
+                if time.monotonic() < next_snapshot:
+                    continue
+                crossed = self.snapshot()
+                # on a fixed schedule, snapshots that a slow one or a dump overran are skipped
+                next_snapshot += self.interval * max(1, math.ceil((time.monotonic() - next_snapshot) / self.interval))
+                if crossed:
+                    if self.last_dump is not None and time.monotonic() - self.last_dump < WATCH_DUMP_COOLDOWN_SECONDS:
+                        logger.info(f"Trigger crossed, no dump within {WATCH_DUMP_COOLDOWN_SECONDS}s of the previous one: {crossed}")
+                    else:
+                        self.dump(f"trigger crossed: {crossed}")
+        finally:
+            self.watcher.stop()
+            self.close_targets()
+        logger.info(f"Stopped watching, {len(self.ring.entries)} snapshots kept in {self.ring.directory}")
+        return 0
+
+ANALYSIS_INDEX_VERSION = 1
+ANALYSIS_MAX_SIGNATURES = 5000
+ANALYSIS_MESSAGE_CHARS = 300
+ANALYSIS_LEVELS = ("FATAL", "ERROR", "WARN")
+ANALYSIS_LOG_FILE = re.compile(r"\.(?:log|out|txt)(?:\.\d+)?(?:\.gz|\.zst)?$|\.tar(?:\.gz|\.zst)?$|\.tgz$")
+# log4j lines of the brokers, bookies and proxies ("2024-05-01T10:00:00,123+0000 [thread] INFO  logger - message")
+# and of zookeeper ("2024-05-01 10:00:00,123 [myid:1] - INFO  [main:QuorumPeer@123] - message")
+LOG_ENTRY = re.compile(r"^(?P<time>(?:\d{4}-\d{2}-\d{2}[T ])?\d{2}:\d{2}:\d{2}(?:[.,]\d{1,9})?)\S*\s+(?:\[[^\]]*\]\s+)?(?:-\s+)?"
+    r"(?P<level>TRACE|DEBUG|INFO|WARN|WARNING|ERROR|FATAL)\s+(?:\[(?P<thread>[^\]]*)\]\s+)?(?:(?P<logger>[\w$.]+)\s+-\s+)?(?P<message>.*)$")
+LOG_EXCEPTION = re.compile(r"^(?:Caused by: )?([\w$.]+(?:Exception|Error|Throwable))\b")
+# variable parts of messages, replaced so the same error from different topics, hosts or ledgers has one signature
+SIGNATURE_PATTERNS = [
+    (re.compile(r"(?:non-)?persistent://\S+"), "<topic>"),
+    (re.compile(r"\b[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\b", re.I), "<uuid>"),
+    (re.compile(r"\b\d{1,3}(?:\.\d{1,3}){3}(?::\d+)?\b"), "<ip>"),
+    (re.compile(r"\b0x[0-9a-f]+\b|\b[0-9a-f]{12,}\b", re.I), "<hex>"),
+    (re.compile(r"\d+"), "<n>"),
+]
+
+#Below class is a raw stream of `size` bytes of a file starting at its current position, for bundle entries
+class BoundedReader(io.RawIOBase):
+    def __init__(self, f, size):
+        self.f = f
+        self.remaining = size
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.f.read(min(len(buffer), self.remaining))
+        buffer[:len(data)] = data
+        self.remaining -= len(data)
+        return len(data)
+
+#Below function returns the decompressed stream of a .gz or .zst stream. zstd uses the zstandard package when it
+#is installed and the zstd binary otherwise
+def decompressed(stream, name):
+    if name.endswith((".gz", ".tgz")):
+        return gzip.GzipFile(fileobj=stream)
+    if name.endswith(".zst"):
+        try:
+            import zstandard
+            return zstandard.ZstdDecompressor().stream_reader(stream)
+        except ImportError:
+            process = subprocess.Popen(["zstd", "-dcq"], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+            threading.Thread(target=lambda: (shutil.copyfileobj(stream, process.stdin, BUNDLE_CHUNK_BYTES), process.stdin.close()), daemon=True).start()
+            return process.stdout
+    return stream
+
+#Below function returns the component and pod of a log file from its path under logs/ (logs/<component>/<pod>/...)
+def log_owner(name):
+    parts = name.replace(os.sep, "/").split("/")
+    # clusters/<context>/<namespace>/ of a multi-target run names the pod with its target
+    target = "/".join(parts[parts.index("clusters") + 1:parts.index("clusters") + 3]) + "/" if "clusters" in parts[:-3] else ""
+    if "logs" in parts:
+        parts = parts[parts.index("logs") + 1:]
+    if len(parts) >= 3:
+        return parts[0], target + parts[1]
+    return "standalone", target + "standalone"
+
+#Below function normalizes a message into the text of its signature
+def signature_text(message):
+    message = message[:ANALYSIS_MESSAGE_CHARS]
+    for pattern, replacement in SIGNATURE_PATTERNS:
+        message = pattern.sub(replacement, message)
+    return message
+
+#Below class indexes the log lines of one source: line and level counts and, per error signature (level, logger,
+#normalized message and exception), the count, first and last occurrence and counts per minute. Memory is bounded
+#by the number of signatures, at most ANALYSIS_MAX_SIGNATURES of them, the rest are counted as one
+class LogIndex:
+    def __init__(self, component, pod):
+        self.result = {"component": component, "pod": pod, "files": 0, "lines": 0, "entries": 0, "levels": {}, "signatures": {}, "errors": []}
+        self.entry = None
+
+    def finish_entry(self):
+        entry = self.entry
+        self.entry = None
+        if entry is None:
+            return
+        level, logger, message, exception, frame, time_text = entry
+        key = f"{level}|{logger}|{signature_text(message)}|{exception or ''}"
+        signatures = self.result["signatures"]
+        signature_id = hashlib.sha1(key.encode(errors="replace")).hexdigest()[:16]
+        if signature_id not in signatures and len(signatures) >= ANALYSIS_MAX_SIGNATURES:
+            signature_id = "overflow"
+        signature = signatures.get(signature_id)
+        if signature is None:
+            signature = signatures[signature_id] = {"level": level, "logger": logger, "signature": signature_text(message) if signature_id != "overflow" else "<other signatures>",
+                "exception": exception, "frame": frame, "example": message[:ANALYSIS_MESSAGE_CHARS], "count": 0, "first": None, "last": None, "minutes": {}}
+        signature["count"] += 1
+        if time_text:
+            stamp = time_text.replace(" ", "T").replace(",", ".")
+            if signature["first"] is None or stamp < signature["first"]:
+                signature["first"] = stamp
+            if signature["last"] is None or stamp > signature["last"]:
+                signature["last"] = stamp
+            minute = stamp[:16]
+            signature["minutes"][minute] = signature["minutes"].get(minute, 0) + 1
+
+    def add_lines(self, lines):
+        self.result["files"] += 1
+        levels = self.result["levels"]
+        for line in lines:
+            self.result["lines"] += 1
+            match = LOG_ENTRY.match(line)
+            if match:
+                self.finish_entry()
+                self.result["entries"] += 1
+                level = "WARN" if match.group("level") == "WARNING" else match.group("level")
+                levels[level] = levels.get(level, 0) + 1
+                if level in ANALYSIS_LEVELS:
+                    self.entry = [level, match.group("logger") or match.group("thread") or "-", match.group("message").rstrip(), None, None, match.group("time")]
+            elif self.entry is not None:
+                # exception and stack trace lines of the entry
+                stripped = line.strip()
+                if self.entry[3] is None:
+                    exception = LOG_EXCEPTION.match(stripped)
+                    if exception:
+                        self.entry[3] = exception.group(1)
+                elif self.entry[4] is None and stripped.startswith("at "):
+                    self.entry[4] = stripped[3:].split("(", 1)[0]
+        self.finish_entry()
+
+#Below function indexes one source in a worker process. A source is a log file, a tar of log files (the layout of
+#bundle entries) or an entry of a bundle tar, each possibly gz or zst compressed. Lines are streamed, never loaded
+def index_log_source(source):
+    key, path, name, offset, size = source
+    component, pod = log_owner(name)
+    index = LogIndex(component, pod)
+
+    def text_lines(stream):
+        return io.TextIOWrapper(io.BufferedReader(stream) if isinstance(stream, io.RawIOBase) else stream, encoding="utf-8", errors="replace")
+
+    def index_stream(stream, stream_name):
+        base = re.sub(r"\.(gz|zst)$", "", stream_name)
+        if base.endswith(".tar") or stream_name.endswith(".tgz"):
+            with tarfile.open(fileobj=decompressed(stream, stream_name), mode="r|") as tar:
+                for member in tar:
+                    if member.isfile() and ANALYSIS_LOG_FILE.search(member.name):
+                        # the stream is at the data of the member, the tar skips what is left of it
+                        index_stream(io.BufferedReader(BoundedReader(tar.fileobj, member.size)), member.name)
+            return
+        index.add_lines(text_lines(decompressed(stream, stream_name)))
+
+    try:
+        with open(path, "rb") as f:
+            if offset is None:
+                index_stream(f, name)
+            else:
+                f.seek(offset)
+                index_stream(io.BufferedReader(BoundedReader(f, size)), name)
+    except Exception as e:
+        index.finish_entry()
+        index.result["errors"].append(f"{name}: {e}")
+    return key, index.result
+
+#Below function lists the log sources of a diagnostics directory or bundle with the fingerprint that tells whether
+#they changed since they were indexed
+def analysis_sources(path):
+    sources = []
+    if os.path.isfile(path):
+        with tarfile.open(path) as tar:
+            for member in tar:
+                if member.isfile() and "/logs/" in f"/{member.name}" and ANALYSIS_LOG_FILE.search(member.name):
+                    sources.append(((f"bundle:{member.name}", path, member.name, member.offset_data, member.size), [member.size, member.mtime, member.offset_data]))
+        return sources
+    logs_dir = os.path.join(path, "logs")
+    for root, _, files in os.walk(logs_dir):
+        for file in sorted(files):
+            full_path = os.path.join(root, file)
+            name = os.path.relpath(full_path, path)
+            if ANALYSIS_LOG_FILE.search(file) and not file.startswith("gc"):
+                stat = os.stat(full_path)
+                sources.append(((name, full_path, name, None, None), [stat.st_size, stat.st_mtime_ns]))
+    return sources
+
+#Below function merges the per source results into signatures and pods, one source at a time
+def merge_log_indexes(index_dir, manifest):
+    pods = {}
+    signatures = {}
+    errors = []
+    for key, entry in sorted(manifest["sources"].items()):
+        with open(os.path.join(index_dir, entry["result"])) as f:
+            result = json.load(f)
+        errors.extend(result["errors"])
+        pod = pods.setdefault(result["pod"], {"component": result["component"], "files": 0, "lines": 0, "levels": {}})
+        pod["files"] += result["files"]
+        pod["lines"] += result["lines"]
+        for level, count in result["levels"].items():
+            pod["levels"][level] = pod["levels"].get(level, 0) + count
+        for signature_id, found in result["signatures"].items():
+            signature = signatures.get(signature_id)
+            if signature is None:
+                signature = signatures[signature_id] = dict(found, count=0, minutes={}, pods={}, first=None, last=None)
+            signature["count"] += found["count"]
+            signature["pods"][result["pod"]] = signature["pods"].get(result["pod"], 0) + found["count"]
+            for minute, count in found["minutes"].items():
+                signature["minutes"][minute] = signature["minutes"].get(minute, 0) + count
+            if found["first"] and (signature["first"] is None or found["first"] < signature["first"]):
+                signature["first"] = found["first"]
+            if found["last"] and (signature["last"] is None or found["last"] > signature["last"]):
+                signature["last"] = found["last"]
+    return pods, signatures, errors
+
+def write_analysis_report(path, source_path, pods, signatures, errors, top):
+    levels = {}
+    for pod in pods.values():
+        for level, count in pod["levels"].items():
+            levels[level] = levels.get(level, 0) + count
+    with open(path, "w") as f:
+        f.write(f"Pulsar log analysis of {source_path}\n")
+        f.write(f"{sum(pod['files'] for pod in pods.values())} files, {sum(pod['lines'] for pod in pods.values())} lines of {len(pods)} pods, "
+            f"{len(signatures)} error signatures; " + ", ".join(f"{level} {count}" for level, count in sorted(levels.items())) + "\n")
+        f.write(f"\n{'pod':<40} {'component':<12} {'files':>7} {'lines':>12} {'FATAL':>8} {'ERROR':>8} {'WARN':>8}\n")
+        for name, pod in sorted(pods.items()):
+            f.write(f"{name:<40} {pod['component']:<12} {pod['files']:>7} {pod['lines']:>12} "
+                + " ".join(f"{pod['levels'].get(level, 0):>8}" for level in ANALYSIS_LEVELS) + "\n")
+        f.write(f"\nTop {min(top, len(signatures))} error signatures\n")
+        for signature_id, signature in heapq.nlargest(top, signatures.items(), key=lambda item: item[1]["count"]):
+            peak = max(signature["minutes"].items(), key=lambda item: item[1], default=("-", 0))
+            f.write(f"\n{signature['count']:>9} {signature['level']:<5} {signature['logger']}  [{signature_id}]\n")
+            f.write(f"          {signature['signature']}\n")
+            if signature["exception"]:
+                f.write(f"          {signature['exception']}" + (f" at {signature['frame']}" if signature["frame"] else "") + "\n")
+            f.write(f"          first {signature['first'] or '-'}, last {signature['last'] or '-'}, peak {peak[1]} in minute {peak[0]}\n")
+            f.write("          pods: " + ", ".join(f"{pod} {count}" for pod, count in sorted(signature["pods"].items(), key=lambda item: -item[1])[:10]) + "\n")
+        if errors:
+            f.write("\nSources that could not be read completely\n")
+            for error in errors:
+                f.write(f"  {error}\n")
+
+#Below function is the analyze subcommand: it indexes the collected logs of a diagnostics directory (or of a
+#bundle tar) on a process pool, one source per task, and writes analysis/signatures.json (error signatures with
+#counts per pod and per minute and first/last occurrence) and analysis/report.txt. Each source is indexed once into
+#analysis/index/, a re-run only indexes new or changed sources and is served from the index when nothing changed
+def analyze_main(argv):
+    parser = argparse.ArgumentParser(prog="collect_diag.py analyze", description="Index and summarize the errors of collected Pulsar logs")
+    parser.add_argument("path", help="Diagnostics directory (pulsar_diag) or bundle (pulsar_diag_bundle.tar)")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count() or 2, help="Indexing processes (default: number of CPUs)")
+    parser.add_argument("--top", type=int, default=30, help="Error signatures in the report (default: 30)")
+    parser.add_argument("--index-dir", help="Where to keep the index and the report (default: <directory>/analysis)")
+    parser.add_argument("--rebuild", action="store_true", help="Index every source again")
+    parser.add_argument("-l", "--loglevel", default="INFO", help="Log level (default: INFO)")
+    args = parser.parse_args(argv)
+    setup_logging(args.loglevel)
+    logger = logging.getLogger("LogAnalyzer")
+    path = args.path
+    if os.path.isdir(path) and not os.path.isdir(os.path.join(path, "logs")) and os.path.isdir(os.path.join(path, "pulsar_diag")):
+        path = os.path.join(path, "pulsar_diag")
+    if not os.path.exists(path):
+        logger.error(f"{path} does not exist")
+        return 1
+    analysis_dir = args.index_dir or os.path.join(path if os.path.isdir(path) else os.path.dirname(os.path.abspath(path)), "analysis")
+    index_dir = os.path.join(analysis_dir, "index")
+    os.makedirs(index_dir, exist_ok=True)
+    manifest_path = os.path.join(analysis_dir, "index.json")
+    manifest = {"version": ANALYSIS_INDEX_VERSION, "sources": {}}
+    if os.path.exists(manifest_path) and not args.rebuild:
+        with open(manifest_path) as f:
+            previous = json.load(f)
+        if previous.get("version") == ANALYSIS_INDEX_VERSION:
+            manifest = previous
+    sources = analysis_sources(path)
+    bundle_path = os.path.join(path, "pulsar_diag_bundle.tar")
+    if not sources and os.path.isdir(path) and os.path.exists(bundle_path):
+        # collected with --bundle, the logs are only in the bundle
+        sources = analysis_sources(bundle_path)
+    keys = {source[0] for source, _ in sources}
+    stale = [key for key in manifest["sources"] if key not in keys]
+    for key in stale:
+        entry = manifest["sources"].pop(key)
+        with contextlib.suppress(OSError):
+            os.remove(os.path.join(index_dir, entry["result"]))
+    todo = [(source, fingerprint) for source, fingerprint in sources if manifest["sources"].get(source[0], {}).get("fingerprint") != fingerprint]
+    report_path = os.path.join(analysis_dir, "report.txt")
+    if not todo and not stale and os.path.exists(report_path):
+        logger.info(f"The {len(sources)} log sources did not change since they were indexed, report served from the index: {report_path}")
+        return 0
+    fingerprints = dict((source[0], fingerprint) for source, fingerprint in todo)
+    total_bytes = sum(fingerprint[0] for _, fingerprint in todo)
+    logger.info(f"Indexing {len(todo)} of {len(sources)} log sources ({total_bytes / 1e6:.1f} MB) with {args.workers} processes")
+    start = time.monotonic()
+    with ProcessPoolExecutor(max_workers=max(1, args.workers)) as executor:
+        # sources by size, largest first, so one big file does not finish the run alone
+        ordered = sorted((source for source, _ in todo), key=lambda source: -fingerprints[source[0]][0])
+        for key, result in executor.map(index_log_source, ordered):
+            result_name = hashlib.sha1(key.encode()).hexdigest()[:16] + ".json"
+            with open(os.path.join(index_dir, result_name), "w") as f:
+                json.dump(result, f, separators=(",", ":"))
+            manifest["sources"][key] = {"fingerprint": fingerprints[key], "result": result_name}
+            for error in result["errors"]:
+                logger.error(f"Error reading {error}")
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f)
+    pods, signatures, errors = merge_log_indexes(index_dir, manifest)
+    with open(os.path.join(analysis_dir, "signatures.json"), "w") as f:
+        json.dump(dict(sorted(signatures.items(), key=lambda item: -item[1]["count"])), f, separators=(",", ":"))
+    write_analysis_report(report_path, path, pods, signatures, errors, args.top)
+    logger.info(f"Indexed in {time.monotonic() - start:.1f}s: {len(signatures)} error signatures in {len(pods)} pods, report in {report_path}")
+    return 0
+
+#Below function runs the collectors of a kube run against the pods of args.inventory (or kubectl get pods)
+def collect_kube(args):
+    global command_limits
+    kube_pods = kubernetesPods(args.namespace, args.inventory)
+    kube_pods.get_pods()
+    #logging.debug(f"Pods information: {kube_pods.pods}")
+    kube_pods.get_pod_info()
+    logging.debug(f"Pods information: {kube_pods.pod_info}")
+    kube_pods.get_pod_status()
+    logging.debug(f"Pods information: {kube_pods.pod_status}")
+    #Finding proxy,broker,bookie,zookeeper and bastion pods
+
+    broker_pods = component_pods(args, kube_pods.pods, "broker")
+    logging.debug(f"Broker Pods: {broker_pods}")
+    proxy_pods = component_pods(args, kube_pods.pods, "proxy")
+    logging.debug(f"Proxy Pods: {proxy_pods}")
+    bookie_pods = component_pods(args, kube_pods.pods, "bookkeeper")
+    logging.debug(f"Found Bookie Pods: {bookie_pods}")
+    zookeeper_pods = component_pods(args, kube_pods.pods, "zookeeper")
+    logging.debug(f"Zookeeper Pods: {zookeeper_pods}")
+    bastion_pods = component_pods(args, kube_pods.pods, "bastion")
+    logging.debug(f"Bastion Pods: {bastion_pods}")
+    set_collector(None)
+
+    command_limits = CommandLimits(args.max_execs, args.max_streams_per_node, args.kube_qps, args.inventory.pod_nodes() if args.inventory else None)
+    scheduler = CollectorScheduler(args)
+    scheduler.add("logs", collect_logs, (args, broker_pods, proxy_pods, bookie_pods, zookeeper_pods))
+    scheduler.add("config", get_pulsar_config, (args, broker_pods, proxy_pods, bookie_pods, zookeeper_pods, bastion_pods))
+    scheduler.add("describe", describe_pods, (args, kube_pods.pods))
+    if args.topology:
+        scheduler.add("topology", collect_topology, (args, broker_pods, proxy_pods, bastion_pods))
+    # the tenants walk takes the lists and the retention from the lookups of the topology collector
+    scheduler.add("tenants", fetch_tenants_info, (args, broker_pods, proxy_pods, bastion_pods), after=("topology",) if args.topology else ())
+    if args.metrics_duration:
+        scheduler.add("metrics", collect_metrics, (args, broker_pods, proxy_pods, bookie_pods, zookeeper_pods))
+    if args.jvm_profile:
+        scheduler.add("jvm", collect_jvm_profile, (args, broker_pods, proxy_pods, bookie_pods, zookeeper_pods))
+    if args.bookie_diag:
+        # with --top-topics the ledgers of the hot topics are looked up, they are known once the tenants stage ran
+        scheduler.add("bookie", collect_bookie_diag, (args, bookie_pods), after=("tenants",) if args.top_topics else ())
+    if args.bundle_writer:
+        scheduler.add("bundle", finish_bundle, (args,), after=tuple(scheduler.tasks))
+    scheduler.run()
+    if args.manifest:
+        args.manifest.save(args.run_id)
+    write_run_report(args)
+    args.journal.close()
+    logging.info("Successfully collected pulsar cluster diagnostics")
+
+STANDALONE_LOG_DIRECTORIES = ("logs", "/var/log/pulsar")
+STANDALONE_CONF_FILES = re.compile(r"\.(?:conf|properties|ya?ml|xml|sh|json)$")
+STANDALONE_ADMIN_FILES = {"runtime-config.json": "/admin/v2/brokers/configuration/runtime",
+    "dynamic-config.json": "/admin/v2/brokers/configuration/values", "clusters.json": "/admin/v2/clusters"}
+
+#Below function returns the log directories of the standalone broker, relative ones under --pulsar-home
+def standalone_log_directories(args):
+    directories = [os.path.join(args.pulsar_home, directory) for directory in STANDALONE_LOG_DIRECTORIES]
+    return [directory for directory in dict.fromkeys(directories) if os.path.isdir(directory)]
+
+#Below function archives the standalone log files into the bundle. Files last written before the --since window
+#are skipped without being opened, rotated files already compressed are copied as is with zero_copy and the
+#others are compressed into <name>.gz entries
+def collect_standalone_logs(args):
+    logger = logging.getLogger("LogsCollector")
+    if unit_done(args, "logs:standalone"):
+        logger.info("Logs of the standalone broker were collected by the resumed run, skipping")
+        return
+    window_start = log_window_start(args)
+    host = socket.gethostname()
+    archived = skipped = copied = 0
+    try:
+        for directory in standalone_log_directories(args):
+            for root, _, names in os.walk(directory):
+                for name in sorted(names):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    if window_start and stat.st_mtime < window_start.timestamp():
+                        skipped += 1
+                        continue
+                    entry = f"logs/standalone/{host}/{os.path.relpath(path, os.path.dirname(directory))}"
+                    if name.endswith((".gz", ".zst")):
+                        copied += args.bundle_writer.add_local_file(path, entry)
+                    else:
+                        with open(path, "rb") as f:
+                            args.bundle_writer.add_stream(entry + ".gz", f, compress=True)
+                    archived += 1
+        record_unit(args, "logs:standalone")
+    except Exception as e:
+        record_unit(args, "logs:standalone", e)
+        logger.error(f"Failed to collect the standalone logs: {e}")
+        return
+    if not archived and not skipped:
+        logger.error(f"No log files found in {' or '.join(os.path.join(args.pulsar_home, directory) for directory in STANDALONE_LOG_DIRECTORIES)}")
+        return
+    logger.info(f"Archived {archived} log files ({copied} bytes of them copied as is) and skipped {skipped} outside the window")
+
+#Below function archives the conf directory of the standalone broker as is, and writes its runtime and dynamic
+#configuration from the admin REST API over one pooled connection
+def collect_standalone_config(args):
+    logger = logging.getLogger("ConfigCollector")
+    conf_dir = os.path.join(args.pulsar_home, "conf")
+    host = socket.gethostname()
+    files = 0
+    if not unit_done(args, "conf:standalone"):
+        try:
+            for root, _, names in os.walk(conf_dir):
+                for name in sorted(names):
+                    if STANDALONE_CONF_FILES.search(name):
+                        path = os.path.join(root, name)
+                        args.bundle_writer.add_local_file(path, f"conf/standalone/{host}/{os.path.relpath(path, conf_dir)}")
+                        files += 1
+            record_unit(args, "conf:standalone")
+        except Exception as e:
+            record_unit(args, "conf:standalone", e)
+            logger.error(f"Error archiving the config files of {conf_dir}: {e}")
+    output_dir = os.path.join(args.output_dir, "conf", "standalone", host)
+    os.makedirs(output_dir, exist_ok=True)
+    client = PulsarAdminRestClient(args.admin_url, token=read_admin_token(args.admin_token), concurrency=1)
+    try:
+        for name, path in STANDALONE_ADMIN_FILES.items():
+            try:
+                with open(os.path.join(output_dir, name), "w") as f:
+                    json.dump(client.get(path), f, indent=2)
+            except Exception as e:
+                logger.error(f"Error fetching {path} from {args.admin_url}: {e}")
+    finally:
+        client.close()
+    logger.info(f"Successfully collected {files} config files of {conf_dir} and the broker configuration from {args.admin_url}")
+
+#Below function runs the collectors of a standalone run on the local machine: logs and conf go straight into the
+#bundle, the admin walk, topology and metrics use the admin REST API at --admin-url (default localhost)
+def collect_standalone(args):
+    logging.getLogger("Standalone").info(f"Collecting the standalone broker at {args.admin_url} from {args.pulsar_home}")
+    scheduler = CollectorScheduler(args)
+    scheduler.add("logs", collect_logs, (args,))
+    scheduler.add("config", get_pulsar_config, (args,))
+    if args.topology:
+        scheduler.add("topology", collect_topology, (args,))
+    scheduler.add("tenants", fetch_tenants_info, (args,), after=("topology",) if args.topology else ())
+    if args.metrics_duration:
+        scheduler.add("metrics", collect_metrics, (args,))
+    scheduler.add("bundle", finish_bundle, (args,), after=tuple(scheduler.tasks))
+    scheduler.run()
+    if args.manifest:
+        args.manifest.save(args.run_id)
+    write_run_report(args)
+    args.journal.close()
+    logging.info("Successfully collected pulsar standalone diagnostics")
+
+#Below function sets up a run in args.output_dir: run id, run stats, manifest, journal and bundle writer
+def start_run(args):
+    global run_stats
+    args.run_id = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    run_stats = RunStats()
+    args.manifest = DiagManifest(os.path.join(args.output_dir, "diag_manifest.json")) if args.incremental else None
+    bundle_prefix = f"runs/{args.run_id}/" if args.incremental else ""
+    args.journal = DiagJournal(os.path.join(args.output_dir, "diag_journal.jsonl"), resume=args.resume)
+    if args.journal.resuming:
+        done, failed = args.journal.counts()
+        logging.getLogger("Resume").info(f"Resuming the previous run: {done} units finished, {failed} failed and will be retried")
+    args.bundle_writer = DiagBundle(os.path.join(args.output_dir, "pulsar_diag_bundle.tar"), bundle_prefix, append=args.journal.resuming) if args.bundle and not args.watch else None
+    args.admin_cache = AdminLookupCache()
+
+#Below function collects (or watches) one kube namespace in the context of the run and returns the exit code
+def run_kube(args):
+    global kube_api_backend, command_limits
+    logger = logging.getLogger("Namespace")
+    if args.namespace == "pulsar":
+        logger.info("Using default namespace as 'pulsar'")
+    else:
+        logger.info(f"Using namespace: {args.namespace}")
+
+    if args.kube_backend == "api":
+        try:
+            kube_api_backend = KubeApiBackend(args.namespace, pool_size=max(args.parallel * 2, 16), kubeconfig=args.kubeconfig, context=kube_context)
+            logger.info("Using the in-process Kubernetes API backend")
+        except ImportError:
+            logger.error("--kube-backend api needs the kubernetes package, install it with 'pip install kubernetes'. Falling back to kubectl")
+        except Exception as e:
+            logger.error(f"Error loading the Kubernetes configuration, falling back to kubectl: {e}")
+    set_collector("discovery")
+    args.inventory = None
+    if not args.no_inventory or kube_api_backend is not None:
+        try:
+            args.inventory = KubeInventory(args.namespace).fetch(kube_api_backend)
+            args.inventory.save(os.path.join(args.output_dir, "inventory"))
+        except Exception as e:
+            logger.error(f"Error fetching the namespace inventory, falling back to per pod lookups: {e}")
+            args.inventory = None
+    # the commands of a watch session run under the same limits as those of a collection
+    command_limits = CommandLimits(args.max_execs, args.max_streams_per_node, args.kube_qps, args.inventory.pod_nodes() if args.inventory else None)
+    if args.watch:
+        return WatchSession(args).run()
+    collect_kube(args)
+    return 0
+
+#Below function splits the comma separated values of a list option, which can also be repeated
+def parse_list_option(values):
+    return list(dict.fromkeys(item.strip() for value in values or [] for item in value.split(",") if item.strip()))
+
+#Below function returns the directory of a target of a multi-target run, clusters/<context>/<namespace>
+def target_directory(context, namespace):
+    return os.path.join("clusters", context or "current-context", namespace)
+
+#Below function runs in the worker process of a target: the kube collection of one namespace of one context into
+#its own directory, with the limits of the command line all to itself. It returns a summary for the parent
+def collect_target(args, context, namespace):
+    global kube_context
+    kube_context = context
+    label = f"{context}/{namespace}" if context else namespace
+    setup_logging(args.loglevel, label)
+    args.namespace = namespace
+    args.output_dir = os.path.join(args.output_dir, target_directory(context, namespace))
+    os.makedirs(args.output_dir, exist_ok=True)
+    start = time.monotonic()
+    try:
+        start_run(args)
+        exit_code = run_kube(args)
+        error = None
+    except Exception as e:
+        logging.getLogger("Targets").error(f"Error collecting {label}: {e}")
+        exit_code, error = 1, str(e)
+    return {"context": context, "namespace": namespace, "directory": target_directory(context, namespace), "exit_code": exit_code,
+        "error": error, "seconds": round(time.monotonic() - start, 3)}
+
+CLUSTER_INDEX_TOP = 20
+
+#Below function keeps the replication stats of a topic per remote cluster: backlog, rate out, delay and connection
+def topic_replication(stats):
+    replication = stats.get("replication") or {}
+    return {remote: {"backlog": int(link.get("replicationBacklog") or 0), "msgRateOut": float(link.get("msgRateOut") or 0),
+        "delaySeconds": link.get("replicationDelayInSeconds"), "connected": link.get("connected")}
+        for remote, link in replication.items() if isinstance(link, dict)}
+
+#Below function writes the cross-cluster index of a multi-target run from the JSONL reports of the targets: the
+#targets with their runtime in cluster_index.json, every topic with its rates, backlog and replication stats on
+#each target it was found on in cluster_topics.jsonl.gz, and a readable summary in cluster_index.txt
+def write_cluster_index(output_dir, results):
+    logger = logging.getLogger("ClusterIndex")
+    tenants = {}
+    topics = {}
+    for result in results:
+        label = result["directory"].split(os.sep, 1)[1].replace(os.sep, "/")
+        result["tenants"] = 0
+        result["topics"] = 0
+        path = os.path.join(output_dir, result["directory"], "tenants_namespaces_topics.jsonl")
+        if not os.path.exists(path):
+            continue
+        found = set()
+        with open(path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record.get("type") in ("tenant", "topic"):
+                    found.add(record["tenant"])
+                if record.get("type") == "topic" and isinstance(record.get("stats"), dict):
+                    summary = summarize_topic_stats(record["stats"])
+                    replication = topic_replication(record["stats"])
+                    if replication:
+                        summary["replication"] = replication
+                    topics.setdefault(record["topic"], {})[label] = summary
+                    result["topics"] += 1
+        for tenant in found:
+            tenants.setdefault(tenant, []).append(label)
+        result["tenants"] = len(found)
+    links = [(topic, label, remote, link) for topic, targets in topics.items() for label, summary in targets.items()
+        for remote, link in summary.get("replication", {}).items()]
+    with gzip.open(os.path.join(output_dir, "cluster_topics.jsonl.gz"), "wt") as f:
+        for topic in sorted(topics):
+            f.write(json.dumps({"topic": topic, "targets": topics[topic]}, separators=(",", ":")) + "\n")
+    with open(os.path.join(output_dir, "cluster_index.json"), "w") as f:
+        json.dump({"targets": results, "tenants": {tenant: sorted(labels) for tenant, labels in sorted(tenants.items())},
+            "topics": len(topics), "replicated_topics": len({link[0] for link in links}), "replication_links": len(links)}, f, indent=2)
+    with open(os.path.join(output_dir, "cluster_index.txt"), "w") as f:
+        f.write(f"Pulsar diagnostics of {len(results)} targets\n\n")
+        f.write(f"  {'target':<50} {'exit':>5} {'seconds':>9} {'tenants':>8} {'topics':>8}\n")
+        for result in results:
+            f.write(f"  {result['directory']:<50} {result['exit_code']:>5} {result['seconds'] or 0:>9.1f} {result['tenants']:>8} {result['topics']:>8}\n")
+        f.write(f"\nTenants ({len(tenants)})\n")
+        for tenant, labels in sorted(tenants.items()):
+            f.write(f"  {tenant:<40} {', '.join(sorted(labels))}\n")
+        spread = {}
+        for targets in topics.values():
+            spread[len(targets)] = spread.get(len(targets), 0) + 1
+        f.write(f"\nTopics ({len(topics)}) by the number of targets they were found on\n")
+        for count, number in sorted(spread.items()):
+            f.write(f"  {count} targets: {number} topics\n")
+        f.write(f"\nReplication: {len(links)} links of {len({link[0] for link in links})} topics\n")
+        disconnected = [link for link in links if link[3]["connected"] is False]
+        if disconnected:
+            f.write(f"  {len(disconnected)} disconnected links\n")
+        f.write(f"  {'backlog':>12} {'msg/s out':>12} {'delay s':>9} {'connected':>9}  topic (target -> remote)\n")
+        for topic, label, remote, link in heapq.nlargest(CLUSTER_INDEX_TOP, links, key=lambda link: (link[3]["connected"] is False, link[3]["backlog"])):
+            f.write(f"  {link['backlog']:>12} {link['msgRateOut']:>12.1f} {link['delaySeconds'] if link['delaySeconds'] is not None else '-':>9} "
+                f"{str(link['connected']):>9}  {topic} ({label} -> {remote})\n")
+    logger.info(f"Indexed {len(topics)} topics of {len(tenants)} tenants across {len(results)} targets ({len(links)} replication links) in cluster_index.txt")
+
+#Below function collects several contexts and namespaces at once: each target runs in a worker process of its own
+#(so its limits, backend and run stats are its own and the total time is that of the slowest target) into
+#clusters/<context>/<namespace>, then the cross-cluster index is written and, with --bundle, the bundles of the
+#targets are merged into one pulsar_diag_bundle.tar
+def collect_targets(args, targets):
+    logger = logging.getLogger("Targets")
+    if args.report_format == "text":
+        # the cross-cluster index is built from the JSONL reports
+        args.report_format = "both"
+    logger.info(f"Collecting {len(targets)} targets in parallel: " + ", ".join(f"{context}/{namespace}" if context else namespace for context, namespace in targets))
+    start = time.monotonic()
+    results = []
+    # spawned, the workers do not inherit the threads and locks of this process
+    with ProcessPoolExecutor(max_workers=len(targets), mp_context=multiprocessing.get_context("spawn")) as executor:
+        futures = {executor.submit(collect_target, args, context, namespace): (context, namespace) for context, namespace in targets}
+        for future in as_completed(futures):
+            context, namespace = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {"context": context, "namespace": namespace, "directory": target_directory(context, namespace), "exit_code": 1,
+                    "error": str(e), "seconds": None}
+            results.append(result)
+            logger.info(f"Finished {result['directory']} in {result['seconds']}s" + (f" with errors: {result['error']}" if result["error"] else ""))
+    results.sort(key=lambda result: result["directory"])
+    write_cluster_index(args.output_dir, results)
+    if args.bundle:
+        bundle = DiagBundle(os.path.join(args.output_dir, "pulsar_diag_bundle.tar"))
+        for result in results:
+            path = os.path.join(args.output_dir, result["directory"], "pulsar_diag_bundle.tar")
+            if os.path.exists(path):
+                bundle.add_archive(path, result["directory"].replace(os.sep, "/") + "/")
+                os.remove(path)
+        for name in ("cluster_index.json", "cluster_index.txt", "cluster_topics.jsonl.gz"):
+            bundle.add_file(os.path.join(args.output_dir, name), name)
+        bundle.close()
+        logger.info(f"Merged the bundles of {len(results)} targets into {bundle.path} ({os.path.getsize(bundle.path)} bytes)")
+    logger.info(f"Collected {len(results)} targets in {time.monotonic() - start:.1f}s, slowest {max((result['seconds'] or 0) for result in results):.1f}s")
+    return 0 if all(result["exit_code"] == 0 for result in results) else 1
+
 def main():
+    global kube_context, docker_sdk_backend, command_limits
     if len(sys.argv) == 1:
         usage()
         sys.exit(1)
+    if sys.argv[1] == "analyze":
+        sys.exit(analyze_main(sys.argv[2:]))
 
     parser = argparse.ArgumentParser(description="Collect logs from Pulsar deployments.")
     parser.add_argument("-t", "--type", required=True, choices=["docker", "kube", "standalone"], help="Deployment type")
-    parser.add_argument("-n", "--namespace", default="pulsar", help="Namespace of the Pulsar cluster (default: pulsar)")
+    parser.add_argument("-n", "--namespace", default="pulsar", help="Namespace of the Pulsar cluster, or a comma separated list of namespaces (default: pulsar)")
+    parser.add_argument("--context", action="append", help="Kube context to collect from, a comma separated list of contexts or repeated (default: the current context)")
     parser.add_argument("-o", "--output_dir", help="Output directory for logs (default: current directory)")
+    parser.add_argument("--pulsar-home", default=os.environ.get("PULSAR_HOME", "/pulsar"), help="Pulsar directory with logs/ and conf/ for the standalone type (default: $PULSAR_HOME or /pulsar)")
     parser.add_argument("-c", "--container", help="Container name to collect logs from")
     parser.add_argument("-l", "--loglevel", default="INFO", help="Log level (default: INFO)")
+    parser.add_argument("-p", "--parallel", type=int, default=8, help="Number of pods to collect from concurrently (default: 8)")
+    parser.add_argument("--component-parallel", type=parse_component_parallel, default="4", help="Max concurrent pods per component, a number or e.g. broker=4,bookie=2 (default: 4)")
+    parser.add_argument("--pod-timeout", type=int, default=900, help="Seconds allowed per pod before its collection is abandoned, 0 to disable (default: 900)")
+    parser.add_argument("--max-execs", type=int, default=16, help="Max concurrent exec and cp commands across all collectors, 0 for no limit (default: 16)")
+    parser.add_argument("--max-streams-per-node", type=int, default=6, help="Max concurrent logs, exec and cp streams to the pods of one node, 0 for no limit (default: 6)")
+    parser.add_argument("--kube-qps", type=float, default=20, help="Max kube commands started per second, 0 for no limit (default: 20)")
+    parser.add_argument("--bulk-admin", action="store_true", help="Fetch tenants, namespaces and topic stats through one exec session")
+    parser.add_argument("--bulk-admin-workers", type=int, default=4, help="Concurrent pulsar-admin calls inside the admin pod in bulk mode (default: 4)")
+    parser.add_argument("--top-topics", type=int, help="Only fetch stats and internal stats of the top N topics of each ranking, ranked from one broker-stats call per broker")
+    parser.add_argument("--top-topics-by", type=parse_hot_topic_rankings, default="rate,throughput,backlog,subscriptions", help="Rankings of --top-topics: rate, throughput, backlog, subscriptions (default: all)")
+    parser.add_argument("--topology", action="store_true", help="Also snapshot the namespace policies and the topic and partition layout to topology.json")
+    parser.add_argument("--admin-url", help="Fetch tenants info from the admin REST API at this url (e.g. http://localhost:8080), or 'port-forward' to forward to a broker pod")
+    parser.add_argument("--admin-token", help="Token for the admin REST API, inline or as file:/path")
+    parser.add_argument("--admin-concurrency", type=int, default=16, help="Concurrent admin REST requests (default: 16)")
+    window = parser.add_mutually_exclusive_group()
+    window.add_argument("--since", type=parse_duration, help="Only collect logs newer than this duration, e.g. 30m or 1h")
+    window.add_argument("--since-time", type=parse_since_time, help="Only collect logs after this RFC3339 time, e.g. 2024-05-01T10:00:00Z")
+    parser.add_argument("--max-bytes-per-pod", type=parse_size, help="Cap for each of the container log stream (its newest bytes) and the copied log files (the newest first) of a pod, e.g. 50M")
+    parser.add_argument("--incremental", action="store_true", help="Only fetch log bytes and files that changed since the previous run into the same output directory")
+    parser.add_argument("--resume", action="store_true", help="Continue an interrupted run in the same output directory, skipping the units it finished")
+    parser.add_argument("--report-format", choices=["text", "jsonl", "both"], default="text", help="Tenants report as text, newline-delimited JSON or both (default: text)")
+    parser.add_argument("--parquet", action="store_true", help="Also export the topic stats to topics.parquet (needs pyarrow)")
+    parser.add_argument("--kube-backend", choices=["kubectl", "api"], default="kubectl", help="Run kube lists, logs and execs through kubectl or in-process through the Kubernetes API (needs the kubernetes package)")
+    parser.add_argument("--docker-backend", choices=["sdk", "cli"], default="sdk", help="Run docker logs, exec and cp through the docker SDK in-process or through the docker CLI (default: sdk)")
+    parser.add_argument("--kubeconfig", help="Kubeconfig for the api backend (default: $KUBECONFIG, ~/.kube/config or the in-cluster service account)")
+    parser.add_argument("--no-inventory", action="store_true", help="Query kubectl per pod instead of fetching the namespace inventory in one list call")
+    parser.add_argument("--profile", action="store_true", help="Also write run_trace.json, a trace of every command of the run for chrome://tracing or Perfetto")
+    parser.add_argument("--jvm-profile", action="store_true", help="Take repeated thread dumps of the JVMs and aggregate them into collapsed stacks")
+    parser.add_argument("--jvm-components", type=parse_jvm_components, default="broker,bookie", help="Components to profile: broker, proxy, bookie, zookeeper (default: broker,bookie)")
+    parser.add_argument("--jvm-samples", type=int, default=10, help="Thread dumps per pod (default: 10)")
+    parser.add_argument("--jvm-interval", type=parse_duration, default="2s", help="Interval between thread dumps (default: 2s)")
+    parser.add_argument("--jvm-gc", action="store_true", help="Also capture the class histogram and the GC log tail of the profiled JVMs")
+    parser.add_argument("--bookie-diag", action="store_true", help="Probe the disks, state and ledgers of every bookie into bookies/")
+    parser.add_argument("--bookie-ledgers", type=int, default=100, help="Max ledgers whose metadata is fetched with --bookie-diag, 0 to skip (default: 100)")
+    parser.add_argument("--bookie-ledger-qps", type=float, default=10, help="Max ledger metadata requests per second to the bookie (default: 10)")
+    parser.add_argument("--metrics-duration", type=parse_duration, help="Sample the /metrics of every broker, bookie, proxy and zookeeper pod (or docker container) for this long, e.g. 5m")
+    parser.add_argument("--metrics-interval", type=parse_duration, default="15s", help="Interval between metric samples (default: 15s)")
+    parser.add_argument("--metrics-url", type=parse_metrics_url, action="append", help="Scrape this metrics url instead of the pods, as name=url, can be repeated")
+    parser.add_argument("--config-all-pods", action="store_true", help="Collect the config of every pod in parallel, each distinct file stored once, with a key level drift report")
+    parser.add_argument("--dedup-logs", action="store_true", help="Copy the regions of /pulsar/logs files that are already in the kubectl logs stream of a pod as references (listed in dedup.json)")
+    parser.add_argument("--watch", type=parse_duration, help="Keep running and take a snapshot of log tails, metrics and hot topics at this interval, e.g. 1m, with a full collection on a trigger or SIGUSR1")
+    parser.add_argument("--watch-retention", type=parse_duration, default="24h", help="Age after which watch snapshots are removed (default: 24h)")
+    parser.add_argument("--watch-max-bytes", type=parse_size, default="1G", help="Disk space of the watch snapshots, the oldest are removed beyond it (default: 1G)")
+    parser.add_argument("--watch-trigger", type=parse_watch_trigger, action="append", help="Take a full collection when a metric of a snapshot crosses this threshold, e.g. pulsar_storage_write_latency>100, can be repeated")
+    parser.add_argument("--watch-for", type=parse_duration, help="Stop watching after this long (default: until interrupted)")
+    parser.add_argument("--bundle", action="store_true", help="Stream logs and configs compressed into a single pulsar_diag_bundle.tar instead of copying directory trees")
+    parser.add_argument("--bundle-compression", choices=["gzip", "zstd"], default="gzip", help="In-pod compression for bundle entries, zstd needs zstd in the pods (default: gzip)")
     args = parser.parse_args()
+    namespaces = parse_list_option([args.namespace]) or ["pulsar"]
+    contexts = parse_list_option(args.context) or [None]
+    targets = [(context, namespace) for context in contexts for namespace in namespaces]
+    if args.watch and args.type != "kube":
+        parser.error("--watch needs -t kube")
+    if args.watch and len(targets) > 1:
+        parser.error("--watch takes a single context and namespace")
+    if args.type == "standalone" and (args.jvm_profile or args.bookie_diag):
+        parser.error("--jvm-profile and --bookie-diag need -t kube or -t docker")
+    if args.type == "standalone":
+        # the standalone collectors archive into the bundle and query the local broker over REST
+        args.bundle = True
+        args.admin_url = args.admin_url or BROKER_LOCAL_ADMIN_URL
     setup_logging(args.loglevel)
     check_type(args.type)
     args.output_dir = check_output_dir(args.output_dir)
+    if args.type == "kube" and len(targets) > 1:
+        sys.exit(collect_targets(args, targets))
+    if args.type == "kube":
+        args.namespace = namespaces[0]
+        kube_context = contexts[0]
+    start_run(args)
 
-    
     if args.type == "kube":
-        if args.namespace == "pulsar":
-            logger = logging.getLogger("Namespace")
-            logger.info("Using default namespace as 'pulsar'")
-        else:
-            logger = logging.getLogger("Namespace")
-            logger.info(f"Using namespace: {args.namespace}")
-
-        kube_pods = kubernetesPods(args.namespace)
-        kube_pods.get_pods()
-        #logging.debug(f"Pods information: {kube_pods.pods}")
-        kube_pods.get_pod_info()
-        logging.debug(f"Pods information: {kube_pods.pod_info}")
-        kube_pods.get_pod_status()
-        logging.debug(f"Pods information: {kube_pods.pod_status}")
-        #Finding proxy,broker,bookie,zookeeper and bastion pods
-
-        broker_pods = [pod[0] for pod in kube_pods.pods if "broker" in pod[0].lower() and "Running" in pod[1]]
-        logging.debug(f"Broker Pods: {broker_pods}")
-        proxy_pods = [pod[0] for pod in kube_pods.pods if "proxy" in pod[0].lower() and "Running" in pod[1]]
-        logging.debug(f"Proxy Pods: {proxy_pods}")
-        bookie_pods = [pod[0] for pod in kube_pods.pods if "bookkeeper" in pod[0].lower() and "Running" in pod[1]]
-        logging.debug(f"Found Bookie Pods: {bookie_pods}")
-        zookeeper_pods = [pod[0] for pod in kube_pods.pods if "zookeeper" in pod[0].lower() and "Running" in pod[1]]
-        logging.debug(f"Zookeeper Pods: {zookeeper_pods}")
-        bastion_pods = [pod[0] for pod in kube_pods.pods if "bastion" in pod[0].lower() and "Running" in pod[1]]
-        logging.debug(f"Bastion Pods: {bastion_pods}")
-        
-        
-        collect_logs(args, broker_pods, proxy_pods, bookie_pods, zookeeper_pods)
-        get_pulsar_config(args, broker_pods, proxy_pods, bookie_pods, zookeeper_pods, bastion_pods)
-        describe_pods(args, kube_pods.pods)
-        fetch_tenants_info(args, broker_pods,proxy_pods,bastion_pods)
-        logging.info("Successfully collected pulsar cluster diagnostics")
+        exit_code = run_kube(args)
+        if exit_code:
+            sys.exit(exit_code)
 
 
+    if args.type == "standalone":
+        collect_standalone(args)
+
     if args.type == "docker":
         logger = logging.getLogger("Docker")
-        client = docker.from_env()
+        # only loaded for docker runs, the SDK takes a while to import
+        try:
+            import docker
+        except ImportError:
+            logger.error("-t docker needs the docker SDK, install it with 'pip install docker'")
+            sys.exit(1)
+        # one client with a connection pool sized for the parallel collectors
+        client = docker.from_env(max_pool_size=max(args.parallel * 2, 16))
+        if args.docker_backend == "sdk":
+            docker_sdk_backend = DockerSdkBackend(client)
 
         try:
             container_name = None
@@ -594,9 +5850,9 @@ def main():
                     logger.error(f"Container '{args.container}' not found. Please check the name and try again.")
                     return container_name, container_id
             else:
-                # List all containers with "pulsar" in their name
-                containers = [container for container in client.containers.list(all=True) if "pulsar" in container.name]
-                standalone_containers = [container for container in client.containers.list(all=True) if "pulsar-standalone" in container.name]
+                # List all containers with "pulsar" in their name or image
+                containers = [container for container in client.containers.list(all=True) if is_pulsar_container(container)]
+                standalone_containers = [container for container in containers if "pulsar-standalone" in container.name]
                 logger.debug(f"Containers: {[container.name for container in containers]}")
                 logger.debug(f"Standalone Containers: {[container.name for container in standalone_containers]}")
 
@@ -606,8 +5862,10 @@ def main():
                     logger.error("You can provide a specific container name using the -c/--container argument.")
                     return container_name, container_id
 
-                containers = standalone_containers if standalone_containers else containers
-                container = containers[0]  # Select the first container
+                # A standalone container holds the whole cluster, otherwise every running container of a multi-node
+                # setup (docker-compose) is collected
+                containers = standalone_containers if standalone_containers else [container for container in containers if container.status == "running"] or containers
+                container = primary_container(containers)  # Runs the admin walk
                 container_name = container.name
                 container_id = container.id
                 logger.debug(f"Selected Container Name: {container_name} and Container ID: {container_id}")
@@ -616,9 +5874,30 @@ def main():
             logger.error(f"Unexpected error occurred while collecting container information: {e}")
             return container_name, container_id
 
-        collect_logs(args,container_name=container_name, container_id=container_id)
-        fetch_tenants_info(args, container_name=container_name, container_id=container_id)
-        get_pulsar_config(args, container_name=container_name, container_id=container_id)
+        members = [(container.name, container.id, container_component(container)) for container in containers] if len(containers) > 1 else None
+        if members:
+            logger.info(f"Collecting from {len(members)} containers: {', '.join(f'{name} ({component})' for name, _, component in members)}")
+        command_limits = CommandLimits(args.max_execs)
+        scheduler = CollectorScheduler(args)
+        scheduler.add("logs", collect_logs, (args,), {"container_name": container_name, "container_id": container_id, "containers": members})
+        if args.topology:
+            scheduler.add("topology", collect_topology, (args,), {"container_id": container_id})
+        scheduler.add("tenants", fetch_tenants_info, (args,), {"container_name": container_name, "container_id": container_id}, after=("topology",) if args.topology else ())
+        scheduler.add("config", get_pulsar_config, (args,), {"container_name": container_name, "container_id": container_id, "containers": members})
+        if args.metrics_duration:
+            scheduler.add("metrics", collect_metrics, (args,), {"containers": members})
+        if args.jvm_profile:
+            scheduler.add("jvm", collect_jvm_profile, (args,), {"container_name": container_name, "container_id": container_id, "containers": members})
+        if args.bookie_diag:
+            scheduler.add("bookie", collect_bookie_diag, (args,), {"container_name": container_name, "container_id": container_id, "containers": members},
+                after=("tenants",) if args.top_topics else ())
+        if args.bundle_writer:
+            scheduler.add("bundle", finish_bundle, (args,), after=tuple(scheduler.tasks))
+        scheduler.run()
+        if args.manifest:
+            args.manifest.save(args.run_id)
+        write_run_report(args)
+        args.journal.close()
         logging.info("Successfully collected pulsar cluster diagnostics from docker")
 
 if __name__ == "__main__":   